@@ -6,13 +6,27 @@ permitindo que ela atualize seu banco de conhecimento através da internet.
 
 import requests
 import json
+import argparse
+import gzip
+import hashlib
 import time
+import heapq
+import random
 import threading
 import os
+import re
+import itertools
+import queue
 import sqlite3
-from datetime import datetime
+import codecs
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
 import logging
 
+from transporte_http import get_transport
+
 # Configuração de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -25,24 +39,364 @@ logging.basicConfig(
 
 logger = logging.getLogger("NOVA_Updater")
 
+# Migrações do esquema, aplicadas em ordem a partir da versão registrada na
+# configuração "schema_version". Cada passo é um comando SQL ou uma função
+# que recebe o cursor. Novas migrações devem sempre ser adicionadas ao final.
+MIGRATIONS = [
+    (1, "Índices das consultas mais frequentes", [
+        # Apenas as atualizações pendentes entram no índice parcial
+        "CREATE INDEX IF NOT EXISTS idx_updates_pending ON updates (id) WHERE applied = 0",
+        "CREATE INDEX IF NOT EXISTS idx_data_sources_enabled ON data_sources (enabled)",
+        "CREATE INDEX IF NOT EXISTS idx_ai_communications_enabled ON ai_communications (enabled)",
+        "CREATE INDEX IF NOT EXISTS idx_knowledge_confidence ON knowledge (confidence DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_interactions_timestamp ON interactions (timestamp)"
+    ]),
+    (2, "Validadores HTTP (ETag / Last-Modified) das fontes de dados", [
+        "ALTER TABLE data_sources ADD COLUMN etag TEXT",
+        "ALTER TABLE data_sources ADD COLUMN last_modified TEXT"
+    ]),
+    (3, "Hash de conteúdo para deduplicação do conhecimento", [
+        "ALTER TABLE knowledge ADD COLUMN content_hash TEXT",
+        # Linhas antigas ficam com hash nulo até a compactação (compact_knowledge)
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_knowledge_content_hash ON knowledge (content_hash) "
+        "WHERE content_hash IS NOT NULL"
+    ]),
+    (4, "Cache persistente das respostas das IAs externas", [
+        # Horários em segundos desde a época, para comparar direto com time.time()
+        "CREATE TABLE IF NOT EXISTS ai_response_cache ("
+        "key TEXT PRIMARY KEY, service TEXT, model TEXT, response TEXT, "
+        "created_at REAL, expires_at REAL, last_access REAL)",
+        "CREATE INDEX IF NOT EXISTS idx_ai_response_cache_expires ON ai_response_cache (expires_at)",
+        "CREATE INDEX IF NOT EXISTS idx_ai_response_cache_last_access ON ai_response_cache (last_access)"
+    ]),
+    (5, "Falhas e próxima tentativa das atualizações pendentes", [
+        "ALTER TABLE updates ADD COLUMN attempts INTEGER DEFAULT 0",
+        # Segundos desde a época, como em ai_response_cache
+        "ALTER TABLE updates ADD COLUMN next_attempt REAL",
+        "ALTER TABLE updates ADD COLUMN last_error TEXT"
+    ]),
+    (6, "IDs do conhecimento nunca reaproveitados (AUTOINCREMENT)", [
+        # Sem AUTOINCREMENT, o SQLite reaproveita o maior ID apagado, que o
+        # índice vetorial (que indexa a partir do último ID visto) não veria.
+        # Os triggers do FTS são recriados por _initialize_fts; os rowids e,
+        # portanto, o índice FTS não mudam
+        "DROP TRIGGER IF EXISTS knowledge_fts_insert",
+        "DROP TRIGGER IF EXISTS knowledge_fts_delete",
+        "DROP TRIGGER IF EXISTS knowledge_fts_update",
+        "CREATE TABLE knowledge_new ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT, content TEXT, source TEXT, "
+        "timestamp DATETIME, confidence REAL DEFAULT 1.0, content_hash TEXT)",
+        "INSERT INTO knowledge_new (id, topic, content, source, timestamp, confidence, content_hash) "
+        "SELECT id, topic, content, source, timestamp, confidence, content_hash FROM knowledge",
+        "DROP TABLE knowledge",
+        "ALTER TABLE knowledge_new RENAME TO knowledge",
+        "CREATE INDEX IF NOT EXISTS idx_knowledge_confidence ON knowledge (confidence DESC)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_knowledge_content_hash ON knowledge (content_hash) "
+        "WHERE content_hash IS NOT NULL"
+    ]),
+]
+
+# Políticas de retenção aplicadas pelo Updater (Database.apply_retention). Cada
+# uma seleciona linhas de "knowledge" por prefixo do tópico, fonte, idade em
+# dias e confiança máxima (ou de "interactions" só por idade) e as arquiva
+# em arquivos compactados ("archive") ou apenas as apaga ("delete")
+RETENTION_POLICIES = [
+    {
+        "name": "colaboracoes_pouco_confiaveis",
+        "table": "knowledge",
+        "topic_prefix": "collaboration_",
+        "max_confidence": 0.8,
+        "max_age_days": 30,
+        "action": "archive"
+    },
+    {
+        "name": "noticias_antigas",
+        "table": "knowledge",
+        "topic_prefix": "news_",
+        "max_age_days": 30,
+        "action": "archive"
+    },
+    {
+        "name": "interacoes_antigas",
+        "table": "interactions",
+        "max_age_days": 365,
+        "action": "archive"
+    }
+]
+
+def iter_json_items(chunks):
+    """
+    Decodifica incrementalmente um payload JSON recebido em blocos de bytes
+    
+    Um array no nível superior tem seus elementos produzidos um a um; caso
+    contrário, o payload é tratado como uma sequência de valores separados
+    por espaço ou quebra de linha (NDJSON). Um valor isolado fora de um array,
+    como um objeto no nível superior, é um documento único e não uma lista de
+    itens, e não produz nada (o que inclui um NDJSON de uma única linha).
+    Apenas o item em decodificação e o bloco atual ficam em memória,
+    independentemente do tamanho do payload.
+    
+    Args:
+        chunks: Iterável de blocos de bytes (por exemplo, response.iter_content)
+        
+    Yields:
+        Cada item do array ou cada linha do NDJSON
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    pos = 0
+    eof = False
+    
+    def fill():
+        nonlocal buffer, pos, eof
+        # Descarta o que já foi consumido e acrescenta o próximo bloco
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            buffer = buffer[pos:] + utf8.decode(b"", final=True)
+        else:
+            buffer = buffer[pos:] + utf8.decode(chunk)
+        pos = 0
+        return not eof
+    
+    def next_char():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if eof or not fill():
+                return None
+    
+    in_array = next_char() == "["
+    if in_array:
+        pos += 1
+    
+    # Fora de um array, o primeiro valor fica retido até aparecer o segundo
+    first = None
+    count = 0
+    while True:
+        char = next_char()
+        if char is None:
+            if in_array:
+                raise ValueError("Array JSON incompleto")
+            return
+        
+        if in_array and char == "]":
+            return
+        if in_array and char == ",":
+            pos += 1
+            continue
+        
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # Um número no fim do bloco pode continuar no próximo
+                if end < len(buffer) or eof:
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+        
+        pos = end
+        count += 1
+        if in_array:
+            yield value
+        elif count == 1:
+            first = value
+        else:
+            if count == 2:
+                yield first
+            yield value
+
+class ConnectionManager:
+    """Gerencia uma conexão SQLite por thread com WAL e pragmas ajustados"""
+    
+    DEFAULT_PRAGMAS = {
+        "synchronous": "NORMAL",
+        "cache_size": -65536,  # 64 MB (valores negativos são em KiB)
+        "mmap_size": 268435456,  # 256 MB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000  # ms
+    }
+    
+    def __init__(self, db_path, pragmas=None):
+        """
+        Inicializa o gerenciador de conexões
+        
+        Args:
+            db_path: Caminho para o arquivo do banco de dados
+            pragmas: Pragmas que sobrescrevem DEFAULT_PRAGMAS (opcional)
+        """
+        self.db_path = db_path
+        self.pragmas = dict(self.DEFAULT_PRAGMAS)
+        self.pragmas.update(pragmas or {})
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {}
+        
+        conn = self.get_connection()
+        # O auto_vacuum fica gravado no arquivo e só pode ser escolhido em um
+        # banco vazio, antes do modo WAL; bancos antigos passam a usá-lo após
+        # um VACUUM (--compact --vacuum)
+        if not conn.execute("PRAGMA page_count").fetchone()[0]:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        
+        # O modo WAL é persistente no arquivo; basta ativá-lo uma vez.
+        # Com ele, leitores não esperam pelas escritas do Updater.
+        mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        if mode.lower() != "wal":
+            logger.warning(f"Não foi possível ativar o modo WAL (modo atual: {mode})")
+    
+    def _connect(self):
+        """
+        Abre e configura uma nova conexão
+        
+        Returns:
+            Conexão SQLite
+        """
+        # check_same_thread=False apenas para permitir que close_all feche
+        # conexões de outras threads; cada conexão é usada por uma só thread
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+    
+    def get_connection(self):
+        """
+        Retorna a conexão da thread atual, abrindo-a se necessário
+        
+        Returns:
+            Conexão SQLite exclusiva da thread atual
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.cursor = conn.cursor()
+            
+            with self._lock:
+                # Fecha conexões de threads que já terminaram
+                for thread in [t for t in self._connections if not t.is_alive()]:
+                    self._connections.pop(thread).close()
+                self._connections[threading.current_thread()] = conn
+            
+            logger.debug(f"Nova conexão aberta para a thread {threading.current_thread().name}")
+        return conn
+    
+    def get_cursor(self):
+        """
+        Retorna o cursor da thread atual
+        
+        Returns:
+            Cursor SQLite exclusivo da thread atual
+        """
+        self.get_connection()
+        return self._local.cursor
+    
+    def close_all(self):
+        """Fecha as conexões de todas as threads"""
+        with self._lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
 class Database:
     """Gerencia o banco de dados da IA NOVA"""
     
-    def __init__(self, db_path="data/nova.db"):
+    # Itens repetidos (mesmo hash de tópico/conteúdo) apenas renovam o
+    # timestamp e mantêm a maior confiança, em vez de gerar novas linhas
+    UPSERT_KNOWLEDGE_SQL = '''
+        INSERT INTO knowledge (topic, content, source, timestamp, confidence, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (content_hash) WHERE content_hash IS NOT NULL DO UPDATE SET
+            timestamp = excluded.timestamp,
+            confidence = MAX(knowledge.confidence, excluded.confidence)
+    '''
+    
+    # Colunas das fontes de dados, na ordem em que o Updater as desempacota;
+    # migrações futuras não mudam o formato das linhas
+    DATA_SOURCE_COLUMNS = "id, name, url, api_key, last_updated, update_frequency, enabled, etag, last_modified"
+    
+    def __init__(self, db_path="data/nova.db", pragmas=None):
         """
         Inicializa o banco de dados
         
         Args:
             db_path: Caminho para o arquivo do banco de dados
+            pragmas: Pragmas SQLite adicionais ou sobrescritos (opcional)
         """
         # Garante que o diretório existe
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         
         self.db_path = db_path
-        self.conn = sqlite3.connect(db_path)
-        self.cursor = self.conn.cursor()
+        self.fts_enabled = False
+        self._change_listeners = []
+        self._delete_listeners = []
+        self.connections = ConnectionManager(db_path, pragmas)
         self.initialize_db()
     
+    def add_change_listener(self, callback):
+        """
+        Registra uma função chamada quando linhas são adicionadas ou alteradas
+        
+        Args:
+            callback: Função que recebe (tabela, id da linha)
+        """
+        self._change_listeners.append(callback)
+    
+    def _notify_change(self, table, row_id):
+        """
+        Notifica os interessados sobre uma alteração
+        
+        Args:
+            table: Nome da tabela alterada
+            row_id: ID da linha alterada
+        """
+        for callback in list(self._change_listeners):
+            try:
+                callback(table, row_id)
+            except Exception as e:
+                logger.error(f"Erro ao notificar alteração em {table}: {e}")
+    
+    def add_delete_listener(self, callback):
+        """
+        Registra uma função chamada quando linhas são removidas
+        
+        Args:
+            callback: Função que recebe (tabela, lista de IDs removidos)
+        """
+        self._delete_listeners.append(callback)
+    
+    def _notify_delete(self, table, row_ids):
+        """
+        Notifica os interessados sobre linhas removidas
+        
+        Args:
+            table: Nome da tabela alterada
+            row_ids: IDs das linhas removidas
+        """
+        for callback in list(self._delete_listeners):
+            try:
+                callback(table, row_ids)
+            except Exception as e:
+                logger.error(f"Erro ao notificar remoção em {table}: {e}")
+    
+    @property
+    def conn(self):
+        """Conexão exclusiva da thread atual"""
+        return self.connections.get_connection()
+    
+    @property
+    def cursor(self):
+        """Cursor exclusivo da thread atual"""
+        return self.connections.get_cursor()
+    
     def initialize_db(self):
         """Inicializa as tabelas do banco de dados"""
         # Tabela de conhecimento
@@ -114,8 +468,112 @@ class Database:
         ''')
         
         self.conn.commit()
+        
+        # Evolui o esquema de bancos existentes
+        self._apply_migrations()
+        
+        # Índice de busca textual sobre o conhecimento
+        self._initialize_fts()
+        
         logger.info("Banco de dados inicializado com sucesso")
     
+    def get_schema_version(self):
+        """
+        Recupera a versão atual do esquema
+        
+        Returns:
+            Número da última migração aplicada
+        """
+        return int(self.get_setting("schema_version", "0"))
+    
+    def _apply_migrations(self):
+        """Aplica, em ordem, as migrações ainda não aplicadas"""
+        for version, description, steps in MIGRATIONS:
+            if version <= self.get_schema_version():
+                continue
+            
+            try:
+                # BEGIN IMMEDIATE impede que dois processos migrem ao mesmo tempo
+                self.cursor.execute("BEGIN IMMEDIATE")
+                self.cursor.execute("SELECT value FROM settings WHERE key = 'schema_version'")
+                result = self.cursor.fetchone()
+                if result and int(result[0]) >= version:
+                    self.conn.rollback()
+                    continue
+                
+                for step in steps:
+                    if callable(step):
+                        step(self.cursor)
+                    else:
+                        self.cursor.execute(step)
+                
+                self.cursor.execute(
+                    "INSERT OR REPLACE INTO settings (key, value, updated_at) VALUES (?, ?, ?)",
+                    ("schema_version", str(version), datetime.now())
+                )
+                self.conn.commit()
+                logger.info(f"Migração {version} aplicada: {description}")
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Erro ao aplicar migração {version}: {e}")
+                raise
+    
+    def _initialize_fts(self):
+        """
+        Cria o índice FTS5 sobre tópico e conteúdo do conhecimento
+        
+        O índice usa a própria tabela knowledge como conteúdo externo e é
+        mantido sincronizado por triggers. Na primeira criação em um banco
+        existente, as linhas já gravadas são indexadas uma única vez.
+        """
+        self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'knowledge_fts'"
+        )
+        already_indexed = self.cursor.fetchone() is not None
+        
+        try:
+            self.cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_fts USING fts5(
+                topic,
+                content,
+                content='knowledge',
+                content_rowid='id'
+            )
+            ''')
+        except sqlite3.OperationalError as e:
+            # SQLite compilado sem FTS5: mantém apenas a busca por substring
+            self.fts_enabled = False
+            logger.warning(f"FTS5 indisponível, usando busca por substring: {e}")
+            return
+        
+        # Triggers que mantêm o índice sincronizado com a tabela knowledge
+        self.cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS knowledge_fts_insert AFTER INSERT ON knowledge BEGIN
+            INSERT INTO knowledge_fts (rowid, topic, content) VALUES (new.id, new.topic, new.content);
+        END
+        ''')
+        self.cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS knowledge_fts_delete AFTER DELETE ON knowledge BEGIN
+            INSERT INTO knowledge_fts (knowledge_fts, rowid, topic, content)
+            VALUES ('delete', old.id, old.topic, old.content);
+        END
+        ''')
+        self.cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS knowledge_fts_update AFTER UPDATE OF topic, content ON knowledge BEGIN
+            INSERT INTO knowledge_fts (knowledge_fts, rowid, topic, content)
+            VALUES ('delete', old.id, old.topic, old.content);
+            INSERT INTO knowledge_fts (rowid, topic, content) VALUES (new.id, new.topic, new.content);
+        END
+        ''')
+        
+        if not already_indexed:
+            # Indexa uma única vez o conhecimento já existente
+            self.cursor.execute("INSERT INTO knowledge_fts (knowledge_fts) VALUES ('rebuild')")
+            logger.info("Índice de busca textual do conhecimento criado")
+        
+        self.conn.commit()
+        self.fts_enabled = True
+    
     def add_knowledge(self, topic, content, source, confidence=1.0):
         """
         Adiciona um novo item de conhecimento ao banco de dados
@@ -126,24 +584,365 @@ class Database:
             source: Fonte do conhecimento
             confidence: Nível de confiança (0.0 a 1.0)
         """
+        content_hash = self._content_hash(topic, content)
         self.cursor.execute(
-            "INSERT INTO knowledge (topic, content, source, timestamp, confidence) VALUES (?, ?, ?, ?, ?)",
-            (topic, content, source, datetime.now(), confidence)
+            self.UPSERT_KNOWLEDGE_SQL,
+            (topic, content, source, datetime.now(), confidence, content_hash)
         )
+        # Quando o upsert atualiza uma linha existente, lastrowid não é o ID dela
+        self.cursor.execute("SELECT id FROM knowledge WHERE content_hash = ?", (content_hash,))
+        row_id = self.cursor.fetchone()[0]
         self.conn.commit()
+        self._notify_change("knowledge", row_id)
         logger.debug(f"Conhecimento adicionado: {topic}")
     
-    def get_knowledge(self, topic=None, min_confidence=0.0):
+    def add_knowledge_many(self, items, source=None, chunk_size=1000, transactional=True):
+        """
+        Adiciona vários itens de conhecimento em uma única transação
+        
+        Os itens são gravados com executemany em blocos de chunk_size, de modo
+        que iteráveis grandes (inclusive geradores) não precisam ser
+        carregados inteiros na memória e há apenas um commit no final.
+        Itens já existentes são atualizados em vez de duplicados.
+        
+        Com transactional=False há um commit por bloco: um iterável que
+        depende da rede (modo streaming) não segura o bloqueio de escrita do
+        banco enquanto espera pelos próximos itens, e uma falha no meio
+        preserva os blocos já gravados.
+        
+        Args:
+            items: Iterável de dicionários com topic, content e, opcionalmente,
+                   source e confidence
+            source: Fonte padrão para itens sem "source" (opcional)
+            chunk_size: Número de linhas enviadas por chamada a executemany
+            transactional: Se True, grava todos os itens em uma única transação
+            
+        Returns:
+            Número de itens gravados (novos ou atualizados)
+        """
+        now = datetime.now()
+        rows = (
+            (
+                item.get("topic", ""),
+                item.get("content", ""),
+                item.get("source", source),
+                now,
+                item.get("confidence", 1.0),
+                self._content_hash(item.get("topic", ""), item.get("content", ""))
+            )
+            for item in items
+        )
+        
+        total = 0
+        try:
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                self.cursor.executemany(self.UPSERT_KNOWLEDGE_SQL, chunk)
+                if not transactional:
+                    self.conn.commit()
+                    self._notify_change("knowledge", None)
+                total += len(chunk)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        
+        if total and transactional:
+            # Vários IDs de uma vez: os interessados releem a partir do último que conhecem
+            self._notify_change("knowledge", None)
+        logger.debug(f"{total} itens de conhecimento adicionados")
+        return total
+    
+    @staticmethod
+    def _content_hash(topic, content):
+        """
+        Calcula o hash normalizado de um item de conhecimento
+        
+        Maiúsculas/minúsculas e espaços extras não diferenciam itens.
+        
+        Args:
+            topic: Tópico do conhecimento
+            content: Conteúdo do conhecimento
+            
+        Returns:
+            Hash SHA-1 em hexadecimal
+        """
+        normalized = "\x1f".join(
+            " ".join(str(value or "").lower().split()) for value in (topic, content)
+        )
+        return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+    
+    def compact_knowledge(self, batch_size=1000, vacuum=False):
+        """
+        Remove conhecimento duplicado de um banco existente, no próprio arquivo
+        
+        Calcula o hash das linhas gravadas antes da deduplicação e, quando já
+        existe uma linha com o mesmo hash, mescla as duas (maior confiança e
+        timestamp mais recente) e apaga a repetida. Trabalha em lotes, com um
+        commit por lote, para não bloquear outros escritores por muito tempo.
+        
+        Args:
+            batch_size: Número de linhas processadas por transação
+            vacuum: Se True, executa VACUUM no final para liberar espaço
+            
+        Returns:
+            Número de linhas duplicadas removidas
+        """
+        removed = 0
+        while True:
+            self.cursor.execute(
+                "SELECT id, topic, content, timestamp, confidence FROM knowledge "
+                "WHERE content_hash IS NULL LIMIT ?",
+                (batch_size,)
+            )
+            rows = self.cursor.fetchall()
+            if not rows:
+                break
+            
+            removed_ids = []
+            try:
+                for row_id, topic, content, timestamp, confidence in rows:
+                    content_hash = self._content_hash(topic, content)
+                    self.cursor.execute("SELECT id FROM knowledge WHERE content_hash = ?", (content_hash,))
+                    existing = self.cursor.fetchone()
+                    
+                    if existing:
+                        self.cursor.execute(
+                            "UPDATE knowledge SET confidence = MAX(confidence, ?), timestamp = MAX(timestamp, ?) "
+                            "WHERE id = ?",
+                            (confidence, timestamp, existing[0])
+                        )
+                        self.cursor.execute("DELETE FROM knowledge WHERE id = ?", (row_id,))
+                        removed_ids.append(row_id)
+                    else:
+                        self.cursor.execute(
+                            "UPDATE knowledge SET content_hash = ? WHERE id = ?",
+                            (content_hash, row_id)
+                        )
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            
+            if removed_ids:
+                removed += len(removed_ids)
+                self._notify_delete("knowledge", removed_ids)
+        
+        logger.info(f"Compactação concluída: {removed} itens de conhecimento duplicados removidos")
+        
+        if vacuum:
+            # O VACUUM também grava o modo de auto_vacuum em bancos antigos
+            self.cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.cursor.execute("VACUUM")
+            logger.info("VACUUM concluído")
+        
+        return removed
+    
+    def apply_retention(self, policies=None, archive_dir=None, batch_size=500, pause=0.05, time_budget=None,
+                        should_stop=None, vacuum_pages=256):
+        """
+        Aplica as políticas de retenção, arquivando ou apagando linhas antigas
+        
+        As linhas são percorridas em ordem de ID em lotes de batch_size, com
+        um commit e uma pausa por lote, para não bloquear outros escritores
+        por muito tempo. Linhas arquivadas são gravadas (com fsync) antes de
+        apagadas, em arquivos JSON Lines compactados com gzip, um por tabela e
+        mês (ver _archive_rows). Os IDs de conhecimento removidos são avisados
+        aos interessados (add_delete_listener), como o índice vetorial. No
+        final, as páginas liberadas voltam ao sistema com incremental_vacuum,
+        também em passos.
+        
+        Args:
+            policies: Lista de políticas (opcional, usa RETENTION_POLICIES)
+            archive_dir: Diretório dos arquivos de arquivamento (opcional,
+                         padrão: archive ao lado do banco)
+            batch_size: Número de linhas processadas por transação
+            pause: Pausa entre lotes em segundos
+            time_budget: Tempo máximo de execução em segundos (opcional); o que
+                         faltar fica para a próxima execução
+            should_stop: Função sem argumentos que interrompe o trabalho quando
+                         retorna True (opcional)
+            vacuum_pages: Número de páginas devolvidas por passo do incremental_vacuum
+        
+        Returns:
+            Dicionário com o número de linhas removidas por política
+        """
+        policies = RETENTION_POLICIES if policies is None else policies
+        archive_dir = archive_dir or os.path.join(os.path.dirname(self.db_path), "archive")
+        deadline = time.monotonic() + time_budget if time_budget else None
+        
+        def interrupted():
+            if should_stop is not None and should_stop():
+                return True
+            return deadline is not None and time.monotonic() >= deadline
+        
+        results = {}
+        for policy in policies:
+            table = policy.get("table")
+            name = policy.get("name") or f"{table}:{policy.get('topic_prefix', '*')}"
+            where, params = self._retention_filter(policy)
+            
+            removed = 0
+            last_id = 0
+            while not interrupted():
+                self.cursor.execute(
+                    f"SELECT * FROM {table} WHERE id > ? AND {where} ORDER BY id LIMIT ?",
+                    (last_id, *params, batch_size)
+                )
+                rows = self.cursor.fetchall()
+                if not rows:
+                    break
+                
+                if policy.get("action", "archive") == "archive":
+                    columns = [column[0] for column in self.cursor.description]
+                    self._archive_rows(archive_dir, table, name, columns, rows)
+                
+                ids = [row[0] for row in rows]
+                try:
+                    self.cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join('?' * len(ids))})", ids)
+                    self.conn.commit()
+                except Exception:
+                    self.conn.rollback()
+                    raise
+                
+                if table == "knowledge":
+                    self._notify_delete(table, ids)
+                removed += len(ids)
+                last_id = ids[-1]
+                time.sleep(pause)
+            
+            results[name] = removed
+            if removed:
+                logger.info(f"Retenção '{name}': {removed} linhas de {table} removidas")
+        
+        if any(results.values()):
+            self._incremental_vacuum(vacuum_pages, pause, interrupted)
+        return results
+    
+    @staticmethod
+    def _retention_filter(policy):
+        """
+        Monta a condição SQL de uma política de retenção
+        
+        Args:
+            policy: Política de retenção
+        
+        Returns:
+            Tupla (condição WHERE, parâmetros)
+        """
+        table = policy.get("table")
+        if table not in ("knowledge", "interactions"):
+            raise ValueError(f"Tabela sem suporte a retenção: {table}")
+        if policy.get("action", "archive") not in ("archive", "delete"):
+            raise ValueError(f"Ação de retenção desconhecida: {policy.get('action')}")
+        if table == "interactions" and any(key in policy for key in ("topic_prefix", "source", "max_confidence")):
+            raise ValueError("Interações só podem ser selecionadas pela idade")
+        
+        clauses, params = [], []
+        if "topic_prefix" in policy:
+            # substr em vez de LIKE: "_" é curinga no LIKE e aparece nos prefixos
+            clauses.append("substr(topic, 1, ?) = ?")
+            params.extend([len(policy["topic_prefix"]), policy["topic_prefix"]])
+        if "source" in policy:
+            clauses.append("source = ?")
+            params.append(policy["source"])
+        if "max_age_days" in policy:
+            clauses.append("timestamp < ?")
+            params.append(datetime.now() - timedelta(days=policy["max_age_days"]))
+        if "max_confidence" in policy:
+            clauses.append("confidence <= ?")
+            params.append(policy["max_confidence"])
+        
+        if not clauses:
+            # Uma política sem filtros apagaria a tabela inteira
+            raise ValueError("Política de retenção sem filtros")
+        return " AND ".join(clauses), params
+    
+    @staticmethod
+    def _archive_rows(archive_dir, table, policy_name, columns, rows):
+        """
+        Acrescenta linhas ao arquivo compactado do mês
+        
+        Cada lote vira um membro gzip do arquivo; gzip.open lê todos em sequência.
+        
+        As linhas são gravadas antes de apagadas do banco: se o DELETE falhar
+        depois da gravação, a próxima execução arquiva as mesmas linhas de
+        novo. Quem lê o arquivo deve ficar com um registro por ID da linha
+        (row["id"]), por exemplo o último.
+        
+        Args:
+            archive_dir: Diretório dos arquivos de arquivamento
+            table: Nome da tabela
+            policy_name: Nome da política que arquivou as linhas
+            columns: Nomes das colunas
+            rows: Linhas a serem arquivadas
+        """
+        os.makedirs(archive_dir, exist_ok=True)
+        now = datetime.now()
+        path = os.path.join(archive_dir, f"{table}-{now:%Y%m}.jsonl.gz")
+        
+        with open(path, "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="ab") as archive:
+                for row in rows:
+                    record = {"policy": policy_name, "archived_at": now.isoformat(), "row": dict(zip(columns, row))}
+                    archive.write((json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+            # As linhas só são apagadas depois de estarem no disco
+            raw.flush()
+            os.fsync(raw.fileno())
+    
+    def _incremental_vacuum(self, pages, pause, interrupted):
+        """
+        Devolve ao sistema as páginas livres do banco, em passos
+        
+        Args:
+            pages: Número de páginas devolvidas por passo
+            pause: Pausa entre passos em segundos
+            interrupted: Função sem argumentos que interrompe o trabalho quando retorna True
+        
+        Returns:
+            Número de páginas devolvidas
+        """
+        self.cursor.execute("PRAGMA auto_vacuum")
+        if self.cursor.fetchone()[0] != 2:
+            logger.info("auto_vacuum incremental desativado neste banco (criado antes dele); "
+                        "execute --compact --vacuum uma vez para ativá-lo")
+            return 0
+        
+        freed = 0
+        while not interrupted():
+            self.cursor.execute("PRAGMA freelist_count")
+            free_pages = self.cursor.fetchone()[0]
+            if not free_pages:
+                break
+            
+            self.cursor.execute(f"PRAGMA incremental_vacuum({int(pages)})")
+            self.cursor.fetchall()
+            freed += min(free_pages, pages)
+            time.sleep(pause)
+        
+        if freed:
+            logger.info(f"incremental_vacuum concluído: {freed} páginas devolvidas")
+        return freed
+    
+    def get_knowledge(self, topic=None, min_confidence=0.0, mode="substring", limit=None):
         """
         Recupera conhecimento do banco de dados
         
         Args:
             topic: Tópico a ser pesquisado (opcional)
             min_confidence: Confiança mínima (0.0 a 1.0)
+            mode: "substring" compara o tópico com LIKE; "fts" usa o índice
+                  de busca textual sobre tópico e conteúdo
+            limit: Número máximo de itens retornados (opcional)
             
         Returns:
             Lista de itens de conhecimento
         """
+        if topic and mode == "fts" and self.fts_enabled:
+            return self.search_knowledge(topic, min_confidence=min_confidence, limit=limit)
+        
         if topic:
             self.cursor.execute(
                 "SELECT * FROM knowledge WHERE topic LIKE ? AND confidence >= ? ORDER BY confidence DESC",
@@ -154,8 +953,130 @@ class Database:
                 "SELECT * FROM knowledge WHERE confidence >= ? ORDER BY confidence DESC",
                 (min_confidence,)
             )
+        if limit:
+            return self.cursor.fetchmany(limit)
         return self.cursor.fetchall()
     
+    def search_knowledge(self, query, min_confidence=0.0, limit=50):
+        """
+        Busca conhecimento pelo índice FTS5 sobre tópico e conteúdo
+        
+        Os resultados são ordenados pela relevância bm25 (com peso maior para
+        o tópico) ponderada pela confiança de cada item.
+        
+        Args:
+            query: Texto a ser pesquisado
+            min_confidence: Confiança mínima (0.0 a 1.0)
+            limit: Número máximo de itens retornados (None para todos)
+            
+        Returns:
+            Lista de itens de conhecimento, no mesmo formato de get_knowledge
+        """
+        match = self._fts_query(query)
+        if not match:
+            return []
+        
+        # bm25 é negativo (quanto menor, mais relevante), então multiplicar
+        # pela confiança favorece itens mais confiáveis
+        self.cursor.execute(
+            '''
+            SELECT k.* FROM knowledge_fts
+            JOIN knowledge k ON k.id = knowledge_fts.rowid
+            WHERE knowledge_fts MATCH ? AND k.confidence >= ?
+            ORDER BY bm25(knowledge_fts, 2.0, 1.0) * k.confidence
+            LIMIT ?
+            ''',
+            (match, min_confidence, limit if limit else -1)
+        )
+        return self.cursor.fetchall()
+    
+    def reserve_knowledge_ids(self, last_id):
+        """
+        Garante que novos itens de conhecimento recebam IDs maiores que last_id
+        
+        Quem acompanha o conhecimento pelo último ID visto (como o índice
+        vetorial) chama este método ao abrir: itens apagados antes da
+        migração para AUTOINCREMENT não deixam seus IDs serem reaproveitados.
+        
+        Args:
+            last_id: Maior ID já visto
+        """
+        self.cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'knowledge'")
+        result = self.cursor.fetchone()
+        if result is not None and result[0] >= last_id:
+            return
+        
+        try:
+            if result is None:
+                self.cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('knowledge', ?)", (last_id,))
+            else:
+                self.cursor.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'knowledge'", (last_id,))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+    
+    def get_knowledge_after(self, last_id, limit=1000):
+        """
+        Recupera itens de conhecimento com ID maior que last_id, em ordem de ID
+        
+        Usado para indexar incrementalmente as linhas novas.
+        
+        Args:
+            last_id: Último ID já processado (0 para começar do início)
+            limit: Número máximo de itens retornados
+            
+        Returns:
+            Lista de tuplas (id, topic, content)
+        """
+        self.cursor.execute(
+            "SELECT id, topic, content FROM knowledge WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, limit)
+        )
+        return self.cursor.fetchall()
+    
+    def get_knowledge_by_ids(self, ids, min_confidence=0.0):
+        """
+        Recupera itens de conhecimento pelos IDs
+        
+        Args:
+            ids: Lista de IDs
+            min_confidence: Confiança mínima (0.0 a 1.0)
+            
+        Returns:
+            Dicionário ID -> item (no formato de get_knowledge); IDs removidos
+            ou abaixo da confiança mínima ficam de fora
+        """
+        items = {}
+        ids = list(ids)
+        # Blocos abaixo do limite de parâmetros do SQLite
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            self.cursor.execute(
+                f"SELECT * FROM knowledge WHERE id IN ({', '.join('?' * len(chunk))}) AND confidence >= ?",
+                (*chunk, min_confidence)
+            )
+            for row in self.cursor.fetchall():
+                items[row[0]] = row
+        return items
+    
+    @staticmethod
+    def _fts_query(text):
+        """
+        Converte texto livre em uma consulta FTS5 segura
+        
+        Cada termo é colocado entre aspas para que caracteres especiais da
+        sintaxe do FTS5 não gerem erros; todos os termos precisam ocorrer.
+        
+        Args:
+            text: Texto livre
+            
+        Returns:
+            Expressão para o operador MATCH ou string vazia
+        """
+        terms = re.findall(r"\w+", text or "")
+        return " ".join(f'"{term}"' for term in terms)
+    
     def add_update(self, update_type, content):
         """
         Adiciona uma nova atualização ao banco de dados
@@ -171,16 +1092,46 @@ class Database:
         self.conn.commit()
         logger.info(f"Nova atualização adicionada: {update_type}")
     
-    def get_pending_updates(self):
+    def get_pending_updates(self, max_attempts=None):
         """
         Recupera atualizações pendentes
         
+        Atualizações que falharam só voltam depois do horário da próxima tentativa.
+        
+        Args:
+            max_attempts: Número de falhas a partir do qual uma atualização é
+                          abandonada (opcional, sem limite por padrão)
+            
         Returns:
-            Lista de atualizações pendentes
+            Lista de atualizações pendentes (id, update_type, content, applied,
+            timestamp, attempts)
         """
-        self.cursor.execute("SELECT * FROM updates WHERE applied = 0")
+        query = (
+            "SELECT id, update_type, content, applied, timestamp, attempts FROM updates "
+            "WHERE applied = 0 AND (next_attempt IS NULL OR next_attempt <= ?)"
+        )
+        params = [time.time()]
+        if max_attempts is not None:
+            query += " AND attempts < ?"
+            params.append(max_attempts)
+        self.cursor.execute(query, params)
         return self.cursor.fetchall()
     
+    def record_update_failure(self, update_id, error, retry_delay):
+        """
+        Registra a falha de uma atualização e adia a próxima tentativa
+        
+        Args:
+            update_id: ID da atualização
+            error: Erro ocorrido
+            retry_delay: Segundos até a próxima tentativa
+        """
+        self.cursor.execute(
+            "UPDATE updates SET attempts = attempts + 1, next_attempt = ?, last_error = ? WHERE id = ?",
+            (time.time() + retry_delay, str(error), update_id)
+        )
+        self.conn.commit()
+    
     def mark_update_applied(self, update_id):
         """
         Marca uma atualização como aplicada
@@ -206,6 +1157,113 @@ class Database:
         )
         self.conn.commit()
     
+    def get_recent_interactions(self, limit=50):
+        """
+        Recupera as interações mais recentes
+        
+        Args:
+            limit: Número máximo de interações
+            
+        Returns:
+            Lista de interações, da mais recente para a mais antiga
+        """
+        self.cursor.execute(
+            "SELECT * FROM interactions ORDER BY timestamp DESC LIMIT ?",
+            (limit,)
+        )
+        return self.cursor.fetchall()
+    
+    def get_cached_response(self, key, now=None):
+        """
+        Recupera uma resposta do cache persistente
+        
+        Args:
+            key: Chave de cache
+            now: Horário atual em segundos desde a época (opcional)
+            
+        Returns:
+            Tupla (resposta, expira_em) ou None se ausente ou expirada
+        """
+        now = now or time.time()
+        self.cursor.execute(
+            "SELECT response, expires_at FROM ai_response_cache WHERE key = ? AND expires_at > ?",
+            (key, now)
+        )
+        result = self.cursor.fetchone()
+        if result is None:
+            return None
+        # O acesso é gravado depois, em lote (touch_cached_responses)
+        return result[0], result[1]
+    
+    def set_cached_response(self, key, service, model, response, expires_at):
+        """
+        Grava uma resposta no cache persistente
+        
+        Args:
+            key: Chave de cache
+            service: Nome do serviço
+            model: Nome do modelo
+            response: Resposta da IA
+            expires_at: Horário de expiração em segundos desde a época
+        """
+        now = time.time()
+        try:
+            self.cursor.execute(
+                "INSERT OR REPLACE INTO ai_response_cache "
+                "(key, service, model, response, created_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, service, model, response, now, expires_at, now)
+            )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+    
+    def touch_cached_responses(self, accesses):
+        """
+        Grava o último acesso de respostas do cache persistente
+        
+        Args:
+            accesses: Iterável de pares (chave, horário do acesso)
+        """
+        try:
+            self.cursor.executemany(
+                "UPDATE ai_response_cache SET last_access = max(last_access, ?) WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in accesses]
+            )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+    
+    def prune_response_cache(self, max_entries):
+        """
+        Remove respostas expiradas e as menos usadas além do limite
+        
+        Args:
+            max_entries: Número máximo de respostas mantidas
+            
+        Returns:
+            Número de respostas removidas
+        """
+        try:
+            self.cursor.execute("DELETE FROM ai_response_cache WHERE expires_at <= ?", (time.time(),))
+            removed = self.cursor.rowcount
+            self.cursor.execute(
+                "DELETE FROM ai_response_cache WHERE key IN ("
+                "SELECT key FROM ai_response_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (max_entries,)
+            )
+            removed += self.cursor.rowcount
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        
+        if removed:
+            logger.debug(f"{removed} respostas removidas do cache")
+        return removed
+    
     def add_data_source(self, name, url, api_key="", update_frequency=3600):
         """
         Adiciona uma nova fonte de dados
@@ -222,135 +1280,558 @@ class Database:
         )
         self.conn.commit()
         logger.info(f"Nova fonte de dados adicionada: {name}")
+        self._notify_change("data_sources", self.cursor.lastrowid)
+    
+    def get_data_sources(self, enabled_only=True):
+        """
+        Recupera fontes de dados
+        
+        Args:
+            enabled_only: Se True, retorna apenas fontes habilitadas
+            
+        Returns:
+            Lista de fontes de dados
+        """
+        if enabled_only:
+            self.cursor.execute(f"SELECT {self.DATA_SOURCE_COLUMNS} FROM data_sources WHERE enabled = 1")
+        else:
+            self.cursor.execute(f"SELECT {self.DATA_SOURCE_COLUMNS} FROM data_sources")
+        return self.cursor.fetchall()
+    
+    def get_data_source(self, source_id):
+        """
+        Recupera uma fonte de dados pelo ID
+        
+        Args:
+            source_id: ID da fonte de dados
+            
+        Returns:
+            Fonte de dados ou None se não existir
+        """
+        self.cursor.execute(f"SELECT {self.DATA_SOURCE_COLUMNS} FROM data_sources WHERE id = ?", (source_id,))
+        return self.cursor.fetchone()
+    
+    def update_data_source_validators(self, source_id, etag, last_modified):
+        """
+        Atualiza os validadores HTTP de uma fonte de dados
+        
+        Args:
+            source_id: ID da fonte de dados
+            etag: Valor do cabeçalho ETag (ou None)
+            last_modified: Valor do cabeçalho Last-Modified (ou None)
+        """
+        self.cursor.execute(
+            "UPDATE data_sources SET etag = ?, last_modified = ? WHERE id = ?",
+            (etag, last_modified, source_id)
+        )
+        self.conn.commit()
+    
+    def update_data_source_timestamp(self, source_id):
+        """
+        Atualiza o timestamp da última atualização de uma fonte de dados
+        
+        Args:
+            source_id: ID da fonte de dados
+        """
+        self.cursor.execute(
+            "UPDATE data_sources SET last_updated = ? WHERE id = ?",
+            (datetime.now(), source_id)
+        )
+        self.conn.commit()
+    
+    def add_ai_communication(self, ai_name, api_endpoint, api_key=""):
+        """
+        Adiciona uma nova comunicação com IA
+        
+        Args:
+            ai_name: Nome da IA
+            api_endpoint: Endpoint da API
+            api_key: Chave de API (opcional)
+        """
+        self.cursor.execute(
+            "INSERT INTO ai_communications (ai_name, api_endpoint, api_key, last_communication) VALUES (?, ?, ?, ?)",
+            (ai_name, api_endpoint, api_key, datetime.now())
+        )
+        self.conn.commit()
+        logger.info(f"Nova comunicação com IA adicionada: {ai_name}")
+    
+    def get_ai_communications(self, enabled_only=True):
+        """
+        Recupera comunicações com IAs
+        
+        Args:
+            enabled_only: Se True, retorna apenas comunicações habilitadas
+            
+        Returns:
+            Lista de comunicações com IAs
+        """
+        if enabled_only:
+            self.cursor.execute("SELECT * FROM ai_communications WHERE enabled = 1")
+        else:
+            self.cursor.execute("SELECT * FROM ai_communications")
+        return self.cursor.fetchall()
+    
+    def update_ai_communication_timestamp(self, comm_id):
+        """
+        Atualiza o timestamp da última comunicação com uma IA
+        
+        Args:
+            comm_id: ID da comunicação
+        """
+        self.cursor.execute(
+            "UPDATE ai_communications SET last_communication = ? WHERE id = ?",
+            (datetime.now(), comm_id)
+        )
+        self.conn.commit()
+    
+    def get_setting(self, key, default=None):
+        """
+        Recupera uma configuração
+        
+        Args:
+            key: Chave da configuração
+            default: Valor padrão se a configuração não existir
+            
+        Returns:
+            Valor da configuração
+        """
+        self.cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
+        result = self.cursor.fetchone()
+        return result[0] if result else default
+    
+    def set_setting(self, key, value):
+        """
+        Define uma configuração
+        
+        Args:
+            key: Chave da configuração
+            value: Valor da configuração
+        """
+        self.cursor.execute(
+            "INSERT OR REPLACE INTO settings (key, value, updated_at) VALUES (?, ?, ?)",
+            (key, value, datetime.now())
+        )
+        self.conn.commit()
+    
+    def close(self):
+        """Fecha as conexões com o banco de dados"""
+        self.connections.close_all()
+        logger.debug("Conexões com o banco de dados fechadas")
+
+
+class ResumableDownloader:
+    """Download retomável, paralelo e verificado de arquivos grandes"""
+    
+    def __init__(self, segments=4, min_segment_size=16 * 1024 * 1024, chunk_size=1024 * 1024,
+                 buffer_size=8 * 1024 * 1024, timeout=(10, 60), max_retries=5, progress_interval=5,
+                 transport=None):
+        """
+        Inicializa o downloader
+        
+        Args:
+            segments: Número máximo de segmentos baixados em paralelo
+            min_segment_size: Tamanho mínimo de cada segmento em bytes
+            chunk_size: Tamanho dos blocos lidos da rede em bytes
+            buffer_size: Tamanho do buffer de escrita em disco em bytes
+            timeout: Timeout (conexão, leitura) de cada requisição em segundos
+            max_retries: Tentativas por segmento antes de desistir
+            progress_interval: Intervalo entre relatórios de progresso em segundos
+            transport: Transporte HTTP (opcional, usa o compartilhado por padrão)
+        """
+        self.http = transport or get_transport()
+        self.segments = max(1, segments)
+        self.min_segment_size = min_segment_size
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+    
+    def download(self, url, dest_path, sha256=None, expected_size=None, headers=None):
+        """
+        Baixa uma URL para dest_path
+        
+        O conteúdo é gravado em dest_path + ".part" e o progresso de cada
+        segmento em dest_path + ".part.json", o que permite retomar um
+        download interrompido com requisições Range. Só depois de verificado
+        o checksum o arquivo temporário é renomeado atomicamente.
+        
+        Args:
+            url: URL do arquivo
+            dest_path: Caminho final do arquivo
+            sha256: Checksum SHA-256 esperado em hexadecimal (opcional)
+            expected_size: Tamanho esperado em bytes (opcional)
+            headers: Cabeçalhos adicionais das requisições (opcional)
+            
+        Returns:
+            Dicionário com size, seconds e throughput (bytes/s) do download
+        """
+        headers = dict(headers or {})
+        part_path = dest_path + ".part"
+        state_path = part_path + ".json"
+        
+        size, accepts_ranges, etag = self._probe(url, headers)
+        if expected_size is not None and size is not None and size != expected_size:
+            raise ValueError(f"Tamanho inesperado: {size} bytes (esperado {expected_size})")
+        
+        state = self._load_state(state_path, part_path, url, size, etag)
+        if state is None:
+            state = self._new_state(url, size, etag, accepts_ranges)
+            # Pré-aloca o arquivo para que os segmentos possam ser gravados em paralelo
+            with open(part_path, "wb") as f:
+                if size:
+                    f.truncate(size)
+        else:
+            logger.info(f"Retomando download de {url}")
+        
+        progress = {
+            "lock": threading.Lock(),
+            "state": state,
+            "state_path": state_path,
+            "start": time.monotonic(),
+            "initial": sum(segment[2] for segment in state["segments"]),
+            "last_report": time.monotonic(),
+            "last_saved": time.monotonic()
+        }
+        
+        pending = [i for i, (start, end, done) in enumerate(state["segments"])
+                   if end is None or start + done <= end]
+        try:
+            if len(pending) > 1:
+                with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="nova_download") as executor:
+                    futures = [executor.submit(self._download_segment, url, headers, part_path, i, progress)
+                               for i in pending]
+                for future in futures:
+                    future.result()
+            elif pending:
+                self._download_segment(url, headers, part_path, pending[0], progress)
+        finally:
+            # Mesmo em caso de falha, registra o que já foi gravado para retomar depois
+            self._save_state(progress, force=True)
+        
+        # O arquivo é pré-alocado, então o tamanho dele não indica o que foi baixado
+        incomplete = [i for i, (start, end, done) in enumerate(state["segments"])
+                      if end is None or start + done <= end]
+        if incomplete:
+            raise IOError(f"Download incompleto: segmentos {incomplete} não terminaram")
+        downloaded = os.path.getsize(part_path)
+        
+        if sha256 and self._sha256(part_path) != sha256.lower():
+            # Um arquivo corrompido não deve ser retomado
+            os.remove(part_path)
+            os.remove(state_path)
+            raise ValueError(f"Checksum SHA-256 inválido para {url}")
+        
+        os.replace(part_path, dest_path)
+        os.remove(state_path)
+        
+        seconds = time.monotonic() - progress["start"]
+        transferred = downloaded - progress["initial"]
+        throughput = transferred / seconds if seconds > 0 else 0.0
+        logger.info(
+            f"Download concluído: {dest_path} ({downloaded / 1048576:.1f} MB, "
+            f"{throughput / 1048576:.1f} MB/s)"
+        )
+        return {"size": downloaded, "seconds": seconds, "throughput": throughput}
+    
+    def _probe(self, url, headers):
+        """
+        Consulta tamanho, suporte a Range e ETag do arquivo remoto
+        
+        Args:
+            url: URL do arquivo
+            headers: Cabeçalhos das requisições
+            
+        Returns:
+            Tupla (tamanho ou None, aceita Range, ETag ou None)
+        """
+        response = self.http.head(url, headers=headers, timeout=self.timeout, allow_redirects=True)
+        if response.status_code != 200:
+            return None, False, None
+        
+        length = response.headers.get("Content-Length")
+        size = int(length) if length and length.isdigit() else None
+        accepts_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+        return size, accepts_ranges and size is not None, response.headers.get("ETag")
     
-    def get_data_sources(self, enabled_only=True):
+    def _new_state(self, url, size, etag, accepts_ranges):
         """
-        Recupera fontes de dados
+        Divide o arquivo em segmentos [início, fim, bytes baixados]
         
         Args:
-            enabled_only: Se True, retorna apenas fontes habilitadas
+            url: URL do arquivo
+            size: Tamanho do arquivo (ou None se desconhecido)
+            etag: ETag do arquivo (ou None)
+            accepts_ranges: Se o servidor aceita requisições Range
             
         Returns:
-            Lista de fontes de dados
+            Estado inicial do download
         """
-        if enabled_only:
-            self.cursor.execute("SELECT * FROM data_sources WHERE enabled = 1")
+        if size == 0:
+            # Arquivo vazio: não há segmentos a baixar
+            segments = []
+        elif not accepts_ranges:
+            # Sem Range não há como paralelizar; fim None indica tamanho desconhecido
+            segments = [[0, size - 1 if size else None, 0]]
         else:
-            self.cursor.execute("SELECT * FROM data_sources")
-        return self.cursor.fetchall()
+            count = max(1, min(self.segments, size // self.min_segment_size))
+            step = -(-size // count)
+            segments = [[start, min(start + step, size) - 1, 0] for start in range(0, size, step)]
+        
+        return {"url": url, "size": size, "etag": etag, "ranges": accepts_ranges, "segments": segments}
     
-    def update_data_source_timestamp(self, source_id):
+    def _load_state(self, state_path, part_path, url, size, etag):
         """
-        Atualiza o timestamp da última atualização de uma fonte de dados
+        Carrega o estado de um download anterior, se ainda for válido
         
         Args:
-            source_id: ID da fonte de dados
+            state_path: Caminho do arquivo de estado
+            part_path: Caminho do arquivo temporário
+            url: URL do arquivo
+            size: Tamanho atual do arquivo remoto
+            etag: ETag atual do arquivo remoto
+            
+        Returns:
+            Estado anterior ou None se o download precisar recomeçar
         """
-        self.cursor.execute(
-            "UPDATE data_sources SET last_updated = ? WHERE id = ?",
-            (datetime.now(), source_id)
-        )
-        self.conn.commit()
+        if not (os.path.exists(state_path) and os.path.exists(part_path)):
+            return None
+        
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        # O arquivo remoto mudou ou o servidor não permite retomar
+        if state.get("url") != url or state.get("size") != size or state.get("etag") != etag:
+            return None
+        if not state.get("ranges"):
+            return None
+        return state
     
-    def add_ai_communication(self, ai_name, api_endpoint, api_key=""):
+    def _save_state(self, progress, force=False):
         """
-        Adiciona uma nova comunicação com IA
+        Grava o progresso dos segmentos (no máximo uma vez por segundo)
+        
+        O progresso de cada segmento só avança depois que os dados foram
+        descarregados no arquivo temporário, então o estado gravado nunca
+        aponta além do que está no disco.
         
         Args:
-            ai_name: Nome da IA
-            api_endpoint: Endpoint da API
-            api_key: Chave de API (opcional)
+            progress: Estado compartilhado do download
+            force: Se True, grava imediatamente
         """
-        self.cursor.execute(
-            "INSERT INTO ai_communications (ai_name, api_endpoint, api_key, last_communication) VALUES (?, ?, ?, ?)",
-            (ai_name, api_endpoint, api_key, datetime.now())
-        )
-        self.conn.commit()
-        logger.info(f"Nova comunicação com IA adicionada: {ai_name}")
+        with progress["lock"]:
+            now = time.monotonic()
+            if not force and now - progress["last_saved"] < 1.0:
+                return
+            progress["last_saved"] = now
+            
+            tmp_path = progress["state_path"] + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(progress["state"], f)
+            os.replace(tmp_path, progress["state_path"])
     
-    def get_ai_communications(self, enabled_only=True):
+    def _report_progress(self, progress):
         """
-        Recupera comunicações com IAs
+        Registra no log o percentual baixado e a vazão
         
         Args:
-            enabled_only: Se True, retorna apenas comunicações habilitadas
-            
-        Returns:
-            Lista de comunicações com IAs
+            progress: Estado compartilhado do download
         """
-        if enabled_only:
-            self.cursor.execute("SELECT * FROM ai_communications WHERE enabled = 1")
-        else:
-            self.cursor.execute("SELECT * FROM ai_communications")
-        return self.cursor.fetchall()
+        with progress["lock"]:
+            now = time.monotonic()
+            if now - progress["last_report"] < self.progress_interval:
+                return
+            progress["last_report"] = now
+            
+            state = progress["state"]
+            done = sum(segment[2] for segment in state["segments"])
+            elapsed = now - progress["start"]
+            throughput = (done - progress["initial"]) / elapsed if elapsed > 0 else 0.0
+            percent = f"{100.0 * done / state['size']:.1f}%" if state["size"] else f"{done / 1048576:.1f} MB"
+        
+        logger.info(f"Download de {state['url']}: {percent} ({throughput / 1048576:.1f} MB/s)")
     
-    def update_ai_communication_timestamp(self, comm_id):
+    def _download_segment(self, url, headers, part_path, index, progress):
         """
-        Atualiza o timestamp da última comunicação com uma IA
+        Baixa um segmento, retomando a partir do último byte gravado
         
         Args:
-            comm_id: ID da comunicação
-        """
-        self.cursor.execute(
-            "UPDATE ai_communications SET last_communication = ? WHERE id = ?",
-            (datetime.now(), comm_id)
-        )
-        self.conn.commit()
-    
-    def get_setting(self, key, default=None):
+            url: URL do arquivo
+            headers: Cabeçalhos das requisições
+            part_path: Caminho do arquivo temporário
+            index: Índice do segmento
+            progress: Estado compartilhado do download
         """
-        Recupera uma configuração
+        segment = progress["state"]["segments"][index]
         
-        Args:
-            key: Chave da configuração
-            default: Valor padrão se a configuração não existir
+        for attempt in range(self.max_retries):
+            start, end, done = segment
+            if end is not None and start + done > end:
+                return
             
-        Returns:
-            Valor da configuração
-        """
-        self.cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
-        result = self.cursor.fetchone()
-        return result[0] if result else default
+            request_headers = dict(headers)
+            if progress["state"]["ranges"]:
+                request_headers["Range"] = f"bytes={start + done}-{end}"
+            elif done:
+                # Sem suporte a Range, recomeça do zero
+                segment[2] = done = 0
+            
+            written = done
+            try:
+                response = self.http.get(url, headers=request_headers, stream=True, timeout=self.timeout)
+                expected_status = 206 if "Range" in request_headers else 200
+                if response.status_code != expected_status:
+                    response.close()
+                    raise IOError(f"Resposta inesperada: {response.status_code}")
+                
+                try:
+                    with response, open(part_path, "r+b", buffering=self.buffer_size) as f:
+                        f.seek(start + done)
+                        last_flush = time.monotonic()
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            f.write(chunk)
+                            written += len(chunk)
+                            if time.monotonic() - last_flush >= 1.0:
+                                f.flush()
+                                segment[2] = written
+                                last_flush = time.monotonic()
+                                self._save_state(progress)
+                            self._report_progress(progress)
+                finally:
+                    # O arquivo já foi fechado, então tudo o que foi escrito está no disco
+                    segment[2] = written
+                
+                if end is None:
+                    # Tamanho desconhecido: o fim da resposta é o fim do arquivo
+                    segment[1] = start + segment[2] - 1
+                self._save_state(progress, force=True)
+                
+                if segment[0] + segment[2] > segment[1]:
+                    return
+                raise IOError("Conexão encerrada antes do fim do segmento")
+            except (requests.RequestException, IOError) as e:
+                logger.warning(f"Erro no segmento {index} de {url} (tentativa {attempt+1}/{self.max_retries}): {e}")
+                if attempt < self.max_retries - 1:
+                    time.sleep(min(2 ** attempt, 30))
+        
+        raise IOError(f"Não foi possível baixar o segmento {index} de {url}")
     
-    def set_setting(self, key, value):
+    def _sha256(self, path):
         """
-        Define uma configuração
+        Calcula o SHA-256 de um arquivo
         
         Args:
-            key: Chave da configuração
-            value: Valor da configuração
+            path: Caminho do arquivo
+            
+        Returns:
+            Checksum em hexadecimal
         """
-        self.cursor.execute(
-            "INSERT OR REPLACE INTO settings (key, value, updated_at) VALUES (?, ?, ?)",
-            (key, value, datetime.now())
-        )
-        self.conn.commit()
-    
-    def close(self):
-        """Fecha a conexão com o banco de dados"""
-        if self.conn:
-            self.conn.close()
-            logger.debug("Conexão com o banco de dados fechada")
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(self.buffer_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+
+# Marca o fim dos itens de uma fonte na fila entre o download e a gravação
+_STREAM_END = object()
 
 
 class Updater:
     """Sistema de atualização automática para a IA NOVA"""
     
-    def __init__(self, database, default_update_interval=3600):
+    # Intervalo mínimo entre atualizações de uma mesma fonte, em segundos
+    MIN_UPDATE_INTERVAL = 60
+    
+    # Espera antes de tentar de novo uma atualização que falhou, em segundos;
+    # dobra a cada falha, até o máximo, e a atualização é abandonada depois
+    # de MAX_UPDATE_ATTEMPTS falhas
+    UPDATE_RETRY_DELAY = 300
+    UPDATE_RETRY_MAX_DELAY = 6 * 3600
+    MAX_UPDATE_ATTEMPTS = 8
+    
+    # Itens decodificados que cada fonte pode acumular no modo streaming
+    # enquanto a thread de gravação processa outra fonte
+    STREAM_QUEUE_SIZE = 2000
+    
+    # Tempo máximo de cada aplicação das políticas de retenção, em segundos;
+    # o restante fica para a próxima, sem atrasar demais as outras tarefas
+    RETENTION_TIME_BUDGET = 30
+    
+    # Espera antes de tentar de novo carregar o agendamento (por exemplo, com o
+    # banco bloqueado na inicialização), em segundos
+    SCHEDULE_RETRY_DELAY = 30
+    
+    def __init__(self, database, default_update_interval=3600, max_workers=8, max_per_host=2,
+                 jitter=0.1, ai_check_interval=600, pending_updates_interval=60,
+                 stream_payloads=True, stream_chunk_size=65536, transport=None, retention_interval=3600,
+                 retention_policies=None, archive_dir=None):
         """
         Inicializa o sistema de atualização
         
         Args:
             database: Instância do banco de dados
             default_update_interval: Intervalo padrão de atualização em segundos
+            max_workers: Número máximo de fontes baixadas em paralelo
+            max_per_host: Número máximo de downloads simultâneos por host
+            jitter: Fração aleatória somada ao intervalo de cada fonte (0.1 = até 10%)
+            ai_check_interval: Intervalo entre verificações das outras IAs em segundos
+            pending_updates_interval: Intervalo entre verificações de atualizações pendentes
+            stream_payloads: Se True, decodifica os payloads das fontes à medida
+                             que são recebidos, sem carregá-los inteiros na memória
+            stream_chunk_size: Tamanho dos blocos lidos no modo streaming, em bytes
+            transport: Transporte HTTP (opcional, usa o compartilhado por padrão)
+            retention_interval: Intervalo entre aplicações das políticas de
+                                retenção em segundos (None desativa)
+            retention_policies: Políticas de retenção (opcional, usa RETENTION_POLICIES)
+            archive_dir: Diretório dos arquivos de arquivamento (opcional)
         """
         self.database = database
+        self.http = transport or get_transport()
         self.default_update_interval = default_update_interval
         self.running = False
         self.update_thread = None
         
+        # Downloads concorrentes das fontes de dados
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self._executor = None
+        self._host_limits = {}
+        self._host_limits_lock = threading.Lock()
+        self.stream_payloads = stream_payloads
+        self.stream_chunk_size = stream_chunk_size
+        
+        # Contadores de atualizações das fontes de dados
+        self.stats = {
+            "refreshes": 0,
+            "not_modified": 0,
+            "errors": 0,
+            "not_modified_by_source": {}
+        }
+        
+        # Agendador por prazos: heap de (prazo, sequência, tarefa, chave)
+        self.jitter = jitter
+        self.ai_check_interval = ai_check_interval
+        self.pending_updates_interval = pending_updates_interval
+        self._schedule = []
+        self._source_deadlines = {}
+        self._task_counter = itertools.count()
+        self._changed_sources = set()
+        self._wakeup = threading.Condition()
+        
+        # Retenção do conhecimento e das interações
+        self.retention_interval = retention_interval
+        self.retention_policies = retention_policies
+        self.archive_dir = archive_dir
+        
         # Adiciona algumas fontes de dados padrão se não existirem
         self._initialize_default_sources()
+        
+        # Novas fontes de dados acordam o agendador imediatamente
+        self.database.add_change_listener(self._on_database_change)
     
     def _initialize_default_sources(self):
         """Inicializa fontes de dados padrão"""
@@ -404,38 +1885,193 @@ class Updater:
             return
         
         self.running = False
+        with self._wakeup:
+            self._wakeup.notify_all()
         if self.update_thread:
             self.update_thread.join(timeout=1.0)
             logger.info("Sistema de atualização parado")
+        
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
     
     def _update_loop(self):
         """Loop principal de atualização"""
+        schedule_loaded = False
+        
         while self.running:
+            # Sem o agendamento não há prazos: tenta de novo após uma espera limitada
+            if not schedule_loaded:
+                try:
+                    self._load_schedule()
+                    schedule_loaded = True
+                except Exception as e:
+                    logger.error(f"Erro ao carregar o agendamento, nova tentativa em {self.SCHEDULE_RETRY_DELAY}s: {e}")
+                    with self._wakeup:
+                        if self.running:
+                            self._wakeup.wait(timeout=self.SCHEDULE_RETRY_DELAY)
+                    continue
+            
             try:
-                # Verifica fontes de dados que precisam ser atualizadas
-                self._check_data_sources()
-                
-                # Verifica comunicações com outras IAs
-                self._check_ai_communications()
-                
-                # Aplica atualizações pendentes
-                self.apply_pending_updates()
+                self._run_due_tasks()
             except Exception as e:
                 logger.error(f"Erro no loop de atualização: {e}")
             
-            # Aguarda um minuto antes da próxima verificação
-            for _ in range(60):
-                if not self.running:
-                    break
-                time.sleep(1)
+            # Dorme até o próximo prazo ou até uma fonte ser adicionada
+            with self._wakeup:
+                if self.running and not self._changed_sources:
+                    self._wakeup.wait(timeout=self._time_until_next_deadline())
+    
+    def _on_database_change(self, table, row_id):
+        """
+        Recebe notificações do banco de dados e acorda o agendador
+        
+        Args:
+            table: Nome da tabela alterada
+            row_id: ID da linha alterada
+        """
+        if table != "data_sources":
+            return
+        
+        with self._wakeup:
+            self._changed_sources.add(row_id)
+            self._wakeup.notify_all()
+    
+    def _load_schedule(self):
+        """Monta o agendamento inicial a partir das fontes de dados"""
+        self._schedule = []
+        self._source_deadlines = {}
+        
+        for source in self.database.get_data_sources():
+            self._schedule_source(source)
+        
+        now = time.monotonic()
+        self._schedule_task(now, "ai_communications")
+        self._schedule_task(now, "pending_updates")
+        if self.retention_interval:
+            self._schedule_task(now, "retention")
+        logger.info(f"Agendamento carregado com {len(self._source_deadlines)} fontes de dados")
+    
+    def _schedule_task(self, deadline, task, key=None):
+        """
+        Insere uma tarefa no heap do agendador
+        
+        Args:
+            deadline: Prazo em segundos (relógio monotônico)
+            task: Nome da tarefa
+            key: Chave da tarefa, como o ID da fonte de dados (opcional)
+        """
+        heapq.heappush(self._schedule, (deadline, next(self._task_counter), task, key))
+    
+    def _schedule_source(self, source, delay=None):
+        """
+        Agenda a próxima atualização de uma fonte de dados
+        
+        Entradas antigas da mesma fonte continuam no heap, mas são ignoradas
+        ao sair dele por não corresponderem mais ao prazo registrado.
+        
+        Args:
+            source: Informações da fonte de dados
+            delay: Segundos até a atualização; se omitido, é calculado a
+                   partir de last_updated e update_frequency
+        """
+        source_id, name, url, api_key, last_updated_str, update_frequency, enabled = source[:7]
+        
+        if delay is None:
+            last_updated = datetime.fromisoformat(last_updated_str) if isinstance(last_updated_str, str) else last_updated_str
+            elapsed = (datetime.now() - last_updated).total_seconds()
+            delay = max(0.0, update_frequency - elapsed)
+        
+        deadline = time.monotonic() + delay
+        self._source_deadlines[source_id] = deadline
+        self._schedule_task(deadline, "source", source_id)
+    
+    def _time_until_next_deadline(self):
+        """
+        Calcula quanto tempo falta para o próximo prazo
+        
+        Returns:
+            Segundos até o próximo prazo ou None se não houver tarefas
+        """
+        if not self._schedule:
+            return None
+        return max(0.0, self._schedule[0][0] - time.monotonic())
+    
+    def _run_due_tasks(self):
+        """Executa as tarefas cujo prazo venceu"""
+        # Fontes adicionadas ou alteradas desde a última iteração
+        with self._wakeup:
+            changed_sources, self._changed_sources = self._changed_sources, set()
+        
+        for source_id in changed_sources:
+            source = self.database.get_data_source(source_id)
+            if source and source[6]:
+                self._schedule_source(source)
+            else:
+                self._source_deadlines.pop(source_id, None)
+        
+        now = time.monotonic()
+        due_sources = []
+        due_tasks = set()
+        while self._schedule and self._schedule[0][0] <= now:
+            deadline, _, task, key = heapq.heappop(self._schedule)
+            if task != "source":
+                due_tasks.add(task)
+                continue
+            
+            if self._source_deadlines.get(key) != deadline:
+                continue  # Entrada obsoleta
+            del self._source_deadlines[key]
+            
+            # Relê a fonte para respeitar alterações de frequência ou desativação
+            source = self.database.get_data_source(key)
+            if source and source[6]:
+                due_sources.append(source)
+        
+        if due_sources:
+            try:
+                self._refresh_sources(due_sources)
+            finally:
+                for source in due_sources:
+                    update_frequency = max(source[5], self.MIN_UPDATE_INTERVAL)
+                    self._schedule_source(
+                        source,
+                        delay=update_frequency * (1 + random.uniform(0, self.jitter))
+                    )
+        
+        if "ai_communications" in due_tasks:
+            try:
+                self._check_ai_communications()
+            finally:
+                self._schedule_task(time.monotonic() + self.ai_check_interval, "ai_communications")
+        
+        # Fontes como model_updates costumam gerar atualizações pendentes
+        if "pending_updates" in due_tasks or due_sources:
+            try:
+                self.apply_pending_updates()
+            finally:
+                if "pending_updates" in due_tasks:
+                    self._schedule_task(time.monotonic() + self.pending_updates_interval, "pending_updates")
+        
+        if "retention" in due_tasks:
+            try:
+                self.database.apply_retention(
+                    self.retention_policies,
+                    self.archive_dir,
+                    time_budget=self.RETENTION_TIME_BUDGET,
+                    should_stop=lambda: not self.running
+                )
+            finally:
+                self._schedule_task(time.monotonic() + self.retention_interval, "retention")
     
     def _check_data_sources(self):
         """Verifica fontes de dados que precisam ser atualizadas"""
         sources = self.database.get_data_sources()
         current_time = datetime.now()
         
+        due_sources = []
         for source in sources:
-            source_id, name, url, api_key, last_updated_str, update_frequency, enabled = source
+            source_id, name, url, api_key, last_updated_str, update_frequency, enabled = source[:7]
             
             # Converte string para datetime
             last_updated = datetime.fromisoformat(last_updated_str) if isinstance(last_updated_str, str) else last_updated_str
@@ -443,12 +2079,67 @@ class Updater:
             # Verifica se é hora de atualizar
             time_diff = (current_time - last_updated).total_seconds()
             if time_diff >= update_frequency:
-                logger.info(f"Atualizando fonte de dados: {name}")
-                try:
-                    self._update_from_source(source)
-                    self.database.update_data_source_timestamp(source_id)
-                except Exception as e:
-                    logger.error(f"Erro ao atualizar fonte {name}: {e}")
+                due_sources.append(source)
+        
+        if due_sources:
+            self._refresh_sources(due_sources)
+    
+    def _refresh_sources(self, sources):
+        """
+        Atualiza um conjunto de fontes de dados
+        
+        Os downloads (e, no modo streaming, a decodificação dos corpos)
+        acontecem em paralelo; o processamento e as gravações ficam na thread
+        que chama este método, a única a escrever no banco, que atende as
+        fontes na ordem em que as respostas chegam.
+        
+        Args:
+            sources: Lista de fontes de dados
+        """
+        executor = self._get_executor()
+        ready = queue.Queue()
+        for source in sources:
+            executor.submit(self._fetch_source, source, lambda result, source=source: ready.put((source, result)))
+        
+        for _ in sources:
+            source, result = ready.get()
+            source_id, name = source[:2]
+            try:
+                self._apply_fetch_result(source, result)
+                self.database.update_data_source_timestamp(source_id)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Erro ao atualizar fonte {name}: {e}")
+    
+    def _get_executor(self):
+        """
+        Retorna o pool de threads usado para baixar as fontes de dados
+        
+        Returns:
+            Instância de ThreadPoolExecutor
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="nova_fetch"
+            )
+        return self._executor
+    
+    def _get_host_limit(self, url):
+        """
+        Retorna o semáforo que limita os downloads simultâneos de um host
+        
+        Args:
+            url: URL a ser acessada
+            
+        Returns:
+            Semáforo do host da URL
+        """
+        host = urlparse(url).netloc
+        with self._host_limits_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_limits[host]
     
     def _update_from_source(self, source):
         """
@@ -457,21 +2148,159 @@ class Updater:
         Args:
             source: Informações da fonte de dados
         """
-        source_id, name, url, api_key, _, _, _ = source
+        ready = queue.Queue()
+        self._get_executor().submit(self._fetch_source, source, ready.put)
+        self._apply_fetch_result(source, ready.get())
+    
+    def _apply_fetch_result(self, source, result):
+        """
+        Processa o resultado de um download e grava os validadores HTTP
         
-        headers = {}
-        if api_key:
-            headers["Authorization"] = f"Bearer {api_key}"
+        Args:
+            source: Informações da fonte de dados
+            result: Dicionário retornado por _fetch_source
+        """
+        source_id, name = source[:2]
+        
+        if result["status"] == "not_modified":
+            # Nada mudou desde o último download: não há o que processar
+            self.stats["not_modified"] += 1
+            by_source = self.stats["not_modified_by_source"]
+            by_source[name] = by_source.get(name, 0) + 1
+            logger.info(f"Fonte {name} não modificada desde a última atualização")
+            return
+        
+        if result["status"] == "error":
+            if result.get("error") is not None:
+                raise result["error"]
+            self.stats["errors"] += 1
+            return
         
         try:
-            response = requests.get(url, headers=headers, timeout=30)
-            if response.status_code == 200:
-                data = response.json()
-                self._process_source_data(name, data)
-            else:
-                logger.warning(f"Erro ao acessar {name}: {response.status_code}")
+            self._process_source_data(name, result["data"])
+        finally:
+            # Libera o download se o processamento parou antes do fim dos itens
+            if result.get("stop") is not None:
+                result["stop"].set()
+        self.database.update_data_source_validators(source_id, result["etag"], result["last_modified"])
+        self.stats["refreshes"] += 1
+    
+    def _fetch_source(self, source, on_ready):
+        """
+        Baixa os dados de uma fonte, respeitando o limite por host
+        
+        Envia If-None-Match / If-Modified-Since quando a fonte já tem
+        validadores, de modo que uma resposta 304 evita baixar e processar
+        novamente o mesmo conteúdo. Não grava nada no banco, podendo ser
+        executado em qualquer thread.
+        
+        O resultado é entregue a on_ready assim que o status da resposta é
+        conhecido. No modo streaming, o corpo continua sendo lido e
+        decodificado nesta thread, ainda dentro do limite do host: data é um
+        iterador sobre uma fila limitada de itens, e acionar o evento "stop"
+        interrompe a leitura quando o processamento termina antes do fim.
+        
+        Args:
+            source: Informações da fonte de dados
+            on_ready: Função chamada uma única vez com o dicionário de resultado,
+                      com status ("ok", "not_modified" ou "error"), data, etag,
+                      last_modified, stop e, para erros inesperados, error
+        """
+        result = {"status": "error", "data": None, "etag": None, "last_modified": None, "stop": None}
+        try:
+            source_id, name, url, api_key, _, _, _, etag, last_modified = source
+            logger.info(f"Atualizando fonte de dados: {name}")
+            
+            headers = {}
+            if api_key:
+                headers["Authorization"] = f"Bearer {api_key}"
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+            
+            with self._get_host_limit(url):
+                response = self.http.get(url, headers=headers, timeout=30, stream=self.stream_payloads)
+                try:
+                    if response.status_code == 200:
+                        result.update(
+                            status="ok",
+                            etag=response.headers.get("ETag"),
+                            last_modified=response.headers.get("Last-Modified")
+                        )
+                        if self.stream_payloads:
+                            items = queue.Queue(maxsize=self.STREAM_QUEUE_SIZE)
+                            result.update(data=self._iter_queue(items), stop=threading.Event())
+                            on_ready(result)
+                            on_ready = None
+                            self._pump_items(response, items, result["stop"])
+                        else:
+                            result["data"] = response.json()
+                    elif response.status_code == 304:
+                        result["status"] = "not_modified"
+                    else:
+                        logger.warning(f"Erro ao acessar {name}: {response.status_code}")
+                finally:
+                    response.close()
         except requests.RequestException as e:
             logger.error(f"Erro de requisição para {name}: {e}")
+        except Exception as e:
+            # Repassado à thread de gravação, que registra o erro da fonte
+            result.update(status="error", error=e)
+        finally:
+            if on_ready is not None:
+                on_ready(result)
+        return result
+    
+    def _pump_items(self, response, items, stop):
+        """
+        Lê e decodifica o corpo de uma resposta, colocando os itens na fila
+        
+        A fila é limitada: quando está cheia, a leitura espera a thread de
+        gravação consumir os itens. Termina com _STREAM_END ou com a exceção
+        da leitura na fila, ou sem nada se stop for acionado.
+        
+        Args:
+            response: Resposta HTTP aberta em modo streaming
+            items: Fila que recebe os itens
+            stop: Evento que interrompe a leitura
+        """
+        def put(item):
+            while not stop.is_set():
+                try:
+                    items.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        
+        try:
+            for item in iter_json_items(response.iter_content(chunk_size=self.stream_chunk_size)):
+                if not put(item):
+                    return
+        except Exception as e:
+            put(e)
+        else:
+            put(_STREAM_END)
+    
+    @staticmethod
+    def _iter_queue(items):
+        """
+        Produz os itens colocados na fila por _pump_items
+        
+        Args:
+            items: Fila de itens
+            
+        Yields:
+            Cada item, até _STREAM_END; exceções da leitura são relançadas
+        """
+        while True:
+            item = items.get()
+            if item is _STREAM_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
     
     def _process_source_data(self, source_name, data):
         """
@@ -479,44 +2308,57 @@ class Updater:
         
         Args:
             source_name: Nome da fonte
-            data: Dados recebidos
+            data: Dados recebidos (lista ou iterador de itens no modo streaming)
         """
+        is_item_stream = isinstance(data, (list, Iterator))
+        # Itens que chegam pela rede são gravados bloco a bloco (ver add_knowledge_many)
+        transactional = not isinstance(data, Iterator)
+        
         if source_name == "knowledge_base":
             # Processa atualizações de conhecimento
-            if isinstance(data, list):
-                for item in data:
-                    if isinstance(item, dict) and "topic" in item and "content" in item:
-                        self.database.add_knowledge(
-                            topic=item.get("topic", ""),
-                            content=item.get("content", ""),
-                            source=item.get("source", source_name),
-                            confidence=item.get("confidence", 1.0)
-                        )
-            logger.info(f"Processados {len(data) if isinstance(data, list) else 0} itens de conhecimento")
+            total = 0
+            if is_item_stream:
+                total = self.database.add_knowledge_many(
+                    (
+                        item for item in data
+                        if isinstance(item, dict) and "topic" in item and "content" in item
+                    ),
+                    source=source_name,
+                    transactional=transactional
+                )
+            logger.info(f"Processados {total} itens de conhecimento")
         
         elif source_name == "model_updates":
             # Processa atualizações de modelo
-            if isinstance(data, list):
+            total = 0
+            if is_item_stream:
                 for update in data:
                     if isinstance(update, dict) and "type" in update:
                         self.database.add_update(
                             update_type=update.get("type", ""),
                             content=json.dumps(update)
                         )
-            logger.info(f"Processadas {len(data) if isinstance(data, list) else 0} atualizações de modelo")
+                        total += 1
+            logger.info(f"Processadas {total} atualizações de modelo")
         
         elif source_name == "news_feed":
             # Processa notícias
-            if isinstance(data, list):
-                for news in data:
-                    if isinstance(news, dict) and "title" in news and "content" in news:
-                        self.database.add_knowledge(
-                            topic=f"news_{news.get('category', 'general')}",
-                            content=f"{news.get('title')}: {news.get('content')}",
-                            source=news.get("source", source_name),
-                            confidence=0.9  # Notícias têm confiança alta, mas não máxima
-                        )
-            logger.info(f"Processadas {len(data) if isinstance(data, list) else 0} notícias")
+            total = 0
+            if is_item_stream:
+                total = self.database.add_knowledge_many(
+                    (
+                        {
+                            "topic": f"news_{news.get('category', 'general')}",
+                            "content": f"{news.get('title')}: {news.get('content')}",
+                            "source": news.get("source", source_name),
+                            "confidence": 0.9  # Notícias têm confiança alta, mas não máxima
+                        }
+                        for news in data
+                        if isinstance(news, dict) and "title" in news and "content" in news
+                    ),
+                    transactional=transactional
+                )
+            logger.info(f"Processadas {total} notícias")
     
     def _check_ai_communications(self):
         """Verifica comunicações com outras IAs"""
@@ -553,7 +2395,7 @@ class Updater:
         }
         
         try:
-            response = requests.post(api_endpoint, headers=headers, json=payload, timeout=10)
+            response = self.http.post(api_endpoint, headers=headers, json=payload, timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 # Armazena informações úteis da resposta
@@ -562,32 +2404,47 @@ class Updater:
                     
                     # Se houver conhecimento compartilhado, armazena
                     if "shared_knowledge" in data and isinstance(data["shared_knowledge"], list):
-                        for item in data["shared_knowledge"]:
-                            if isinstance(item, dict) and "topic" in item and "content" in item:
-                                self.database.add_knowledge(
-                                    topic=item.get("topic", ""),
-                                    content=item.get("content", ""),
-                                    source=f"ai_{ai_name}",
-                                    confidence=item.get("confidence", 0.8)  # Confiança um pouco menor para conhecimento externo
-                                )
+                        self.database.add_knowledge_many(
+                            (
+                                {
+                                    "topic": item.get("topic", ""),
+                                    "content": item.get("content", ""),
+                                    "source": f"ai_{ai_name}",
+                                    "confidence": item.get("confidence", 0.8)  # Confiança um pouco menor para conhecimento externo
+                                }
+                                for item in data["shared_knowledge"]
+                                if isinstance(item, dict) and "topic" in item and "content" in item
+                            )
+                        )
             else:
                 logger.warning(f"Erro ao comunicar com {ai_name}: {response.status_code}")
         except requests.RequestException as e:
             logger.error(f"Erro de requisição para {ai_name}: {e}")
     
     def apply_pending_updates(self):
-        """Aplica atualizações pendentes"""
-        updates = self.database.get_pending_updates()
+        """
+        Aplica atualizações pendentes
+        
+        Uma atualização que falha é adiada por UPDATE_RETRY_DELAY segundos,
+        tempo que dobra a cada nova falha (até UPDATE_RETRY_MAX_DELAY), e é
+        abandonada depois de MAX_UPDATE_ATTEMPTS falhas.
+        """
+        updates = self.database.get_pending_updates(max_attempts=self.MAX_UPDATE_ATTEMPTS)
         
         for update in updates:
-            update_id, update_type, content, _, _ = update
+            update_id, update_type, content, _, _, attempts = update
             try:
                 update_data = json.loads(content)
                 self._apply_update(update_type, update_data)
                 self.database.mark_update_applied(update_id)
                 logger.info(f"Atualização {update_id} ({update_type}) aplicada com sucesso")
             except Exception as e:
-                logger.error(f"Erro ao aplicar atualização {update_id}: {e}")
+                delay = min(self.UPDATE_RETRY_DELAY * 2 ** attempts, self.UPDATE_RETRY_MAX_DELAY)
+                self.database.record_update_failure(update_id, e, delay)
+                if attempts + 1 >= self.MAX_UPDATE_ATTEMPTS:
+                    logger.error(f"Atualização {update_id} abandonada após {attempts + 1} falhas: {e}")
+                else:
+                    logger.error(f"Erro ao aplicar atualização {update_id} (nova tentativa em {delay} s): {e}")
     
     def _apply_update(self, update_type, update_data):
         """
@@ -610,32 +2467,34 @@ class Updater:
                 # Garante que o diretório existe
                 os.makedirs(os.path.dirname(weights_path), exist_ok=True)
                 
-                # Baixa os novos pesos
+                # Baixa os novos pesos; em caso de falha a atualização continua
+                # pendente (com espera crescente entre as tentativas) e o
+                # próximo download retoma de onde parou
+                downloader = ResumableDownloader(segments=update_data.get("segments", 4), transport=self.http)
                 try:
-                    response = requests.get(weights_url, stream=True)
-                    if response.status_code == 200:
-                        with open(weights_path, 'wb') as f:
-                            for chunk in response.iter_content(chunk_size=8192):
-                                f.write(chunk)
-                        logger.info(f"Novos pesos baixados para {weights_path}")
-                    else:
-                        logger.error(f"Erro ao baixar pesos: {response.status_code}")
+                    downloader.download(
+                        weights_url,
+                        weights_path,
+                        sha256=update_data.get("sha256"),
+                        expected_size=update_data.get("size")
+                    )
+                    logger.info(f"Novos pesos baixados para {weights_path}")
                 except Exception as e:
                     logger.error(f"Erro ao baixar pesos: {e}")
+                    raise
         
         elif update_type == "knowledge_base":
             # Atualiza a base de conhecimento
             logger.info("Atualização da base de conhecimento")
             
             if "items" in update_data and isinstance(update_data["items"], list):
-                for item in update_data["items"]:
-                    if isinstance(item, dict) and "topic" in item and "content" in item:
-                        self.database.add_knowledge(
-                            topic=item.get("topic", ""),
-                            content=item.get("content", ""),
-                            source=item.get("source", "update"),
-                            confidence=item.get("confidence", 1.0)
-                        )
+                self.database.add_knowledge_many(
+                    (
+                        item for item in update_data["items"]
+                        if isinstance(item, dict) and "topic" in item and "content" in item
+                    ),
+                    source="update"
+                )
         
         elif update_type == "system_config":
             # Atualiza configurações do sistema
@@ -679,15 +2538,17 @@ class Updater:
 class DeveloperCommunication:
     """Sistema de comunicação com o desenvolvedor"""
     
-    def __init__(self, database, developer_endpoint=None):
+    def __init__(self, database, developer_endpoint=None, transport=None):
         """
         Inicializa o sistema de comunicação com o desenvolvedor
         
         Args:
             database: Instância do banco de dados
             developer_endpoint: Endpoint para comunicação com o desenvolvedor
+            transport: Transporte HTTP (opcional, usa o compartilhado por padrão)
         """
         self.database = database
+        self.http = transport or get_transport()
         self.developer_endpoint = developer_endpoint or self.database.get_setting(
             "developer_endpoint", 
             "https://api.example.com/developer"
@@ -717,7 +2578,7 @@ class DeveloperCommunication:
         }
         
         try:
-            response = requests.post(self.developer_endpoint, json=payload, timeout=10)
+            response = self.http.post(self.developer_endpoint, json=payload, timeout=10)
             if response.status_code == 200:
                 logger.info(f"Feedback enviado com sucesso: {message_type}")
                 return True
@@ -779,7 +2640,7 @@ class DeveloperCommunication:
         }
         
         try:
-            response = requests.post(f"{self.developer_endpoint}/updates", json=payload, timeout=10)
+            response = self.http.post(f"{self.developer_endpoint}/updates", json=payload, timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 if data.get("has_updates", False):
@@ -798,8 +2659,26 @@ class DeveloperCommunication:
 
 def main():
     """Função principal para testar o sistema de atualização"""
+    parser = argparse.ArgumentParser(description="Sistema de atualização automática da IA NOVA")
+    parser.add_argument("--db", default="data/nova_test.db", help="Caminho do banco de dados")
+    parser.add_argument("--compact", action="store_true", help="Remove conhecimento duplicado e encerra")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="Executa VACUUM após a compactação (ativa o incremental_vacuum em bancos antigos)")
+    parser.add_argument("--retention", action="store_true", help="Aplica as políticas de retenção e encerra")
+    args = parser.parse_args()
+    
     # Inicializa o banco de dados
-    db = Database("data/nova_test.db")
+    db = Database(args.db)
+    
+    if args.retention:
+        db.apply_retention()
+        db.close()
+        return
+    
+    if args.compact:
+        db.compact_knowledge(vacuum=args.vacuum)
+        db.close()
+        return
     
     # Inicializa o sistema de atualização
     updater = Updater(db)
@@ -0,0 +1,58 @@
+"""
+Benchmark de latência HTTP para IA NOVA
+Compara requisições repetidas ao mesmo host feitas com requests.get (uma
+conexão nova por chamada) e com o transporte compartilhado (conexões
+reaproveitadas), exibindo p50 e p95 de cada abordagem.
+"""
+
+import argparse
+import statistics
+import time
+
+import requests
+
+from transporte_http import HTTPTransport
+
+
+def measure(send, url, count):
+    """
+    Mede a latência de requisições repetidas
+    
+    Args:
+        send: Função que recebe a URL e envia uma requisição
+        url: URL consultada
+        count: Número de requisições
+        
+    Returns:
+        Tupla (p50, p95) em milissegundos
+    """
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        send(url).content
+        latencies.append((time.perf_counter() - start) * 1000)
+    
+    quantiles = statistics.quantiles(latencies, n=20)
+    return statistics.median(latencies), quantiles[18]
+
+
+def main():
+    """Função principal do benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark de latência HTTP")
+    parser.add_argument("--url", default="http://localhost:11434/api/tags", help="URL consultada")
+    parser.add_argument("--requests", type=int, default=50, help="Requisições em cada abordagem")
+    parser.add_argument("--http2", action="store_true", help="Usa HTTP/2 no transporte compartilhado")
+    args = parser.parse_args()
+    
+    transport = HTTPTransport(http2=args.http2)
+    
+    before = measure(lambda url: requests.get(url, timeout=30), args.url, args.requests)
+    after = measure(transport.get, args.url, args.requests)
+    transport.close()
+    
+    print(f"requests.get (antes):        p50 {before[0]:8.1f} ms   p95 {before[1]:8.1f} ms")
+    print(f"HTTPTransport (depois):      p50 {after[0]:8.1f} ms   p95 {after[1]:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark de ingestão de conhecimento para IA NOVA
+Compara a gravação item a item (Database.add_knowledge, um commit por linha)
+com a gravação em lote (Database.add_knowledge_many, uma única transação)
+e exibe a taxa de linhas por segundo de cada abordagem.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from atualizacao_automatica import Database
+
+
+def generate_items(count):
+    """
+    Gera itens de conhecimento sintéticos
+    
+    Args:
+        count: Número de itens
+        
+    Returns:
+        Gerador de dicionários no formato aceito por add_knowledge_many
+    """
+    for i in range(count):
+        yield {
+            "topic": f"benchmark_{i % 100}",
+            "content": f"Item de conhecimento sintético número {i}",
+            "source": "benchmark",
+            "confidence": 0.5 + (i % 50) / 100
+        }
+
+
+def run_benchmark(rows, chunk_size):
+    """
+    Executa o benchmark em bancos temporários
+    
+    Args:
+        rows: Número de linhas gravadas em cada abordagem
+        chunk_size: Tamanho do bloco usado por add_knowledge_many
+        
+    Returns:
+        Dicionário com as taxas (linhas/s) antes e depois
+    """
+    results = {}
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Antes: um INSERT e um commit por item
+        db = Database(os.path.join(tmp_dir, "antes.db"))
+        start = time.perf_counter()
+        for item in generate_items(rows):
+            db.add_knowledge(item["topic"], item["content"], item["source"], item["confidence"])
+        results["antes"] = rows / (time.perf_counter() - start)
+        db.close()
+        
+        # Depois: executemany em blocos dentro de uma única transação
+        db = Database(os.path.join(tmp_dir, "depois.db"))
+        start = time.perf_counter()
+        db.add_knowledge_many(generate_items(rows), chunk_size=chunk_size)
+        results["depois"] = rows / (time.perf_counter() - start)
+        db.close()
+    
+    return results
+
+
+def main():
+    """Função principal do benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark de ingestão de conhecimento")
+    parser.add_argument("--rows", type=int, default=5000, help="Linhas gravadas em cada abordagem")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Tamanho do bloco do executemany")
+    args = parser.parse_args()
+    
+    results = run_benchmark(args.rows, args.chunk_size)
+    
+    print(f"add_knowledge (antes):       {results['antes']:>12,.0f} linhas/s")
+    print(f"add_knowledge_many (depois): {results['depois']:>12,.0f} linhas/s")
+    print(f"Ganho: {results['depois'] / results['antes']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
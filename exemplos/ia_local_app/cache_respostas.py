@@ -0,0 +1,694 @@
+"""
+Módulo de Cache de Respostas para IA NOVA
+Este módulo implementa o cache das respostas das IAs externas, com uma camada
+LRU em memória e uma camada persistente no banco de dados da NOVA, um cache
+semântico que reaproveita respostas de textos parecidos, e o agrupamento de
+consultas idênticas simultâneas (single-flight), evitando repetir consultas
+idênticas (e pagas) aos serviços.
+
+O cache semântico de perguntas reformuladas precisa de um modelo de embeddings
+local: com o pacote sentence-transformers instalado (pip install
+sentence-transformers), create_semantic_cache carrega DEFAULT_EMBEDDING_MODEL
+e os main() de comunicacao_ia e comunicacao_ia_async passam o cache ao AIComm.
+Sem o pacote, o cache semântico fica desativado.
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+from indice_vetorial import np, embed_text, words
+
+logger = logging.getLogger("NOVA_Cache")
+
+# Tempo de vida padrão das respostas de cada função auxiliar, em segundos
+CACHE_TTLS = {
+    "translate": 30 * 24 * 3600,
+    "summarize": 7 * 24 * 3600,
+    "sentiment": 30 * 24 * 3600,
+    "keywords": 30 * 24 * 3600
+}
+
+# Funções auxiliares que reaproveitam a resposta de textos parecidos (cache
+# semântico), com a similaridade mínima e o tempo de vida das respostas em
+# segundos; as ausentes usam só o cache exato. As marcadas com requires_model
+# só usam o cache semântico com um modelo de embeddings (SemanticCache com
+# embed, ver create_semantic_cache): o embed_text padrão não reconhece
+# perguntas reformuladas e dá similaridade alta a textos de sentido oposto
+# ("instalar"/"desinstalar")
+SEMANTIC_CACHE_HELPERS = {
+    "answer": {"threshold": 0.9, "ttl": 24 * 3600, "requires_model": True}
+}
+
+# Palavras ignoradas na comparação dos textos do cache semântico
+_STOPWORDS = frozenset(
+    "a ao aos as com como da das de do dos e em eu me meu minha na nas no nos o os ou para pela pelo por "
+    "pra qual quais que se um uma the an and are do does how is of on or to what".split()
+)
+
+# Palavras que invertem o sentido de um texto; textos com negações diferentes
+# nunca compartilham respostas, mesmo com um modelo de embeddings
+_NEGATIONS = frozenset(
+    "nao nem nenhum nenhuma nada nunca jamais sem not never no nothing without".split()
+) - _STOPWORDS
+
+# Prefixos que invertem o sentido de uma palavra ("desinstalar", "incorreto")
+# e número de letras do radical que as duas palavras precisam ter em comum
+# ("desinstalar"/"instalo"); modelos de embeddings pequenos tendem a dar
+# similaridade alta a esses pares
+_NEGATING_PREFIXES = ("des", "dis", "in", "im", "ir", "un", "anti", "non")
+_STEM_LENGTH = 5
+
+# Modelo de embeddings local do cache semântico (multilíngue, roda na CPU;
+# baixado uma vez pelo sentence-transformers)
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+class ResponseCache:
+    """Cache de respostas com camada LRU em memória e camada persistente em SQLite"""
+    
+    def __init__(self, database=None, max_entries=1024, max_persistent_entries=100000,
+                 prune_interval=1000, access_flush_size=256):
+        """
+        Inicializa o cache
+        
+        A leitura da camada persistente é só um SELECT: os acessos (usados
+        para descartar as respostas menos usadas) ficam em memória e são
+        gravados em lote junto com as gravações. Erros do banco (por exemplo,
+        banco bloqueado por outro escritor) não chegam ao chamador: a leitura
+        vira uma falha de cache e a gravação fica só em memória.
+        
+        Args:
+            database: Instância do banco de dados para a camada persistente
+                      (opcional, sem ela o cache fica só em memória)
+            max_entries: Número máximo de respostas na camada em memória
+            max_persistent_entries: Número máximo de respostas no banco de dados
+            prune_interval: Número de gravações entre limpezas da camada persistente
+            access_flush_size: Número de acessos pendentes a partir do qual eles
+                               são gravados na próxima gravação
+        """
+        self.database = database
+        self.max_entries = max_entries
+        self.max_persistent_entries = max_persistent_entries
+        self.prune_interval = prune_interval
+        self.access_flush_size = access_flush_size
+        
+        # chave -> (resposta, expira_em); a ordem é a de uso mais recente
+        self._entries = OrderedDict()
+        # chave -> último acesso ainda não gravado na camada persistente
+        self._accesses = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "persistent_errors": 0
+        }
+    
+    @staticmethod
+    def make_key(service, url, payload):
+        """
+        Calcula a chave de cache de uma requisição
+        
+        O payload já contém prompt, modelo e parâmetros; a URL (sem a query
+        string, que pode conter chaves de API) identifica o modelo nos serviços
+        que o recebem no caminho.
+        
+        Args:
+            service: Nome do serviço
+            url: URL da requisição
+            payload: Corpo JSON da requisição
+        
+        Returns:
+            Hash SHA-256 em hexadecimal
+        """
+        material = json.dumps([service, url.split("?", 1)[0], payload], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+    
+    def get(self, key):
+        """
+        Recupera uma resposta do cache
+        
+        Args:
+            key: Chave de cache
+        
+        Returns:
+            Resposta armazenada ou None se ausente ou expirada
+        """
+        now = time.time()
+        response = self._get_memory(key, now)
+        if response is not None:
+            return response
+        
+        if self.database is not None:
+            try:
+                result = self.database.get_cached_response(key, now)
+            except sqlite3.Error as e:
+                logger.warning(f"Camada persistente do cache indisponível na leitura: {e}")
+                result = None
+                with self._lock:
+                    self.stats["persistent_errors"] += 1
+            
+            if result is not None:
+                response, expires_at = result
+                with self._lock:
+                    self.stats["persistent_hits"] += 1
+                    self._remember(key, response, expires_at)
+                    self._accesses[key] = now
+                return response
+        
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+    
+    def get_memory(self, key):
+        """
+        Recupera uma resposta só da camada em memória, sem acessar o banco
+        
+        Para quem não pode bloquear (como um event loop): uma ausência aqui
+        não conta como falha e deve ser seguida de get fora do loop.
+        
+        Args:
+            key: Chave de cache
+        
+        Returns:
+            Resposta armazenada ou None se ausente da memória ou expirada
+        """
+        return self._get_memory(key, time.time())
+    
+    def _get_memory(self, key, now):
+        """Consulta a camada em memória, registrando o acerto"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._entries[key]
+                return None
+            
+            self._entries.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            if self.database is not None:
+                self._accesses[key] = now
+            return entry[0]
+    
+    def set(self, key, response, ttl, service=None, model=None):
+        """
+        Armazena uma resposta no cache
+        
+        Args:
+            key: Chave de cache
+            response: Resposta da IA
+            ttl: Tempo de vida em segundos
+            service: Nome do serviço (registrado na camada persistente)
+            model: Nome do modelo (registrado na camada persistente)
+        """
+        if response is None or ttl <= 0:
+            return
+        
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._remember(key, response, expires_at)
+            self.stats["stores"] += 1
+            if self.database is None:
+                return
+            self._writes += 1
+            prune = self._writes % self.prune_interval == 0
+            accesses = None
+            if prune or len(self._accesses) >= self.access_flush_size:
+                accesses, self._accesses = self._accesses, {}
+        
+        try:
+            self.database.set_cached_response(key, service, model, response, expires_at)
+            if accesses:
+                self.database.touch_cached_responses(accesses.items())
+            if prune:
+                self.database.prune_response_cache(self.max_persistent_entries)
+        except sqlite3.Error as e:
+            # A resposta continua na camada em memória
+            logger.warning(f"Camada persistente do cache indisponível na gravação: {e}")
+            with self._lock:
+                self.stats["persistent_errors"] += 1
+    
+    def _remember(self, key, response, expires_at):
+        """Guarda a resposta na camada em memória (chamado com o lock adquirido)"""
+        self._entries[key] = (response, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+    
+    def clear(self, persistent=False):
+        """
+        Esvazia o cache
+        
+        Args:
+            persistent: Se True, também apaga a camada persistente
+        """
+        with self._lock:
+            self._entries.clear()
+            self._accesses.clear()
+        
+        if persistent and self.database is not None:
+            self.database.prune_response_cache(0)
+    
+    def get_stats(self):
+        """
+        Retorna as estatísticas de uso do cache
+        
+        Returns:
+            Dicionário com acertos por camada, falhas, gravações, remoções,
+            erros da camada persistente, taxa de acerto e número de respostas
+            em memória
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._entries)
+        
+        lookups = stats["memory_hits"] + stats["persistent_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["persistent_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+class SemanticCache:
+    """Cache de respostas de textos parecidos, com busca aproximada de vizinhos (LSH) em memória"""
+    
+    def __init__(self, max_entries=10000, embed=None, tables=32, bits=12, seed=0):
+        """
+        Inicializa o cache
+        
+        Os vetores dos textos são distribuídos em tables tabelas de hash pelo
+        lado de bits hiperplanos aleatórios em que caem; textos parecidos
+        tendem a cair no mesmo balde em pelo menos uma tabela, e só os textos
+        desses baldes têm a similaridade calculada.
+        
+        Um texto parecido só é aceito se passar pela comparação das palavras
+        (ver _compatible): com o embed_text padrão, as palavras que não são
+        de ligação precisam ser as mesmas; com um modelo de embeddings, textos
+        que diferem em uma negação ou em um prefixo de negação são recusados.
+        
+        Args:
+            max_entries: Número máximo de respostas guardadas
+            embed: Função que converte um texto em um vetor normalizado
+                   (opcional, usa embed_text; pode ser um modelo de embeddings
+                   local, necessário para reaproveitar perguntas reformuladas)
+            tables: Número de tabelas de hash
+            bits: Número de hiperplanos de cada tabela
+            seed: Semente dos hiperplanos aleatórios
+        """
+        if np is None:
+            raise ImportError("SemanticCache requer o pacote numpy (pip install numpy)")
+        
+        self.max_entries = max_entries
+        self.embed = embed or embed_text
+        # Com embed_text, textos reformulados não são reconhecidos
+        self.uses_model = embed is not None
+        self.tables = tables
+        self.bits = bits
+        self.seed = seed
+        # Hiperplanos e vetores são criados no primeiro texto, quando a dimensão é conhecida
+        self._planes = None
+        self._vectors = None
+        self._powers = 1 << np.arange(bits)
+        
+        # Cada resposta ocupa uma posição (slot) das matrizes de vetores e validades
+        self._expires = np.zeros(max_entries)
+        self._free = list(range(max_entries - 1, -1, -1))
+        # slot -> (resposta, baldes, palavras); a ordem é a de uso mais recente
+        self._entries = OrderedDict()
+        # (tabela, espaço, código) -> slots das respostas no balde
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "rejected": 0,
+            "stores": 0,
+            "evictions": 0
+        }
+    
+    def _vectorize(self, namespace, text):
+        """
+        Calcula o vetor de um texto e os baldes em que ele cai
+        
+        Args:
+            namespace: Espaço do texto
+            text: Texto
+        
+        Returns:
+            Tupla (vetor, lista de chaves dos baldes)
+        """
+        vector = np.asarray(self.embed(text), dtype=np.float32)
+        with self._lock:
+            if self._planes is None:
+                rng = np.random.default_rng(self.seed)
+                self._planes = rng.standard_normal((self.tables, self.bits, len(vector))).astype(np.float32)
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+        
+        codes = ((self._planes @ vector) > 0) @ self._powers
+        return vector, [(table, namespace, int(code)) for table, code in enumerate(codes)]
+    
+    @staticmethod
+    def _words(text):
+        """Palavras de um texto, sem as de ligação, comparadas por _compatible"""
+        return frozenset(word for word in words(text) if word not in _STOPWORDS)
+    
+    def _compatible(self, query_words, cached_words):
+        """
+        Verifica se as palavras de dois textos parecidos permitem reaproveitar a resposta
+        
+        Args:
+            query_words: Palavras do texto da consulta (ver _words)
+            cached_words: Palavras do texto guardado
+        
+        Returns:
+            True se a resposta guardada pode ser reaproveitada
+        """
+        if not self.uses_model:
+            return query_words == cached_words
+        
+        if (query_words & _NEGATIONS) != (cached_words & _NEGATIONS):
+            return False
+        # Uma palavra com prefixo de negação e o radical de outra ("desinstalar"/"instalo")
+        different = query_words ^ cached_words
+        for word in different:
+            for prefix in _NEGATING_PREFIXES:
+                stem = word[len(prefix):len(prefix) + _STEM_LENGTH]
+                if word.startswith(prefix) and len(stem) == _STEM_LENGTH and \
+                        any(other.startswith(stem) for other in different if other != word):
+                    return False
+        return True
+    
+    def get(self, namespace, text, threshold):
+        """
+        Recupera a resposta guardada para o texto mais parecido
+        
+        Args:
+            namespace: Espaço da consulta (função, serviço e parâmetros); só
+                       textos do mesmo espaço são comparados
+            text: Texto da consulta
+            threshold: Similaridade (cosseno) mínima, de 0.0 a 1.0
+        
+        Returns:
+            Resposta guardada ou None se não houver texto parecido o bastante
+        """
+        vector, buckets = self._vectorize(namespace, text)
+        query_words = self._words(text)
+        now = time.time()
+        with self._lock:
+            candidates = set()
+            for bucket in buckets:
+                candidates.update(self._buckets.get(bucket, ()))
+            slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            
+            alive = self._expires[slots] > now
+            for slot in slots[~alive]:
+                self._remove(int(slot))
+            slots = slots[alive]
+            
+            similarities = self._vectors[slots] @ vector
+            for best in np.argsort(-similarities, kind="stable"):
+                if similarities[best] < threshold:
+                    break
+                slot = int(slots[best])
+                if not self._compatible(query_words, self._entries[slot][2]):
+                    self.stats["rejected"] += 1
+                    continue
+                
+                self._entries.move_to_end(slot)
+                self.stats["hits"] += 1
+                logger.debug(f"Acerto no cache semântico ({namespace}) com similaridade {similarities[best]:.3f}")
+                return self._entries[slot][0]
+            
+            self.stats["misses"] += 1
+            return None
+    
+    def set(self, namespace, text, response, ttl):
+        """
+        Guarda a resposta de um texto
+        
+        Args:
+            namespace: Espaço da consulta (ver get)
+            text: Texto da consulta
+            response: Resposta da IA
+            ttl: Tempo de vida em segundos
+        """
+        if response is None or ttl <= 0:
+            return
+        
+        vector, buckets = self._vectorize(namespace, text)
+        text_words = self._words(text)
+        with self._lock:
+            if not self._free:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+            
+            slot = self._free.pop()
+            self._vectors[slot] = vector
+            self._expires[slot] = time.time() + ttl
+            self._entries[slot] = (response, buckets, text_words)
+            for bucket in buckets:
+                self._buckets.setdefault(bucket, set()).add(slot)
+            self.stats["stores"] += 1
+    
+    def _remove(self, slot):
+        """Remove uma resposta e suas referências nos baldes (chamado com o lock adquirido)"""
+        _, buckets, _ = self._entries.pop(slot)
+        for bucket in buckets:
+            members = self._buckets[bucket]
+            members.discard(slot)
+            if not members:
+                del self._buckets[bucket]
+        self._expires[slot] = 0.0
+        self._free.append(slot)
+    
+    def clear(self):
+        """Esvazia o cache"""
+        with self._lock:
+            for slot in list(self._entries):
+                self._remove(slot)
+    
+    def get_stats(self):
+        """
+        Retorna as estatísticas de uso do cache
+        
+        Returns:
+            Dicionário com acertos, falhas, textos parecidos recusados pela
+            comparação das palavras, gravações, remoções, taxa de acerto e
+            número de respostas guardadas
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def load_embedding_model(model_name=DEFAULT_EMBEDDING_MODEL):
+    """
+    Carrega um modelo de embeddings local com o sentence-transformers
+    
+    Args:
+        model_name: Nome do modelo no sentence-transformers ou caminho local
+    
+    Returns:
+        Função que converte um texto em um vetor normalizado, ou None se o
+        pacote não estiver instalado ou o modelo não puder ser carregado
+    """
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        logger.info("sentence-transformers não instalado; cache semântico desativado "
+                    "(pip install sentence-transformers para ativá-lo)")
+        return None
+    
+    try:
+        model = SentenceTransformer(model_name)
+    except Exception as e:
+        logger.warning(f"Não foi possível carregar o modelo de embeddings {model_name}: {e}")
+        return None
+    
+    def embed(text):
+        return model.encode(text, normalize_embeddings=True)
+    
+    logger.info(f"Modelo de embeddings {model_name} carregado para o cache semântico")
+    return embed
+
+
+def create_semantic_cache(model_name=DEFAULT_EMBEDDING_MODEL, **kwargs):
+    """
+    Cria o cache semântico com um modelo de embeddings local, se houver
+    
+    Args:
+        model_name: Nome do modelo (ver load_embedding_model)
+        **kwargs: Demais argumentos de SemanticCache
+    
+    Returns:
+        SemanticCache com o modelo, ou None se numpy ou o modelo não estiverem disponíveis
+    """
+    if np is None:
+        return None
+    
+    embed = load_embedding_model(model_name)
+    if embed is None:
+        return None
+    return SemanticCache(embed=embed, **kwargs)
+
+
+class SingleFlight:
+    """Agrupa chamadas idênticas simultâneas em uma única execução"""
+    
+    # Intervalo, em segundos, entre verificações do cancel_event de quem espera
+    CANCEL_POLL_INTERVAL = 0.05
+    
+    def __init__(self):
+        """Inicializa o agrupador"""
+        # chave -> dados da execução em andamento
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"upstream_calls": 0, "saved": 0, "cancelled": 0}
+    
+    def do(self, key, func, cancel_event=None):
+        """
+        Executa func, ou espera o resultado de uma execução igual em andamento
+        
+        Args:
+            key: Chave que identifica chamadas equivalentes
+            func: Função sem argumentos que faz a chamada
+            cancel_event: threading.Event do chamador; se a execução compartilhada
+                          terminar sem resultado por ter sido cancelada, os demais
+                          chamadores executam a chamada por conta própria. Quem
+                          espera a execução de outro para de esperar quando o
+                          seu é sinalizado
+            
+        Returns:
+            Resultado de func (None para quem desistiu de esperar)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None, "cancelled": False}
+                self._calls[key] = call
+                self.stats["upstream_calls"] += 1
+            else:
+                self.stats["saved"] += 1
+        
+        if not leader:
+            if cancel_event is None:
+                call["done"].wait()
+            else:
+                while not call["done"].wait(self.CANCEL_POLL_INTERVAL):
+                    if cancel_event.is_set():
+                        with self._lock:
+                            self.stats["saved"] -= 1
+                            self.stats["cancelled"] += 1
+                        return None
+            if call["cancelled"]:
+                with self._lock:
+                    self.stats["saved"] -= 1
+                return self.do(key, func, cancel_event)
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+        
+        try:
+            call["result"] = func()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            call["cancelled"] = (
+                call["result"] is None and call["error"] is None
+                and cancel_event is not None and cancel_event.is_set()
+            )
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+    
+    def get_stats(self):
+        """
+        Retorna as estatísticas do agrupador
+        
+        Returns:
+            Dicionário com chamadas executadas, chamadas economizadas,
+            esperas canceladas e execuções em andamento
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+
+# Resultado de uma execução assíncrona cancelada pelo chamador que a iniciou
+_CANCELLED = object()
+
+
+class AsyncSingleFlight:
+    """Versão assíncrona do SingleFlight, para corrotinas de um mesmo event loop"""
+    
+    def __init__(self):
+        """Inicializa o agrupador"""
+        self._calls = {}
+        self.stats = {"upstream_calls": 0, "saved": 0}
+    
+    async def do(self, key, factory):
+        """
+        Executa factory(), ou espera o resultado de uma execução igual em andamento
+        
+        Args:
+            key: Chave que identifica chamadas equivalentes
+            factory: Função sem argumentos que retorna a corrotina da chamada
+            
+        Returns:
+            Resultado da corrotina
+        """
+        future = self._calls.get(key)
+        if future is not None:
+            self.stats["saved"] += 1
+            # shield: cancelar quem espera não cancela a execução compartilhada
+            result = await asyncio.shield(future)
+            if result is _CANCELLED:
+                self.stats["saved"] -= 1
+                return await self.do(key, factory)
+            return result
+        
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.stats["upstream_calls"] += 1
+        try:
+            result = await factory()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.set_result(_CANCELLED)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Marca a exceção como lida caso ninguém esteja esperando
+            future.exception()
+            raise
+        finally:
+            del self._calls[key]
+    
+    def get_stats(self):
+        """
+        Retorna as estatísticas do agrupador
+        
+        Returns:
+            Dicionário com chamadas executadas, chamadas economizadas e
+            execuções em andamento
+        """
+        stats = dict(self.stats)
+        stats["in_flight"] = len(self._calls)
+        return stats
@@ -4,13 +4,23 @@ Este módulo implementa o sistema de comunicação com outras IAs para a IA NOVA
 permitindo que ela interaja com diferentes modelos de IA e serviços externos.
 """
 
-import requests
 import json
+import hashlib
 import time
 import os
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED, TimeoutError as FuturesTimeoutError
 from datetime import datetime
 
+from transporte_http import get_transport
+from cache_respostas import ResponseCache, SingleFlight, CACHE_TTLS, SEMANTIC_CACHE_HELPERS, create_semantic_cache
+from resiliencia import (
+    APIError, RetryPolicy, CircuitBreaker, CircuitOpenError, HedgeBudget,
+    RateLimiter, RateLimitExceeded, parse_retry_after
+)
+from roteador_ia import ProviderRouter
+
 # Configuração de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -23,17 +33,124 @@ logging.basicConfig(
 
 logger = logging.getLogger("NOVA_AI_Communication")
 
+# Nomes dos serviços usados nas mensagens de erro
+PROVIDER_LABELS = {
+    "openai": "OpenAI",
+    "huggingface": "Hugging Face",
+    "anthropic": "Anthropic",
+    "gemini": "Gemini",
+    "ollama_local": "Ollama local",
+    "custom_ia": "personalizada"
+}
+
+# Limites de taxa de cada serviço no lado do cliente (ajuste ao plano contratado)
+RATE_LIMITS = {
+    "openai": {"requests_per_minute": 500, "tokens_per_minute": 200000},
+    "anthropic": {"requests_per_minute": 50, "tokens_per_minute": 40000},
+    "gemini": {"requests_per_minute": 60, "tokens_per_minute": 1000000},
+    "huggingface": {"requests_per_minute": 60},
+    "custom_ia": {"requests_per_minute": 120}
+}
+
+# Prompts das funções auxiliares, compartilhados por AIComm e AsyncAIComm
+PROMPTS = {
+    "translate": "Traduza o seguinte texto de {source_lang} para {target_lang}:\n\n{text}",
+    "summarize": "Resume o seguinte texto em no máximo {max_length} caracteres:\n\n{text}",
+    "sentiment": "Analise o sentimento do seguinte texto e responda apenas com 'positivo', 'negativo' ou 'neutro':\n\n{text}",
+    "keywords": "Extraia as 5 principais palavras-chave do seguinte texto, separadas por vírgula:\n\n{text}",
+    "answer_with_context": "Com base no seguinte contexto, responda à pergunta:\n\nContexto: {context}\n\nPergunta: {question}",
+    "answer": "Responda à seguinte pergunta: {question}",
+    "sentiment_batch": "Analise o sentimento de cada um dos {count} textos numerados abaixo. Responda apenas com "
+                       "um array JSON de {count} elementos, na ordem dos textos, cada um 'positivo', 'negativo' "
+                       "ou 'neutro':\n\n{items}",
+    "keywords_batch": "Extraia as 5 principais palavras-chave de cada um dos {count} textos numerados abaixo. "
+                      "Responda apenas com um array JSON de {count} elementos, na ordem dos textos, cada um "
+                      "uma lista com as palavras-chave do texto:\n\n{items}"
+}
+
+# Serviços com suporte a respostas em streaming
+STREAMING_SERVICES = ("openai", "huggingface", "anthropic", "gemini", "ollama_local")
+
+# Intervalo, em segundos, entre verificações do cancelamento do chamador
+# enquanto uma consulta com hedge espera pelas respostas
+HEDGE_CANCEL_POLL = 0.05
+
+# Tamanho máximo de cada lote das funções em lote, em tokens estimados de
+# entrada (textos) e de saída (respostas); os limites de saída acompanham o
+# max_tokens das requisições e os de entrada, o contexto dos modelos padrão
+BATCH_LIMITS = {
+    "openai": {"input_tokens": 8000, "output_tokens": 2000},
+    "anthropic": {"input_tokens": 8000, "output_tokens": 900},
+    "gemini": {"input_tokens": 8000, "output_tokens": 900},
+    "ollama_local": {"input_tokens": 1500, "output_tokens": 500},
+    "huggingface": {"input_tokens": 800, "output_tokens": 200},
+    "custom_ia": {"input_tokens": 2000, "output_tokens": 500}
+}
+
+# Tokens de saída estimados por item de cada tarefa em lote
+BATCH_OUTPUT_TOKENS = {
+    "sentiment": 4,
+    "keywords": 30
+}
+
 class AIComm:
     """Sistema de comunicação com outras IAs"""
     
-    def __init__(self, database):
+    def __init__(self, database, transport=None, cache=None, retry_policy=None, breaker_options=None,
+                 rate_limits=None, knowledge_index=None, semantic_cache=None):
         """
         Inicializa o sistema de comunicação com outras IAs
         
         Args:
             database: Instância do banco de dados
+            transport: Transporte HTTP (opcional, usa o compartilhado por padrão)
+            cache: Cache de respostas (opcional, cria um no banco de dados por padrão)
+            retry_policy: Política de novas tentativas (opcional)
+            breaker_options: Argumentos dos disjuntores de cada serviço (opcional)
+            rate_limits: Limites de taxa por serviço, substituindo os de RATE_LIMITS (opcional)
+            knowledge_index: Índice vetorial do conhecimento (KnowledgeIndex), usado
+                             por answer_question quando não recebe contexto (opcional)
+            semantic_cache: Cache semântico (SemanticCache) das funções auxiliares
+                            listadas em semantic_helpers (opcional; answer só o
+                            usa com um modelo de embeddings, ver
+                            cache_respostas.create_semantic_cache)
         """
         self.database = database
+        self.http = transport or get_transport()
+        self.cache = cache if cache is not None else ResponseCache(database)
+        self.retry_policy = retry_policy or RetryPolicy()
+        
+        # Um disjuntor por serviço, criado no primeiro uso
+        self.breaker_options = breaker_options or {}
+        self.circuit_breakers = {}
+        self._breakers_lock = threading.Lock()
+        
+        # Um limitador de taxa por serviço, também criado no primeiro uso
+        self.rate_limits = dict(RATE_LIMITS)
+        self.rate_limits.update(rate_limits or {})
+        self.rate_limiters = {}
+        
+        # Escolhe o serviço das consultas com service="auto"
+        self.router = ProviderRouter(self)
+        
+        # Limita as requisições de reserva das consultas com hedge
+        self.hedge_budget = HedgeBudget()
+        
+        # Consultas idênticas simultâneas compartilham uma única requisição
+        self.single_flight = SingleFlight()
+        
+        # Fonte do contexto de answer_question
+        self.knowledge_index = knowledge_index
+        
+        # Funções auxiliares que reaproveitam respostas de textos parecidos; as
+        # que exigem um modelo de embeddings ficam de fora sem ele
+        self.semantic_cache = semantic_cache
+        self.semantic_helpers = {
+            helper: settings for helper, settings in SEMANTIC_CACHE_HELPERS.items()
+            if semantic_cache is None or semantic_cache.uses_model or not settings.get("requires_model")
+        }
+        if semantic_cache is not None and len(self.semantic_helpers) < len(SEMANTIC_CACHE_HELPERS):
+            logger.info("Cache semântico sem modelo de embeddings: perguntas reformuladas usam só o cache exato")
         self.api_endpoints = {
             "openai": "https://api.openai.com/v1/chat/completions",
             "huggingface": "https://api-inference.huggingface.co/models/",
@@ -73,121 +190,460 @@ class AIComm:
         else:
             logger.warning(f"Serviço desconhecido: {service}")
     
-    def query_external_ia(self, service, prompt, model=None, max_retries=3, retry_delay=2):
+    def query_external_ia(self, service, prompt, model=None, max_retries=None, retry_delay=None, cancel_event=None,
+                          cache_ttl=None, hedge=False):
         """
         Consulta uma IA externa
         
         Args:
-            service: Nome do serviço
+            service: Nome do serviço, ou "auto" para escolher pelo roteador
+                     (nesse caso o modelo padrão de cada serviço é usado)
             prompt: Prompt para a IA
             model: Nome do modelo (opcional)
-            max_retries: Número máximo de tentativas
-            retry_delay: Atraso entre tentativas em segundos
+            max_retries: Número máximo de tentativas (opcional, substitui o da política)
+            retry_delay: Espera base entre tentativas em segundos (opcional, substitui a da política)
+            cancel_event: threading.Event que, quando sinalizado, interrompe
+                          as novas tentativas (opcional)
+            cache_ttl: Tempo de vida da resposta no cache em segundos
+                       (opcional, sem ele o cache não é usado)
+            hedge: Se True, repete a consulta ao mesmo serviço (em outra conexão)
+                   quando ele não responde dentro do seu p95; se for o nome de
+                   outro serviço, a repetição vai para ele. A primeira resposta
+                   vale e o número de repetições é limitado por hedge_budget
             
         Returns:
             Resposta da IA ou None se houver erro
         """
-        if service not in self.api_endpoints:
-            logger.error(f"Serviço não suportado: {service}")
-            return None
+        if service == "auto":
+            return self.query_routed(prompt, cache_ttl=cache_ttl, cancel_event=cancel_event)
         
-        if not self.api_keys.get(service) and service != "ollama_local":
-            logger.error(f"Chave de API não configurada para {service}")
+        if not self._can_query(service):
             return None
         
+        key = self._cache_key(service, prompt, model)
+        if cache_ttl:
+            response = self.cache.get(key)
+            if response is not None:
+                return response
+        
+        response = self.single_flight.do(
+            (key, hedge),
+            lambda: self._query_uncached(service, prompt, model, max_retries, retry_delay, cancel_event, hedge),
+            cancel_event=cancel_event
+        )
+        
+        if cache_ttl:
+            self.cache.set(key, response, cache_ttl, service=service, model=model)
+        return response
+    
+    def _query_uncached(self, service, prompt, model=None, max_retries=None, retry_delay=None, cancel_event=None,
+                        hedge=False):
+        """
+        Consulta o serviço, com novas tentativas, sem passar pelo cache nem pelo agrupamento
+        
+        Args:
+            service: Nome do serviço
+            prompt: Prompt para a IA
+            model: Nome do modelo (opcional)
+            max_retries: Número máximo de tentativas (opcional)
+            retry_delay: Espera base entre tentativas em segundos (opcional)
+            cancel_event: threading.Event que interrompe as novas tentativas (opcional)
+            hedge: Ver query_external_ia
+            
+        Returns:
+            Resposta da IA ou None se houver erro
+        """
+        if hedge:
+            backup = service if hedge is True else hedge
+            return self._query_hedged(prompt, service, backup, model=model, max_retries=max_retries,
+                                      retry_delay=retry_delay, cancel_event=cancel_event)
+        
+        policy = self.retry_policy.with_overrides(max_attempts=max_retries, base_delay=retry_delay)
+        started = time.monotonic()
+        
         # Configuração específica para cada serviço
-        for attempt in range(max_retries):
+        for attempt in range(policy.max_attempts):
+            if cancel_event is not None and cancel_event.is_set():
+                logger.debug(f"Consulta a {service} cancelada")
+                return None
+            
+            # Com o circuito aberto a consulta falha na hora, sem gastar tempo nem cota;
+            # caso contrário, espera sua vez na fila do limitador de taxa
+            breaker = self.get_circuit_breaker(service)
+            if not breaker.allow_request():
+                logger.warning(f"Circuito de {service} aberto, consulta recusada")
+                return None
+            if not self._wait_rate_limit(service, prompt, cancel_event):
+                breaker.release()
+                return None
+            
+            call_started = time.monotonic()
             try:
-                if service == "openai":
-                    return self._query_openai(prompt, model)
-                elif service == "huggingface":
-                    return self._query_huggingface(prompt, model)
-                elif service == "anthropic":
-                    return self._query_anthropic(prompt, model)
-                elif service == "gemini":
-                    return self._query_gemini(prompt, model)
-                elif service == "ollama_local":
-                    return self._query_ollama_local(prompt, model)
-                elif service == "custom_ia":
-                    return self._query_custom_ia(prompt)
-                else:
-                    logger.error(f"Serviço não implementado: {service}")
-                    return None
+                response = self._call_service(service, prompt, model)
+                self._record_outcome(breaker, call_started)
+                return response
             except Exception as e:
-                logger.error(f"Erro ao consultar {service} (tentativa {attempt+1}/{max_retries}): {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
+                self._record_outcome(breaker, call_started, e)
+                delay = policy.next_delay(attempt, e, started)
+                if delay is None:
+                    logger.error(f"Erro ao consultar {service} (tentativa {attempt+1}/{policy.max_attempts}): {e}")
+                    return None
+                
+                logger.warning(
+                    f"Erro ao consultar {service} (tentativa {attempt+1}/{policy.max_attempts}): {e}; "
+                    f"nova tentativa em {delay:.2f}s"
+                )
+                if cancel_event is not None:
+                    cancel_event.wait(delay)
+                else:
+                    time.sleep(delay)
+    
+    def query_routed(self, prompt, services=None, strategy="fastest", cache_ttl=None, cancel_event=None):
+        """
+        Consulta o serviço escolhido pelo roteador, passando ao próximo se ele falhar
+        
+        Args:
+            prompt: Prompt para a IA
+            services: Serviços considerados (opcional, usa todos os configurados)
+            strategy: Estratégia de roteamento
+                      "fastest": Serviço de menor custo esperado (latência, erros e preço)
+                      "weighted": Sorteio ponderado pela pontuação, espalhando a carga
+                      "hedged": Como "fastest", mas aciona o segundo colocado se o
+                                primeiro não responder dentro do seu p95
+            cache_ttl: Tempo de vida da resposta no cache em segundos (opcional)
+            cancel_event: threading.Event que interrompe as consultas (opcional)
+            
+        Returns:
+            Resposta da IA ou None se nenhum serviço responder
+        """
+        ranked = self.router.rank(services, prompt, strategy)
+        if not ranked:
+            logger.warning("Nenhum serviço disponível para roteamento")
+            return None
+        
+        if strategy == "hedged" and len(ranked) > 1:
+            response = self._query_hedged(prompt, ranked[0], ranked[1], cache_ttl=cache_ttl,
+                                          cancel_event=cancel_event)
+            if response is not None:
+                return response
+            ranked = ranked[2:]
+        
+        for service in ranked:
+            response = self.query_external_ia(service, prompt, cancel_event=cancel_event, cache_ttl=cache_ttl)
+            if response is not None:
+                return response
+            logger.info(f"Sem resposta de {service}, tentando o próximo serviço")
+        
+        return None
+    
+    def _query_hedged(self, prompt, primary, backup, model=None, max_retries=None, retry_delay=None,
+                      cache_ttl=None, cancel_event=None):
+        """
+        Consulta o serviço principal e, se ele demorar mais que seu p95, também o reserva
+        
+        Se o principal falhar antes do p95, o reserva é consultado em seguida
+        (a menos que seja o mesmo serviço, que já esgotou suas tentativas).
+        As duas consultas não passam pelo agrupamento de consultas idênticas,
+        que juntaria a reserva à principal (ou a uma principal abandonada).
+        
+        Args:
+            prompt: Prompt para a IA
+            primary: Serviço principal
+            backup: Serviço acionado se o principal demorar (pode ser o mesmo)
+            model: Nome do modelo do serviço principal (opcional)
+            max_retries: Número máximo de tentativas de cada consulta (opcional)
+            retry_delay: Espera base entre tentativas em segundos (opcional)
+            cache_ttl: Tempo de vida da resposta no cache em segundos (opcional)
+            cancel_event: threading.Event que interrompe as consultas (opcional)
+            
+        Returns:
+            Primeira resposta válida ou None
+        """
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        
+        backup_model = model if backup == primary else None
+        if cache_ttl:
+            response = self.cache.get(self._cache_key(primary, prompt, model))
+            if response is not None:
+                return response
+        
+        def finish(service, service_model, response):
+            if cache_ttl:
+                key = self._cache_key(service, prompt, service_model)
+                self.cache.set(key, response, cache_ttl, service=service, model=service_model)
+            return response
+        
+        self.hedge_budget.record_request()
+        
+        # Evento próprio para cancelar a consulta mais lenta, também sinalizado
+        # quando o chamador cancela
+        hedge_cancel = threading.Event()
+        
+        def wait_first(pending, timeout=None):
+            """Espera a primeira consulta terminar (ou o timeout), atento ao cancelamento do chamador"""
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while cancel_event is None or not cancel_event.is_set():
+                step = HEDGE_CANCEL_POLL if deadline is None else min(HEDGE_CANCEL_POLL, deadline - time.monotonic())
+                if step <= 0:
+                    return set()
+                done, _ = wait(pending, timeout=step, return_when=FIRST_COMPLETED)
+                if done:
+                    return done
+            logger.debug("Consulta com hedge cancelada pelo chamador")
+            return None
+        
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="nova_hedge")
+        try:
+            first = executor.submit(self._query_uncached, primary, prompt, model,
+                                    max_retries, retry_delay, hedge_cancel)
+            done = wait_first({first}, self.router.hedge_delay(primary))
+            if done is None:
+                return None
+            futures = []
+            if not done:
+                if self.hedge_budget.try_acquire():
+                    logger.debug(f"{primary} sem resposta no p95, acionando {backup}")
+                    futures = [first]
                 else:
+                    logger.debug(f"Orçamento de hedge esgotado, aguardando {primary}")
+                    if wait_first({first}) is None:
+                        return None
+            if not futures:
+                response = first.result()
+                if response is not None or backup == primary:
+                    return finish(primary, model, response)
+            
+            second = executor.submit(self._query_uncached, backup, prompt, backup_model,
+                                     max_retries, retry_delay, hedge_cancel)
+            futures.append(second)
+            pending = set(futures)
+            while pending:
+                done = wait_first(pending)
+                if done is None:
                     return None
+                for future in done:
+                    pending.discard(future)
+                    response = future.result()
+                    if response is not None:
+                        if future is second:
+                            if len(futures) > 1:
+                                self.hedge_budget.record_win()
+                            return finish(backup, backup_model, response)
+                        return finish(primary, model, response)
+            return None
+        finally:
+            # A consulta mais lenta (ou cancelada) não faz novas tentativas nem
+            # espera pelo limite de taxa, e seu resultado é descartado
+            hedge_cancel.set()
+            executor.shutdown(wait=False)
     
-    def _query_openai(self, prompt, model=None):
+    def _call_service(self, service, prompt, model=None):
         """
-        Consulta a API da OpenAI
+        Faz uma única consulta ao serviço, sem novas tentativas
         
         Args:
+            service: Nome do serviço
             prompt: Prompt para a IA
-            model: Nome do modelo
+            model: Nome do modelo (opcional)
             
         Returns:
             Resposta da IA
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_keys['openai']}",
-            "Content-Type": "application/json"
-        }
+        if service == "openai":
+            return self._query_openai(prompt, model)
+        elif service == "huggingface":
+            return self._query_huggingface(prompt, model)
+        elif service == "anthropic":
+            return self._query_anthropic(prompt, model)
+        elif service == "gemini":
+            return self._query_gemini(prompt, model)
+        elif service == "ollama_local":
+            return self._query_ollama_local(prompt, model)
+        elif service == "custom_ia":
+            return self._query_custom_ia(prompt)
+        else:
+            logger.error(f"Serviço não implementado: {service}")
+            return None
+    
+    def get_circuit_breaker(self, service):
+        """
+        Retorna o disjuntor de um serviço, criando-o no primeiro uso
         
-        payload = {
-            "model": model or "gpt-3.5-turbo",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.7
-        }
+        Args:
+            service: Nome do serviço
+            
+        Returns:
+            Instância de CircuitBreaker
+        """
+        with self._breakers_lock:
+            breaker = self.circuit_breakers.get(service)
+            if breaker is None:
+                breaker = CircuitBreaker(service, **self.breaker_options)
+                self.circuit_breakers[service] = breaker
+            return breaker
+    
+    def get_circuit_states(self):
+        """
+        Retorna o estado dos disjuntores para monitoramento
         
-        response = requests.post(self.api_endpoints["openai"], headers=headers, json=payload, timeout=30)
+        Returns:
+            Dicionário com o estado de cada serviço já consultado
+        """
+        with self._breakers_lock:
+            breakers = dict(self.circuit_breakers)
+        return {service: breaker.get_state() for service, breaker in breakers.items()}
+    
+    def get_rate_limiter(self, service):
+        """
+        Retorna o limitador de taxa de um serviço, criando-o no primeiro uso
         
-        if response.status_code == 200:
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
-        else:
-            logger.error(f"Erro na API OpenAI: {response.status_code} - {response.text}")
-            raise Exception(f"Erro na API OpenAI: {response.status_code}")
+        Args:
+            service: Nome do serviço
+            
+        Returns:
+            Instância de RateLimiter
+        """
+        with self._breakers_lock:
+            limiter = self.rate_limiters.get(service)
+            if limiter is None:
+                limiter = RateLimiter(service, **self.rate_limits.get(service, {}))
+                self.rate_limiters[service] = limiter
+            return limiter
     
-    def _query_huggingface(self, prompt, model=None):
+    def get_coalescing_stats(self):
         """
-        Consulta a API da Hugging Face
+        Retorna as estatísticas do agrupamento de consultas idênticas
+        
+        Returns:
+            Dicionário com requisições enviadas, requisições economizadas e
+            consultas em andamento
+        """
+        return self.single_flight.get_stats()
+    
+    def get_rate_limit_stats(self):
+        """
+        Retorna as métricas dos limitadores de taxa para monitoramento
+        
+        Returns:
+            Dicionário com fila e espera de cada serviço já consultado
+        """
+        with self._breakers_lock:
+            limiters = dict(self.rate_limiters)
+        return {service: limiter.get_stats() for service, limiter in limiters.items()}
+    
+    def _estimate_request_tokens(self, prompt):
+        """
+        Estima os tokens de uma requisição (prompt + resposta esperada)
         
         Args:
             prompt: Prompt para a IA
-            model: Nome do modelo
             
         Returns:
-            Resposta da IA
+            Número estimado de tokens
+        """
+        return self.router.estimate_tokens(prompt) + self.router.expected_output_tokens
+    
+    def _wait_rate_limit(self, service, prompt, cancel_event=None):
         """
-        if not model:
-            model = "mistralai/Mistral-7B-Instruct-v0.2"
+        Espera a vez da consulta na fila do limitador de taxa do serviço
         
-        headers = {
-            "Authorization": f"Bearer {self.api_keys['huggingface']}",
-            "Content-Type": "application/json"
-        }
+        Se a espera for cancelada, a reserva volta para o limitador.
         
-        endpoint = f"{self.api_endpoints['huggingface']}{model}"
-        payload = {"inputs": prompt}
+        Args:
+            service: Nome do serviço
+            prompt: Prompt para a IA
+            cancel_event: threading.Event que interrompe a espera (opcional)
+            
+        Returns:
+            True se a consulta pode ser enviada
+        """
+        limiter = self.get_rate_limiter(service)
+        tokens = self._estimate_request_tokens(prompt)
+        wait = limiter.reserve(tokens)
+        if wait is None:
+            logger.warning(f"Fila do limitador de {service} cheia, consulta recusada")
+            return False
         
-        response = requests.post(endpoint, headers=headers, json=payload, timeout=30)
+        try:
+            if wait > 0:
+                logger.debug(f"Aguardando {wait:.2f}s pelo limite de taxa de {service}")
+                if cancel_event is None:
+                    time.sleep(wait)
+                elif cancel_event.wait(wait):
+                    limiter.refund(tokens)
+                    return False
+            return True
+        finally:
+            limiter.done_waiting(wait)
+    
+    def _record_outcome(self, breaker, started, error=None):
+        """
+        Registra no disjuntor o resultado de uma consulta
         
-        if response.status_code == 200:
-            result = response.json()
-            if isinstance(result, list) and len(result) > 0:
-                return result[0]["generated_text"]
-            else:
-                return str(result)
+        Um 429 (ou outra resposta com Retry-After) é limitação de taxa, não
+        falha do serviço: não conta para o disjuntor e apenas suspende o
+        limitador de taxa do serviço pelo tempo pedido, para que as demais
+        consultas não insistam. Compartilhado entre AIComm e AsyncAIComm.
+        
+        Args:
+            breaker: Disjuntor do serviço
+            started: Início da consulta (time.monotonic())
+            error: Exceção levantada pela consulta (opcional)
+        """
+        latency = time.monotonic() - started
+        if isinstance(error, APIError) and (error.status_code == 429 or error.retry_after is not None):
+            self.get_rate_limiter(breaker.name).pause(error.retry_after if error.retry_after is not None else 1.0)
+            breaker.release()
+            return
+        
+        # Erros do cliente (4xx) mostram que o serviço está respondendo
+        if error is None or (
+            isinstance(error, APIError) and error.status_code is not None
+            and not self.retry_policy.is_retryable(error)
+        ):
+            breaker.record_success(latency)
         else:
-            logger.error(f"Erro na API Hugging Face: {response.status_code} - {response.text}")
-            raise Exception(f"Erro na API Hugging Face: {response.status_code}")
+            breaker.record_failure(latency)
     
-    def _query_anthropic(self, prompt, model=None):
+    def _can_query(self, service):
         """
-        Consulta a API da Anthropic
+        Verifica se o serviço é suportado e tem chave de API configurada
+        
+        Args:
+            service: Nome do serviço
+            
+        Returns:
+            True se o serviço pode ser consultado
+        """
+        if service not in self.api_endpoints:
+            logger.error(f"Serviço não suportado: {service}")
+            return False
+        
+        if not self.api_keys.get(service) and service != "ollama_local":
+            logger.error(f"Chave de API não configurada para {service}")
+            return False
+        
+        return True
+    
+    def _cache_key(self, service, prompt, model=None):
+        """
+        Calcula a chave de cache (e de agrupamento) de uma consulta
+        
+        Args:
+            service: Nome do serviço
+            prompt: Prompt para a IA
+            model: Nome do modelo (opcional)
+            
+        Returns:
+            Chave de cache
+        """
+        request = self._build_request(service, prompt, model)
+        return self.cache.make_key(service, request["url"], request["payload"])
+    
+    def _query_openai(self, prompt, model=None):
+        """
+        Consulta a API da OpenAI
         
         Args:
             prompt: Prompt para a IA
@@ -196,26 +652,33 @@ class AIComm:
         Returns:
             Resposta da IA
         """
-        headers = {
-            "x-api-key": self.api_keys['anthropic'],
-            "anthropic-version": "2023-06-01",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": model or "claude-3-sonnet-20240229",
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": 1000
-        }
+        return self._send_request("openai", prompt, model)
+    
+    def _query_huggingface(self, prompt, model=None):
+        """
+        Consulta a API da Hugging Face
         
-        response = requests.post(self.api_endpoints["anthropic"], headers=headers, json=payload, timeout=30)
+        Args:
+            prompt: Prompt para a IA
+            model: Nome do modelo
+            
+        Returns:
+            Resposta da IA
+        """
+        return self._send_request("huggingface", prompt, model)
+    
+    def _query_anthropic(self, prompt, model=None):
+        """
+        Consulta a API da Anthropic
         
-        if response.status_code == 200:
-            result = response.json()
-            return result["content"][0]["text"]
-        else:
-            logger.error(f"Erro na API Anthropic: {response.status_code} - {response.text}")
-            raise Exception(f"Erro na API Anthropic: {response.status_code}")
+        Args:
+            prompt: Prompt para a IA
+            model: Nome do modelo
+            
+        Returns:
+            Resposta da IA
+        """
+        return self._send_request("anthropic", prompt, model)
     
     def _query_gemini(self, prompt, model=None):
         """
@@ -228,27 +691,7 @@ class AIComm:
         Returns:
             Resposta da IA
         """
-        model_name = model or "gemini-pro"
-        api_key = self.api_keys['gemini']
-        
-        endpoint = f"{self.api_endpoints['gemini']}{model_name}:generateContent?key={api_key}"
-        
-        payload = {
-            "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {
-                "temperature": 0.7,
-                "maxOutputTokens": 1000
-            }
-        }
-        
-        response = requests.post(endpoint, json=payload, timeout=30)
-        
-        if response.status_code == 200:
-            result = response.json()
-            return result["candidates"][0]["content"]["parts"][0]["text"]
-        else:
-            logger.error(f"Erro na API Gemini: {response.status_code} - {response.text}")
-            raise Exception(f"Erro na API Gemini: {response.status_code}")
+        return self._send_request("gemini", prompt, model)
     
     def _query_ollama_local(self, prompt, model=None):
         """
@@ -261,82 +704,398 @@ class AIComm:
         Returns:
             Resposta da IA
         """
-        payload = {
-            "model": model or "llama3",
-            "messages": [{"role": "user", "content": prompt}],
-            "stream": False
-        }
+        return self._send_request("ollama_local", prompt, model)
+    
+    def _query_custom_ia(self, prompt):
+        """
+        Consulta uma API personalizada
         
-        response = requests.post(self.api_endpoints["ollama_local"], json=payload, timeout=60)
+        Args:
+            prompt: Prompt para a IA
+            
+        Returns:
+            Resposta da IA
+        """
+        return self._send_request("custom_ia", prompt)
+    
+    def _send_request(self, service, prompt, model=None):
+        """
+        Envia o prompt a um serviço e interpreta a resposta
+        
+        Args:
+            service: Nome do serviço
+            prompt: Prompt para a IA
+            model: Nome do modelo (opcional)
+            
+        Returns:
+            Resposta da IA
+        """
+        request = self._build_request(service, prompt, model)
+        response = self.http.post(
+            request["url"],
+            headers=request["headers"],
+            json=request["payload"],
+            timeout=request["timeout"]
+        )
         
         if response.status_code == 200:
-            result = response.json()
-            return result["message"]["content"]
+            return self._parse_response(service, response.json())
         else:
-            logger.error(f"Erro na API Ollama local: {response.status_code} - {response.text}")
-            raise Exception(f"Erro na API Ollama local: {response.status_code}")
+            self._raise_api_error(service, response.status_code, response.text, response.headers)
     
-    def _query_custom_ia(self, prompt):
+    def stream_external_ia(self, service, prompt, model=None):
         """
-        Consulta uma API personalizada
+        Consulta uma IA externa recebendo a resposta em partes, à medida que é gerada
+        
+        Usa NDJSON no Ollama e Server-Sent Events nos demais serviços. Serviços
+        sem suporte a streaming (custom_ia) produzem a resposta inteira de uma vez.
+        Não há novas tentativas.
+        
+        A verificação do serviço, o limitador de taxa, o disjuntor e o envio
+        da requisição acontecem já nesta chamada, que levanta os erros deles
+        (ValueError para serviços não suportados ou sem chave de API,
+        RateLimitExceeded, CircuitOpenError, APIError...). Só a leitura da
+        resposta fica para o gerador, que deve ser consumido até o fim ou
+        fechado com close().
         
         Args:
+            service: Nome do serviço
             prompt: Prompt para a IA
+            model: Nome do modelo (opcional)
             
         Returns:
-            Resposta da IA
+            Gerador de trechos de texto da resposta
         """
-        headers = {}
-        if self.api_keys.get('custom_ia'):
-            headers["Authorization"] = f"Bearer {self.api_keys['custom_ia']}"
+        if not self._can_query(service):
+            raise ValueError(f"Serviço indisponível para streaming: {service}")
+        
+        breaker = self.get_circuit_breaker(service)
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"Circuito de {service} aberto, consulta recusada")
+        if not self._wait_rate_limit(service, prompt):
+            breaker.release()
+            raise RateLimitExceeded(f"Fila do limitador de {service} cheia, consulta recusada")
+        
+        started = time.monotonic()
+        response = None
+        try:
+            if service not in STREAMING_SERVICES:
+                text = self._send_request(service, prompt, model)
+            else:
+                request = self._build_request(service, prompt, model, stream=True)
+                response = self.http.post(
+                    request["url"],
+                    headers=request["headers"],
+                    json=request["payload"],
+                    timeout=request["timeout"],
+                    stream=True
+                )
+                if response.status_code != 200:
+                    self._raise_api_error(service, response.status_code, response.text, response.headers)
+        except Exception as e:
+            self._record_outcome(breaker, started, e)
+            if response is not None:
+                response.close()
+            raise
+        
+        # O disjuntor avalia o início da resposta (latência até o primeiro byte)
+        self._record_outcome(breaker, started)
+        if response is None:
+            return iter([text])
+        return self._iter_stream_response(service, response)
+    
+    def _iter_stream_response(self, service, response):
+        """
+        Produz os trechos de texto de uma resposta em streaming e a fecha no final
         
-        payload = {"prompt": prompt}
+        Args:
+            service: Nome do serviço
+            response: Resposta aberta com stream=True
+            
+        Yields:
+            Trechos de texto da resposta
+        """
+        try:
+            # SSE e NDJSON são sempre UTF-8, mesmo sem charset no Content-Type
+            if response.encoding is None:
+                response.encoding = "utf-8"
+            
+            for line in response.iter_lines(decode_unicode=True):
+                chunk = self._parse_stream_line(service, line)
+                if chunk:
+                    yield chunk
+        finally:
+            response.close()
+    
+    def _parse_stream_line(self, service, line):
+        """
+        Extrai o trecho de texto de uma linha de uma resposta em streaming
         
-        response = requests.post(self.api_endpoints["custom_ia"], headers=headers, json=payload, timeout=30)
+        Compartilhado entre AIComm e AsyncAIComm.
         
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("response", str(result))
+        Args:
+            service: Nome do serviço
+            line: Linha recebida (NDJSON no Ollama, SSE nos demais)
+            
+        Returns:
+            Trecho de texto ou None se a linha não contiver texto
+        """
+        if not line:
+            return None
+        
+        if service != "ollama_local":
+            # Server-Sent Events: só as linhas "data:" trazem conteúdo; o tipo
+            # do evento também vem dentro do JSON
+            if not line.startswith("data:"):
+                return None
+            line = line[5:].strip()
+            if line == "[DONE]":
+                return None
+        
+        event = json.loads(line)
+        
+        if service == "openai":
+            choices = event.get("choices") or [{}]
+            return choices[0].get("delta", {}).get("content")
+        elif service == "huggingface":
+            token = event.get("token", {})
+            return None if token.get("special") else token.get("text")
+        elif service == "anthropic":
+            if event.get("type") == "error":
+                raise APIError(service, None, f"Erro na API Anthropic: {event['error'].get('message')}")
+            if event.get("type") == "content_block_delta":
+                return event["delta"].get("text")
+            return None
+        elif service == "gemini":
+            parts = event["candidates"][0].get("content", {}).get("parts", [])
+            return "".join(part.get("text", "") for part in parts)
+        elif service == "ollama_local":
+            if event.get("error"):
+                raise APIError(service, None, f"Erro na API Ollama local: {event['error']}")
+            return event.get("message", {}).get("content")
+        return None
+    
+    def _raise_api_error(self, service, status_code, text, headers=None):
+        """
+        Registra e levanta o erro de uma resposta com status diferente de 200
+        
+        Args:
+            service: Nome do serviço
+            status_code: Status HTTP da resposta
+            text: Corpo da resposta
+            headers: Cabeçalhos da resposta, para ler o Retry-After (opcional)
+        """
+        label = PROVIDER_LABELS.get(service, service)
+        logger.error(f"Erro na API {label}: {status_code} - {text}")
+        retry_after = parse_retry_after(headers.get("Retry-After")) if headers else None
+        raise APIError(service, status_code, f"Erro na API {label}: {status_code}", retry_after=retry_after)
+    
+    def _build_request(self, service, prompt, model=None, stream=False):
+        """
+        Monta a requisição de um serviço
+        
+        Compartilhado entre AIComm e AsyncAIComm, que só diferem na forma de
+        enviar a requisição.
+        
+        Args:
+            service: Nome do serviço
+            prompt: Prompt para a IA
+            model: Nome do modelo (opcional)
+            stream: Se True, pede a resposta em streaming
+            
+        Returns:
+            Dicionário com url, headers, payload e timeout
+        """
+        headers = {"Content-Type": "application/json"}
+        url = self.api_endpoints[service]
+        timeout = 30
+        
+        if service == "openai":
+            headers["Authorization"] = f"Bearer {self.api_keys['openai']}"
+            payload = {
+                "model": model or "gpt-3.5-turbo",
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": 0.7
+            }
+        
+        elif service == "huggingface":
+            headers["Authorization"] = f"Bearer {self.api_keys['huggingface']}"
+            url = f"{url}{model or 'mistralai/Mistral-7B-Instruct-v0.2'}"
+            payload = {"inputs": prompt}
+        
+        elif service == "anthropic":
+            headers["x-api-key"] = self.api_keys['anthropic']
+            headers["anthropic-version"] = "2023-06-01"
+            payload = {
+                "model": model or "claude-3-sonnet-20240229",
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": 1000
+            }
+        
+        elif service == "gemini":
+            if stream:
+                url = f"{url}{model or 'gemini-pro'}:streamGenerateContent?alt=sse&key={self.api_keys['gemini']}"
+            else:
+                url = f"{url}{model or 'gemini-pro'}:generateContent?key={self.api_keys['gemini']}"
+            payload = {
+                "contents": [{"parts": [{"text": prompt}]}],
+                "generationConfig": {
+                    "temperature": 0.7,
+                    "maxOutputTokens": 1000
+                }
+            }
+        
+        elif service == "ollama_local":
+            timeout = 60
+            payload = {
+                "model": model or "llama3",
+                "messages": [{"role": "user", "content": prompt}],
+                "stream": stream
+            }
+        
+        elif service == "custom_ia":
+            if self.api_keys.get('custom_ia'):
+                headers["Authorization"] = f"Bearer {self.api_keys['custom_ia']}"
+            payload = {"prompt": prompt}
+        
+        else:
+            raise ValueError(f"Serviço não implementado: {service}")
+        
+        if stream and service in ("openai", "huggingface", "anthropic"):
+            payload["stream"] = True
+        
+        return {"url": url, "headers": headers, "payload": payload, "timeout": timeout}
+    
+    def _parse_response(self, service, result):
+        """
+        Extrai o texto da resposta JSON de um serviço
+        
+        Args:
+            service: Nome do serviço
+            result: Resposta JSON decodificada
+            
+        Returns:
+            Texto da resposta
+        """
+        if service == "openai":
+            return result["choices"][0]["message"]["content"]
+        elif service == "huggingface":
+            if isinstance(result, list) and len(result) > 0:
+                return result[0]["generated_text"]
+            return str(result)
+        elif service == "anthropic":
+            return result["content"][0]["text"]
+        elif service == "gemini":
+            return result["candidates"][0]["content"]["parts"][0]["text"]
+        elif service == "ollama_local":
+            return result["message"]["content"]
         else:
-            logger.error(f"Erro na API personalizada: {response.status_code} - {response.text}")
-            raise Exception(f"Erro na API personalizada: {response.status_code}")
+            return result.get("response", str(result))
+    
+    def _default_services(self):
+        """
+        Lista os serviços disponíveis para colaboração
+        
+        Returns:
+            Serviços com chaves configuradas e o Ollama local, exceto os de
+            circuito aberto
+        """
+        return [
+            s for s in self.api_endpoints.keys()
+            if (self.api_keys.get(s) or s == "ollama_local") and self.get_circuit_breaker(s).is_available()
+        ]
+    
+    def _query_services(self, prompt, services, deadline=None, first_valid=False):
+        """
+        Consulta vários serviços em paralelo
+        
+        Cada serviço é consultado em uma thread própria, de modo que o tempo
+        total é o do serviço mais lento (ou o prazo), e não a soma de todos.
+        Ao terminar, as consultas que ainda estão em andamento são canceladas:
+        as que não começaram não são enviadas e as demais não fazem novas
+        tentativas; seus resultados são descartados.
+        
+        Args:
+            prompt: Prompt para as IAs
+            services: Lista de serviços a consultar
+            deadline: Prazo total em segundos (opcional)
+            first_valid: Se True, retorna assim que a primeira resposta válida chegar
+            
+        Returns:
+            Dicionário com as respostas de cada serviço (None se não houver)
+        """
+        results = {service: None for service in services}
+        if not services:
+            return results
+        
+        cancel_event = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=len(services), thread_name_prefix="nova_ai")
+        futures = {
+            executor.submit(self.query_external_ia, service, prompt, cancel_event=cancel_event): service
+            for service in services
+        }
+        
+        try:
+            for future in as_completed(futures, timeout=deadline):
+                service = futures[future]
+                try:
+                    results[service] = future.result()
+                except Exception as e:
+                    logger.error(f"Erro ao consultar {service}: {e}")
+                
+                if first_valid and results[service]:
+                    break
+        except FuturesTimeoutError:
+            pending = [futures[f] for f in futures if not f.done()]
+            logger.warning(f"Prazo de {deadline}s esgotado sem resposta de: {', '.join(pending)}")
+        finally:
+            cancel_event.set()
+            for future in futures:
+                future.cancel()
+            # Não espera as consultas em andamento; as threads terminam sozinhas
+            executor.shutdown(wait=False)
+        
+        return results
     
-    def collaborate_with_external_ia(self, prompt, services=None):
+    def collaborate_with_external_ia(self, prompt, services=None, deadline=None):
         """
-        Consulta múltiplas IAs e combina os resultados
+        Consulta múltiplas IAs em paralelo e combina os resultados
         
         Args:
             prompt: Prompt para as IAs
             services: Lista de serviços a consultar (opcional)
+            deadline: Prazo total em segundos (opcional)
             
         Returns:
             Dicionário com as respostas de cada serviço
         """
         if not services:
             # Usa serviços com chaves configuradas ou Ollama local
-            services = [s for s in self.api_endpoints.keys() if self.api_keys.get(s) or s == "ollama_local"]
-        
-        results = {}
-        for service in services:
-            try:
-                results[service] = self.query_external_ia(service, prompt)
-            except Exception as e:
-                logger.error(f"Erro ao consultar {service}: {e}")
-                results[service] = None
-        
-        # Armazena os resultados no banco de dados para aprendizado
-        for service, result in results.items():
-            if result:
-                self.database.add_knowledge(
-                    topic=f"collaboration_{service}",
-                    content=result,
-                    source=service,
-                    confidence=0.8  # Confiança um pouco menor para conhecimento externo
-                )
+            services = self._default_services()
         
+        results = self._query_services(prompt, services, deadline=deadline)
+        self._store_collaboration(results)
         return results
     
-    def get_best_response(self, prompt, services=None, strategy="first_valid"):
+    def _store_collaboration(self, results):
+        """
+        Armazena as respostas válidas no banco de dados para aprendizado
+        
+        Args:
+            results: Dicionário com as respostas de cada serviço
+        """
+        self.database.add_knowledge_many(
+            {
+                "topic": f"collaboration_{service}",
+                "content": result,
+                "source": service,
+                "confidence": 0.8  # Confiança um pouco menor para conhecimento externo
+            }
+            for service, result in results.items()
+            if result
+        )
+    
+    def get_best_response(self, prompt, services=None, strategy="first_valid", deadline=None):
         """
         Obtém a melhor resposta entre várias IAs
         
@@ -344,14 +1103,30 @@ class AIComm:
             prompt: Prompt para as IAs
             services: Lista de serviços a consultar (opcional)
             strategy: Estratégia para escolher a melhor resposta
-                      "first_valid": Primeira resposta válida
+                      "first_valid": Primeira resposta válida a chegar; as
+                                     demais consultas são canceladas
                       "longest": Resposta mais longa
                       "all": Retorna todas as respostas
+                      "routed": Consulta apenas o serviço escolhido pelo roteador
+            deadline: Prazo total em segundos (opcional)
             
         Returns:
             Melhor resposta ou dicionário com todas as respostas
         """
-        responses = self.collaborate_with_external_ia(prompt, services)
+        if strategy == "routed":
+            return self.query_routed(prompt, services)
+        
+        if strategy == "first_valid":
+            results = self._query_services(prompt, services or self._default_services(), deadline=deadline, first_valid=True)
+            self._store_collaboration(results)
+            
+            for result in results.values():
+                if result:
+                    return result
+            logger.warning("Nenhuma resposta válida obtida")
+            return None
+        
+        responses = self.collaborate_with_external_ia(prompt, services, deadline=deadline)
         
         if strategy == "all":
             return responses
@@ -363,12 +1138,7 @@ class AIComm:
             logger.warning("Nenhuma resposta válida obtida")
             return None
         
-        if strategy == "first_valid":
-            # Retorna a primeira resposta válida
-            service = next(iter(valid_responses))
-            return valid_responses[service]
-        
-        elif strategy == "longest":
+        if strategy == "longest":
             # Retorna a resposta mais longa
             return max(valid_responses.values(), key=len)
         
@@ -389,8 +1159,8 @@ class AIComm:
         Returns:
             Texto traduzido
         """
-        prompt = f"Traduza o seguinte texto de {source_lang} para {target_lang}:\n\n{text}"
-        return self.query_external_ia(service, prompt)
+        prompt = PROMPTS["translate"].format(text=text, source_lang=source_lang, target_lang=target_lang)
+        return self._query_helper("translate", service, prompt, text, scope=f"{source_lang}>{target_lang}")
     
     def summarize_with_ai(self, text, max_length=200, service="openai"):
         """
@@ -404,8 +1174,8 @@ class AIComm:
         Returns:
             Texto resumido
         """
-        prompt = f"Resume o seguinte texto em no máximo {max_length} caracteres:\n\n{text}"
-        return self.query_external_ia(service, prompt)
+        prompt = PROMPTS["summarize"].format(text=text, max_length=max_length)
+        return self._query_helper("summarize", service, prompt, text, scope=str(max_length))
     
     def analyze_sentiment(self, text, service="openai"):
         """
@@ -418,8 +1188,8 @@ class AIComm:
         Returns:
             Análise de sentimento (positivo, negativo, neutro)
         """
-        prompt = f"Analise o sentimento do seguinte texto e responda apenas com 'positivo', 'negativo' ou 'neutro':\n\n{text}"
-        return self.query_external_ia(service, prompt)
+        prompt = PROMPTS["sentiment"].format(text=text)
+        return self._query_helper("sentiment", service, prompt, text)
     
     def extract_keywords(self, text, service="openai"):
         """
@@ -432,9 +1202,53 @@ class AIComm:
         Returns:
             Lista de palavras-chave
         """
-        prompt = f"Extraia as 5 principais palavras-chave do seguinte texto, separadas por vírgula:\n\n{text}"
-        response = self.query_external_ia(service, prompt)
+        prompt = PROMPTS["keywords"].format(text=text)
+        response = self._query_helper("keywords", service, prompt, text)
+        return self._split_keywords(response)
+    
+    def _query_helper(self, helper, service, prompt, text, scope=""):
+        """
+        Consulta a IA para uma função auxiliar, passando pelos caches
+        
+        O cache exato usa o TTL de CACHE_TTLS; se a função estiver em
+        semantic_helpers e houver cache semântico, a resposta de um texto
+        parecido o bastante é reaproveitada.
         
+        Args:
+            helper: Nome da função auxiliar (chave de CACHE_TTLS e semantic_helpers)
+            service: Serviço a ser usado
+            prompt: Prompt completo
+            text: Parte variável do prompt, comparada pelo cache semântico
+            scope: Demais parâmetros que mudam a resposta (idiomas, tamanho, contexto)
+            
+        Returns:
+            Resposta da IA ou None se houver erro
+        """
+        cache_ttl = CACHE_TTLS.get(helper)
+        settings = self.semantic_helpers.get(helper)
+        if self.semantic_cache is None or settings is None:
+            return self.query_external_ia(service, prompt, cache_ttl=cache_ttl)
+        
+        namespace = f"{helper}|{service}|{scope}"
+        response = self.semantic_cache.get(namespace, text, settings["threshold"])
+        if response is not None:
+            return response
+        
+        response = self.query_external_ia(service, prompt, cache_ttl=cache_ttl)
+        self.semantic_cache.set(namespace, text, response, settings["ttl"])
+        return response
+    
+    @staticmethod
+    def _split_keywords(response):
+        """
+        Extrai a lista de palavras-chave da resposta da IA
+        
+        Args:
+            response: Resposta da IA (ou None)
+            
+        Returns:
+            Lista de palavras-chave
+        """
         if response:
             # Tenta extrair as palavras-chave da resposta
             keywords = [kw.strip() for kw in response.split(',')]
@@ -442,24 +1256,279 @@ class AIComm:
         
         return []
     
-    def answer_question(self, question, context=None, service="ollama_local"):
+    def analyze_sentiment_many(self, texts, service="openai", max_batch_items=100, max_workers=4):
+        """
+        Analisa o sentimento de vários textos, agrupando-os em poucas consultas
+        
+        Args:
+            texts: Lista de textos a serem analisados
+            service: Serviço a ser usado
+            max_batch_items: Número máximo de textos por consulta
+            max_workers: Número de lotes consultados em paralelo
+            
+        Returns:
+            Lista com a análise de cada texto, na mesma ordem (None se falhar)
+        """
+        return self._classify_many("sentiment", texts, service, max_batch_items, max_workers)
+    
+    def extract_keywords_many(self, texts, service="openai", max_batch_items=50, max_workers=4):
+        """
+        Extrai palavras-chave de vários textos, agrupando-os em poucas consultas
+        
+        Args:
+            texts: Lista de textos para extração
+            service: Serviço a ser usado
+            max_batch_items: Número máximo de textos por consulta
+            max_workers: Número de lotes consultados em paralelo
+            
+        Returns:
+            Lista com as palavras-chave de cada texto, na mesma ordem
+        """
+        results = self._classify_many("keywords", texts, service, max_batch_items, max_workers)
+        return [keywords or [] for keywords in results]
+    
+    def _classify_many(self, task, texts, service, max_batch_items, max_workers):
+        """
+        Executa uma tarefa de classificação em lote
+        
+        Os textos já presentes no cache da função individual (analyze_sentiment
+        ou extract_keywords) não são consultados; os demais são agrupados em
+        lotes e cada resultado é guardado no cache da função individual.
+        
+        Args:
+            task: "sentiment" ou "keywords"
+            texts: Lista de textos
+            service: Serviço a ser usado
+            max_batch_items: Número máximo de textos por consulta
+            max_workers: Número de lotes consultados em paralelo
+            
+        Returns:
+            Lista com o resultado de cada texto, na mesma ordem
+        """
+        results = [None] * len(texts)
+        if not self._can_query(service):
+            return results
+        
+        pending = []
+        for index, text in enumerate(texts):
+            cached = self.cache.get(self._cache_key(service, PROMPTS[task].format(text=text)))
+            if cached is not None:
+                results[index] = self._split_keywords(cached) if task == "keywords" else cached
+            else:
+                pending.append((index, text))
+        
+        batches = self._plan_batches(task, service, pending, max_batch_items)
+        if batches:
+            logger.info(f"Consultando {service} em {len(batches)} lote(s) para {len(pending)} texto(s) ({task})")
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches) or 1))) as executor:
+            for batch_results in executor.map(lambda batch: self._query_batch(task, service, batch), batches):
+                for index, result in batch_results.items():
+                    results[index] = result
+        
+        return results
+    
+    def _plan_batches(self, task, service, items, max_batch_items):
+        """
+        Divide os itens em lotes que cabem nos limites de tokens do serviço
+        
+        Args:
+            task: Nome da tarefa (chave de BATCH_OUTPUT_TOKENS)
+            service: Nome do serviço
+            items: Lista de tuplas (índice, texto)
+            max_batch_items: Número máximo de itens por lote
+            
+        Returns:
+            Lista de lotes, cada um uma lista de tuplas (índice, texto)
+        """
+        limits = BATCH_LIMITS.get(service, BATCH_LIMITS["custom_ia"])
+        input_limit = limits["input_tokens"]
+        # Um lote não deve ocupar mais que metade da cota de tokens por minuto
+        tokens_per_minute = self.rate_limits.get(service, {}).get("tokens_per_minute")
+        if tokens_per_minute:
+            input_limit = min(input_limit, tokens_per_minute // 2)
+        
+        output_per_item = BATCH_OUTPUT_TOKENS[task]
+        max_items = max(1, min(max_batch_items, limits["output_tokens"] // output_per_item))
+        
+        batches = []
+        current = []
+        current_tokens = 0
+        for index, text in items:
+            # Número do item e separadores ocupam alguns tokens além do texto
+            tokens = self.router.estimate_tokens(text) + 3
+            if current and (len(current) >= max_items or current_tokens + tokens > input_limit):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append((index, text))
+            current_tokens += tokens
+        
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _query_batch(self, task, service, batch):
+        """
+        Consulta um lote e distribui a resposta entre os itens
+        
+        Se a resposta não puder ser interpretada (JSON inválido ou número de
+        elementos diferente do de itens), o lote é dividido ao meio e as metades
+        são consultadas de novo; um lote de um único item usa a função individual.
+        
+        Args:
+            task: "sentiment" ou "keywords"
+            service: Nome do serviço
+            batch: Lista de tuplas (índice, texto)
+            
+        Returns:
+            Dicionário índice -> resultado dos itens obtidos
+        """
+        if len(batch) == 1:
+            index, text = batch[0]
+            if task == "sentiment":
+                return {index: self.analyze_sentiment(text, service)}
+            return {index: self.extract_keywords(text, service)}
+        
+        prompt = self._batch_prompt(task, batch)
+        response = self.query_external_ia(service, prompt)
+        if response is None:
+            # O serviço falhou (já com novas tentativas); dividir só multiplicaria as falhas
+            return {}
+        
+        parsed = self._parse_batch_response(task, response, len(batch))
+        if parsed is None:
+            logger.warning(f"Resposta em lote inválida de {service}, dividindo o lote de {len(batch)} itens")
+            middle = len(batch) // 2
+            results = self._query_batch(task, service, batch[:middle])
+            results.update(self._query_batch(task, service, batch[middle:]))
+            return results
+        
+        results = {}
+        for (index, text), result in zip(batch, parsed):
+            self._cache_batch_item(task, service, text, result)
+            results[index] = result
+        return results
+    
+    @staticmethod
+    def _batch_prompt(task, batch):
+        """
+        Monta o prompt de um lote, com um texto numerado por linha
+        
+        Args:
+            task: "sentiment" ou "keywords"
+            batch: Lista de tuplas (índice, texto)
+            
+        Returns:
+            Prompt do lote
+        """
+        items = "\n".join(f"{number}. {' '.join(text.split())}" for number, (_, text) in enumerate(batch, 1))
+        return PROMPTS[f"{task}_batch"].format(count=len(batch), items=items)
+    
+    @staticmethod
+    def _parse_batch_response(task, response, count):
+        """
+        Interpreta a resposta de um lote
+        
+        Args:
+            task: "sentiment" ou "keywords"
+            response: Resposta da IA
+            count: Número de itens do lote
+            
+        Returns:
+            Lista com o resultado de cada item, ou None se a resposta for inválida
+        """
+        # Ignora texto ou blocos de código ao redor do array
+        start = response.find("[")
+        end = response.rfind("]")
+        if start == -1 or end < start:
+            return None
+        
+        try:
+            items = json.loads(response[start:end + 1])
+        except ValueError:
+            return None
+        
+        if not isinstance(items, list) or len(items) != count:
+            return None
+        
+        if task == "sentiment":
+            return [str(item).strip().strip(".'\"").lower() for item in items]
+        
+        results = []
+        for item in items:
+            if isinstance(item, list):
+                results.append([str(keyword).strip() for keyword in item if str(keyword).strip()])
+            else:
+                results.append(AIComm._split_keywords(str(item)))
+        return results
+    
+    def _cache_batch_item(self, task, service, text, result):
+        """
+        Guarda o resultado de um item no cache da função individual equivalente
+        
+        Args:
+            task: "sentiment" ou "keywords"
+            service: Nome do serviço
+            text: Texto do item
+            result: Resultado do item
+        """
+        response = ", ".join(result) if task == "keywords" else result
+        if not response:
+            return
+        key = self._cache_key(service, PROMPTS[task].format(text=text))
+        self.cache.set(key, response, CACHE_TTLS[task], service=service)
+    
+    def answer_question(self, question, context=None, service="ollama_local", top_k=3):
         """
         Responde a uma pergunta com base em um contexto opcional
         
         Args:
             question: Pergunta a ser respondida
-            context: Contexto para a pergunta (opcional)
+            context: Contexto para a pergunta (opcional; sem ele, os itens mais
+                     relevantes do índice de conhecimento são usados, se houver)
             service: Serviço a ser usado
+            top_k: Número de itens de conhecimento usados como contexto (0 desativa)
             
         Returns:
             Resposta à pergunta
         """
+        scope = ""
+        if context is None and top_k:
+            context = self._knowledge_context(question, top_k)
+        elif context:
+            # A resposta a um contexto fornecido só vale para o mesmo contexto
+            scope = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        
         if context:
-            prompt = f"Com base no seguinte contexto, responda à pergunta:\n\nContexto: {context}\n\nPergunta: {question}"
+            prompt = PROMPTS["answer_with_context"].format(context=context, question=question)
         else:
-            prompt = f"Responda à seguinte pergunta: {question}"
+            prompt = PROMPTS["answer"].format(question=question)
         
-        return self.query_external_ia(service, prompt)
+        return self._query_helper("answer", service, prompt, question, scope=scope)
+    
+    def _knowledge_context(self, question, top_k):
+        """
+        Monta o contexto de uma pergunta com os itens mais relevantes do conhecimento
+        
+        Args:
+            question: Pergunta
+            top_k: Número máximo de itens
+            
+        Returns:
+            Texto com um item por parágrafo, ou None sem índice ou sem itens relevantes
+        """
+        if self.knowledge_index is None:
+            return None
+        
+        try:
+            results = self.knowledge_index.search(question, top_k=top_k)
+        except Exception as e:
+            logger.error(f"Erro ao buscar contexto no índice de conhecimento: {e}")
+            return None
+        
+        # Cada item é (id, topic, content, ...) no formato de Database.get_knowledge
+        return "\n\n".join(f"[{item[1]}] {item[2]}" for item, _ in results) or None
     
     def generate_image_prompt(self, description, service="openai"):
         """
@@ -496,6 +1565,7 @@ class AIIntegrationManager:
         """
         self.database = database
         self.ai_comm = ai_comm
+        self.http = ai_comm.http
         self.active_integrations = {}
         
         # Carrega integrações ativas
@@ -595,7 +1665,7 @@ class AIIntegrationManager:
         }
         
         try:
-            response = requests.post(integration["endpoint"], headers=headers, json=payload, timeout=30)
+            response = self.http.post(integration["endpoint"], headers=headers, json=payload, timeout=30)
             
             if response.status_code == 200:
                 # Atualiza timestamp da última comunicação
@@ -666,14 +1736,18 @@ class AIIntegrationManager:
             # Armazena o conhecimento compartilhado
             knowledge = response["knowledge"]
             if isinstance(knowledge, list):
-                for item in knowledge:
-                    if isinstance(item, dict) and "topic" in item and "content" in item:
-                        self.database.add_knowledge(
-                            topic=item.get("topic", topic),
-                            content=item.get("content", ""),
-                            source=f"ai_{ai_name}",
-                            confidence=item.get("confidence", 0.8)
-                        )
+                self.database.add_knowledge_many(
+                    (
+                        {
+                            "topic": item.get("topic", topic),
+                            "content": item.get("content", ""),
+                            "source": f"ai_{ai_name}",
+                            "confidence": item.get("confidence", 0.8)
+                        }
+                        for item in knowledge
+                        if isinstance(item, dict) and "topic" in item and "content" in item
+                    )
+                )
             
             return knowledge
         
@@ -690,8 +1764,9 @@ def main():
     # Inicializa o banco de dados
     db = Database("data/nova_test.db")
     
-    # Inicializa o sistema de comunicação com outras IAs
-    ai_comm = AIComm(db)
+    # Inicializa o sistema de comunicação com outras IAs, com cache semântico
+    # se houver um modelo de embeddings local (pip install sentence-transformers)
+    ai_comm = AIComm(db, semantic_cache=create_semantic_cache())
     
     # Inicializa o gerenciador de integração
     integration_manager = AIIntegrationManager(db, ai_comm)
@@ -703,6 +1778,14 @@ def main():
     except Exception as e:
         print(f"Erro ao comunicar com Ollama local: {e}")
     
+    # Testa a resposta em streaming, exibindo cada trecho assim que chega
+    try:
+        for chunk in ai_comm.stream_external_ia("ollama_local", "Conte uma história curta."):
+            print(chunk, end="", flush=True)
+        print()
+    except Exception as e:
+        print(f"Erro ao receber streaming do Ollama local: {e}")
+    
     # Fecha o banco de dados
     db.close()
 
@@ -0,0 +1,801 @@
+"""
+Módulo de Comunicação Assíncrona com Outras IAs para IA NOVA
+Este módulo implementa uma versão asyncio do sistema de comunicação com outras
+IAs, permitindo centenas de consultas simultâneas em um único event loop e um
+único pool de conexões, sem uma thread por requisição.
+"""
+
+import asyncio
+import functools
+import hashlib
+import time
+import logging
+
+try:
+    import httpx
+except ImportError:  # httpx só é necessário para a API assíncrona
+    httpx = None
+
+from comunicacao_ia import AIComm, PROMPTS, STREAMING_SERVICES
+from resiliencia import CircuitOpenError, RateLimitExceeded
+from cache_respostas import AsyncSingleFlight, CACHE_TTLS, create_semantic_cache
+
+logger = logging.getLogger("NOVA_AI_Communication")
+
+class AsyncAIComm:
+    """Sistema assíncrono de comunicação com outras IAs"""
+    
+    def __init__(self, database, ai_comm=None, max_connections=200, max_keepalive_connections=50):
+        """
+        Inicializa o sistema assíncrono de comunicação
+        
+        Args:
+            database: Instância do banco de dados
+            ai_comm: Instância de AIComm com endpoints e chaves de API (opcional)
+            max_connections: Número máximo de conexões simultâneas
+            max_keepalive_connections: Número de conexões ociosas mantidas abertas
+        """
+        if httpx is None:
+            raise ImportError("AsyncAIComm requer o pacote httpx (pip install httpx)")
+        
+        self.database = database
+        # Endpoints, chaves e formato das requisições vêm do AIComm síncrono
+        self.ai_comm = ai_comm or AIComm(database)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self._client = None
+        
+        # Consultas idênticas simultâneas no loop compartilham uma única requisição
+        self.single_flight = AsyncSingleFlight()
+    
+    @property
+    def client(self):
+        """Cliente HTTP assíncrono compartilhado, criado no primeiro uso"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(limits=self.limits)
+        return self._client
+    
+    async def aclose(self):
+        """Fecha as conexões abertas"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+    
+    async def _run_blocking(self, func, *args, **kwargs):
+        """
+        Executa uma função bloqueante (como gravações no banco) fora do event loop
+        
+        Args:
+            func: Função a ser executada
+            
+        Returns:
+            Retorno da função
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+    
+    async def _cache_get_many(self, keys):
+        """
+        Recupera respostas do cache do AIComm sem bloquear o event loop
+        
+        A camada em memória é consultada no próprio loop; as chaves ausentes
+        dela são buscadas no banco de uma só vez, no executor, porque uma
+        leitura do SQLite pode esperar por outro escritor.
+        
+        Args:
+            keys: Lista de chaves de cache
+            
+        Returns:
+            Lista com a resposta de cada chave (None se ausente)
+        """
+        cache = self.ai_comm.cache
+        if cache.database is None:
+            return [cache.get(key) for key in keys]
+        
+        responses = [cache.get_memory(key) for key in keys]
+        missing = [position for position, response in enumerate(responses) if response is None]
+        if missing:
+            found = await self._run_blocking(lambda: [cache.get(keys[position]) for position in missing])
+            for position, response in zip(missing, found):
+                responses[position] = response
+        return responses
+    
+    async def query_external_ia(self, service, prompt, model=None, max_retries=None, retry_delay=None, cache_ttl=None,
+                                hedge=False):
+        """
+        Consulta uma IA externa
+        
+        Args:
+            service: Nome do serviço, ou "auto" para escolher pelo roteador
+            prompt: Prompt para a IA
+            model: Nome do modelo (opcional)
+            max_retries: Número máximo de tentativas (opcional, substitui o da política)
+            retry_delay: Espera base entre tentativas em segundos (opcional, substitui a da política)
+            cache_ttl: Tempo de vida da resposta no cache em segundos
+                       (opcional, sem ele o cache não é usado)
+            hedge: True ou nome de outro serviço para repetir a consulta se ela
+                   passar do p95 (ver AIComm.query_external_ia)
+            
+        Returns:
+            Resposta da IA ou None se houver erro
+        """
+        if service == "auto":
+            return await self.query_routed(prompt, cache_ttl=cache_ttl)
+        
+        if not self.ai_comm._can_query(service):
+            return None
+        
+        # Usa o mesmo cache do AIComm; o banco só é acessado no executor
+        cache = self.ai_comm.cache
+        key = self.ai_comm._cache_key(service, prompt, model)
+        if cache_ttl:
+            (response,) = await self._cache_get_many([key])
+            if response is not None:
+                return response
+        
+        response = await self.single_flight.do(
+            (key, hedge),
+            lambda: self._query_uncached(service, prompt, model, max_retries, retry_delay, hedge)
+        )
+        
+        if cache_ttl:
+            await self._run_blocking(cache.set, key, response, cache_ttl, service=service, model=model)
+        return response
+    
+    async def _query_uncached(self, service, prompt, model=None, max_retries=None, retry_delay=None, hedge=False):
+        """
+        Consulta o serviço, com novas tentativas, sem passar pelo cache nem pelo agrupamento
+        
+        Args:
+            service: Nome do serviço
+            prompt: Prompt para a IA
+            model: Nome do modelo (opcional)
+            max_retries: Número máximo de tentativas (opcional)
+            retry_delay: Espera base entre tentativas em segundos (opcional)
+            hedge: Ver query_external_ia
+            
+        Returns:
+            Resposta da IA ou None se houver erro
+        """
+        if hedge:
+            backup = service if hedge is True else hedge
+            return await self._query_hedged(prompt, service, backup, model=model,
+                                            max_retries=max_retries, retry_delay=retry_delay)
+        
+        # Mesma política de novas tentativas do AIComm, mas a espera não bloqueia o loop
+        policy = self.ai_comm.retry_policy.with_overrides(max_attempts=max_retries, base_delay=retry_delay)
+        started = time.monotonic()
+        
+        for attempt in range(policy.max_attempts):
+            breaker = self.ai_comm.get_circuit_breaker(service)
+            if not breaker.allow_request():
+                logger.warning(f"Circuito de {service} aberto, consulta recusada")
+                return None
+            try:
+                allowed = await self._wait_rate_limit(service, prompt)
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            if not allowed:
+                breaker.release()
+                return None
+            
+            call_started = time.monotonic()
+            try:
+                response = await self._send_request(service, prompt, model)
+                self.ai_comm._record_outcome(breaker, call_started)
+                return response
+            except asyncio.CancelledError:
+                # Consulta cancelada não diz nada sobre a saúde do serviço
+                breaker.release()
+                raise
+            except Exception as e:
+                self.ai_comm._record_outcome(breaker, call_started, e)
+                delay = policy.next_delay(attempt, e, started)
+                if delay is None:
+                    logger.error(f"Erro ao consultar {service} (tentativa {attempt+1}/{policy.max_attempts}): {e}")
+                    return None
+                
+                logger.warning(
+                    f"Erro ao consultar {service} (tentativa {attempt+1}/{policy.max_attempts}): {e}; "
+                    f"nova tentativa em {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+    
+    async def _wait_rate_limit(self, service, prompt):
+        """
+        Espera, sem bloquear o loop, a vez da consulta na fila do limitador de taxa
+        
+        Os limitadores são os do AIComm, compartilhados com as consultas
+        síncronas. Se a espera for cancelada, a reserva volta para o limitador.
+        
+        Args:
+            service: Nome do serviço
+            prompt: Prompt para a IA
+            
+        Returns:
+            True se a consulta pode ser enviada
+        """
+        limiter = self.ai_comm.get_rate_limiter(service)
+        tokens = self.ai_comm._estimate_request_tokens(prompt)
+        wait = limiter.reserve(tokens)
+        if wait is None:
+            logger.warning(f"Fila do limitador de {service} cheia, consulta recusada")
+            return False
+        
+        try:
+            if wait > 0:
+                await asyncio.sleep(wait)
+            return True
+        except asyncio.CancelledError:
+            limiter.refund(tokens)
+            raise
+        finally:
+            limiter.done_waiting(wait)
+    
+    async def query_routed(self, prompt, services=None, strategy="fastest", cache_ttl=None):
+        """
+        Consulta o serviço escolhido pelo roteador, passando ao próximo se ele falhar
+        
+        Args:
+            prompt: Prompt para a IA
+            services: Serviços considerados (opcional)
+            strategy: "fastest", "weighted" ou "hedged" (ver AIComm.query_routed)
+            cache_ttl: Tempo de vida da resposta no cache em segundos (opcional)
+            
+        Returns:
+            Resposta da IA ou None se nenhum serviço responder
+        """
+        # A verificação do Ollama local pode fazer uma requisição síncrona
+        ranked = await self._run_blocking(self.ai_comm.router.rank, services, prompt, strategy)
+        if not ranked:
+            logger.warning("Nenhum serviço disponível para roteamento")
+            return None
+        
+        if strategy == "hedged" and len(ranked) > 1:
+            response = await self._query_hedged(prompt, ranked[0], ranked[1], cache_ttl=cache_ttl)
+            if response is not None:
+                return response
+            ranked = ranked[2:]
+        
+        for service in ranked:
+            response = await self.query_external_ia(service, prompt, cache_ttl=cache_ttl)
+            if response is not None:
+                return response
+            logger.info(f"Sem resposta de {service}, tentando o próximo serviço")
+        
+        return None
+    
+    async def _query_hedged(self, prompt, primary, backup, model=None, max_retries=None, retry_delay=None,
+                            cache_ttl=None):
+        """
+        Consulta o serviço principal e, se ele demorar mais que seu p95, também o reserva
+        
+        Args:
+            prompt: Prompt para a IA
+            primary: Serviço principal
+            backup: Serviço acionado se o principal demorar (pode ser o mesmo)
+            model: Nome do modelo do serviço principal (opcional)
+            max_retries: Número máximo de tentativas de cada consulta (opcional)
+            retry_delay: Espera base entre tentativas em segundos (opcional)
+            cache_ttl: Tempo de vida da resposta no cache em segundos (opcional)
+            
+        Returns:
+            Primeira resposta válida ou None
+        """
+        cache = self.ai_comm.cache
+        backup_model = model if backup == primary else None
+        if cache_ttl:
+            (response,) = await self._cache_get_many([self.ai_comm._cache_key(primary, prompt, model)])
+            if response is not None:
+                return response
+        
+        async def finish(service, service_model, response):
+            if cache_ttl:
+                key = self.ai_comm._cache_key(service, prompt, service_model)
+                await self._run_blocking(cache.set, key, response, cache_ttl, service=service, model=service_model)
+            return response
+        
+        budget = self.ai_comm.hedge_budget
+        budget.record_request()
+        
+        # Como no AIComm, as consultas não passam pelo agrupamento de consultas idênticas
+        first = asyncio.ensure_future(self._query_uncached(primary, prompt, model, max_retries, retry_delay))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.ai_comm.router.hedge_delay(primary))
+            if not done and not budget.try_acquire():
+                logger.debug(f"Orçamento de hedge esgotado, aguardando {primary}")
+                await first
+                done = {first}
+            
+            if done:
+                # O principal terminou: só consulta o reserva se ele falhou e for outro serviço
+                pending = set()
+                if first.result() is not None or backup == primary:
+                    return await finish(primary, model, first.result())
+            else:
+                logger.debug(f"{primary} sem resposta no p95, acionando {backup}")
+            
+            second = asyncio.ensure_future(self._query_uncached(backup, prompt, backup_model, max_retries, retry_delay))
+            hedged = bool(pending)
+            pending.add(second)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result() is not None:
+                        if task is second:
+                            if hedged:
+                                budget.record_win()
+                            return await finish(backup, backup_model, task.result())
+                        return await finish(primary, model, task.result())
+            return None
+        finally:
+            # Cancela de fato a requisição mais lenta
+            for task in pending:
+                task.cancel()
+    
+    async def _send_request(self, service, prompt, model=None):
+        """
+        Envia o prompt a um serviço e interpreta a resposta
+        
+        Args:
+            service: Nome do serviço
+            prompt: Prompt para a IA
+            model: Nome do modelo (opcional)
+            
+        Returns:
+            Resposta da IA
+        """
+        request = self.ai_comm._build_request(service, prompt, model)
+        try:
+            response = await self.client.post(
+                request["url"],
+                headers=request["headers"],
+                json=request["payload"],
+                timeout=request["timeout"]
+            )
+        except httpx.TransportError as e:
+            # Falhas de rede viram ConnectionError, como no transporte síncrono,
+            # para que a política de novas tentativas as reconheça
+            raise ConnectionError(str(e)) from e
+        
+        if response.status_code == 200:
+            return self.ai_comm._parse_response(service, response.json())
+        else:
+            self.ai_comm._raise_api_error(service, response.status_code, response.text, response.headers)
+    
+    def stream_external_ia(self, service, prompt, model=None):
+        """
+        Consulta uma IA externa recebendo a resposta em partes, à medida que é gerada
+        
+        O serviço é verificado já nesta chamada, que levanta ValueError para
+        serviços não suportados ou sem chave de API; o limitador de taxa, o
+        disjuntor e a requisição ficam para o início da iteração.
+        
+        Args:
+            service: Nome do serviço
+            prompt: Prompt para a IA
+            model: Nome do modelo (opcional)
+            
+        Returns:
+            Iterador assíncrono de trechos de texto da resposta
+        """
+        if not self.ai_comm._can_query(service):
+            raise ValueError(f"Serviço indisponível para streaming: {service}")
+        return self._stream(service, prompt, model)
+    
+    async def _stream(self, service, prompt, model=None):
+        """
+        Produz os trechos da resposta de stream_external_ia
+        
+        Args:
+            service: Nome do serviço
+            prompt: Prompt para a IA
+            model: Nome do modelo (opcional)
+            
+        Yields:
+            Trechos de texto da resposta
+        """
+        breaker = self.ai_comm.get_circuit_breaker(service)
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"Circuito de {service} aberto, consulta recusada")
+        try:
+            allowed = await self._wait_rate_limit(service, prompt)
+        except BaseException:
+            breaker.release()
+            raise
+        if not allowed:
+            breaker.release()
+            raise RateLimitExceeded(f"Fila do limitador de {service} cheia, consulta recusada")
+        
+        started = time.monotonic()
+        recorded = False
+        try:
+            if service not in STREAMING_SERVICES:
+                text = await self._send_request(service, prompt, model)
+                self.ai_comm._record_outcome(breaker, started)
+                recorded = True
+                yield text
+                return
+            
+            request = self.ai_comm._build_request(service, prompt, model, stream=True)
+            async with self.client.stream(
+                "POST",
+                request["url"],
+                headers=request["headers"],
+                json=request["payload"],
+                timeout=request["timeout"]
+            ) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    self.ai_comm._raise_api_error(service, response.status_code, response.text, response.headers)
+                
+                # O disjuntor avalia o início da resposta (latência até o primeiro byte)
+                self.ai_comm._record_outcome(breaker, started)
+                recorded = True
+                
+                async for line in response.aiter_lines():
+                    chunk = self.ai_comm._parse_stream_line(service, line)
+                    if chunk:
+                        yield chunk
+        except BaseException as e:
+            if not recorded:
+                if isinstance(e, Exception):
+                    self.ai_comm._record_outcome(breaker, started, e)
+                else:
+                    # Cancelada antes de começar: libera a vaga sem julgar o serviço
+                    breaker.release()
+            raise
+    
+    async def _query_services(self, prompt, services, deadline=None, first_valid=False):
+        """
+        Consulta vários serviços simultaneamente
+        
+        Args:
+            prompt: Prompt para as IAs
+            services: Lista de serviços a consultar
+            deadline: Prazo total em segundos (opcional)
+            first_valid: Se True, retorna assim que a primeira resposta válida chegar
+            
+        Returns:
+            Dicionário com as respostas de cada serviço (None se não houver)
+        """
+        results = {service: None for service in services}
+        tasks = {
+            asyncio.ensure_future(self.query_external_ia(service, prompt)): service
+            for service in services
+        }
+        loop = asyncio.get_running_loop()
+        end = loop.time() + deadline if deadline is not None else None
+        pending = set(tasks)
+        
+        try:
+            while pending:
+                timeout = max(0.0, end - loop.time()) if end is not None else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.warning(
+                        f"Prazo de {deadline}s esgotado sem resposta de: "
+                        f"{', '.join(tasks[t] for t in pending)}"
+                    )
+                    break
+                
+                for task in done:
+                    results[tasks[task]] = task.result()
+                
+                if first_valid and any(results[tasks[task]] for task in done):
+                    break
+        finally:
+            # Cancela de fato as requisições que não são mais necessárias
+            for task in pending:
+                task.cancel()
+        
+        return results
+    
+    async def collaborate_with_external_ia(self, prompt, services=None, deadline=None):
+        """
+        Consulta múltiplas IAs simultaneamente e combina os resultados
+        
+        Args:
+            prompt: Prompt para as IAs
+            services: Lista de serviços a consultar (opcional)
+            deadline: Prazo total em segundos (opcional)
+            
+        Returns:
+            Dicionário com as respostas de cada serviço
+        """
+        results = await self._query_services(prompt, services or self.ai_comm._default_services(), deadline=deadline)
+        await self._run_blocking(self.ai_comm._store_collaboration, results)
+        return results
+    
+    async def get_best_response(self, prompt, services=None, strategy="first_valid", deadline=None):
+        """
+        Obtém a melhor resposta entre várias IAs
+        
+        Args:
+            prompt: Prompt para as IAs
+            services: Lista de serviços a consultar (opcional)
+            strategy: "first_valid", "longest", "all" ou "routed" (ver AIComm.get_best_response)
+            deadline: Prazo total em segundos (opcional)
+            
+        Returns:
+            Melhor resposta ou dicionário com todas as respostas
+        """
+        if strategy == "routed":
+            return await self.query_routed(prompt, services)
+        
+        services = services or self.ai_comm._default_services()
+        results = await self._query_services(prompt, services, deadline=deadline, first_valid=strategy == "first_valid")
+        await self._run_blocking(self.ai_comm._store_collaboration, results)
+        
+        if strategy == "all":
+            return results
+        
+        valid_responses = [result for result in results.values() if result]
+        if not valid_responses:
+            logger.warning("Nenhuma resposta válida obtida")
+            return None
+        
+        if strategy == "longest":
+            return max(valid_responses, key=len)
+        
+        if strategy != "first_valid":
+            logger.warning(f"Estratégia desconhecida: {strategy}")
+        return valid_responses[0]
+    
+    async def translate_with_ai(self, text, source_lang, target_lang, service="openai"):
+        """
+        Traduz texto usando IA
+        
+        Args:
+            text: Texto a ser traduzido
+            source_lang: Idioma de origem
+            target_lang: Idioma de destino
+            service: Serviço a ser usado
+            
+        Returns:
+            Texto traduzido
+        """
+        prompt = PROMPTS["translate"].format(text=text, source_lang=source_lang, target_lang=target_lang)
+        return await self._query_helper("translate", service, prompt, text, scope=f"{source_lang}>{target_lang}")
+    
+    async def summarize_with_ai(self, text, max_length=200, service="openai"):
+        """
+        Resume texto usando IA
+        
+        Args:
+            text: Texto a ser resumido
+            max_length: Comprimento máximo do resumo
+            service: Serviço a ser usado
+            
+        Returns:
+            Texto resumido
+        """
+        prompt = PROMPTS["summarize"].format(text=text, max_length=max_length)
+        return await self._query_helper("summarize", service, prompt, text, scope=str(max_length))
+    
+    async def analyze_sentiment(self, text, service="openai"):
+        """
+        Analisa o sentimento de um texto
+        
+        Args:
+            text: Texto a ser analisado
+            service: Serviço a ser usado
+            
+        Returns:
+            Análise de sentimento (positivo, negativo, neutro)
+        """
+        prompt = PROMPTS["sentiment"].format(text=text)
+        return await self._query_helper("sentiment", service, prompt, text)
+    
+    async def extract_keywords(self, text, service="openai"):
+        """
+        Extrai palavras-chave de um texto
+        
+        Args:
+            text: Texto para extração
+            service: Serviço a ser usado
+            
+        Returns:
+            Lista de palavras-chave
+        """
+        prompt = PROMPTS["keywords"].format(text=text)
+        response = await self._query_helper("keywords", service, prompt, text)
+        return AIComm._split_keywords(response)
+    
+    async def _query_helper(self, helper, service, prompt, text, scope=""):
+        """
+        Consulta a IA para uma função auxiliar, passando pelos caches
+        (ver AIComm._query_helper; usa o cache semântico do AIComm)
+        
+        Args:
+            helper: Nome da função auxiliar (chave de CACHE_TTLS e semantic_helpers)
+            service: Serviço a ser usado
+            prompt: Prompt completo
+            text: Parte variável do prompt, comparada pelo cache semântico
+            scope: Demais parâmetros que mudam a resposta (idiomas, tamanho, contexto)
+            
+        Returns:
+            Resposta da IA ou None se houver erro
+        """
+        cache_ttl = CACHE_TTLS.get(helper)
+        semantic_cache = self.ai_comm.semantic_cache
+        settings = self.ai_comm.semantic_helpers.get(helper)
+        if semantic_cache is None or settings is None:
+            return await self.query_external_ia(service, prompt, cache_ttl=cache_ttl)
+        
+        # O cache semântico fica em memória; a busca leva menos de um milissegundo
+        namespace = f"{helper}|{service}|{scope}"
+        response = semantic_cache.get(namespace, text, settings["threshold"])
+        if response is not None:
+            return response
+        
+        response = await self.query_external_ia(service, prompt, cache_ttl=cache_ttl)
+        semantic_cache.set(namespace, text, response, settings["ttl"])
+        return response
+    
+    async def analyze_sentiment_many(self, texts, service="openai", max_batch_items=100):
+        """
+        Analisa o sentimento de vários textos, agrupando-os em poucas consultas
+        
+        Args:
+            texts: Lista de textos a serem analisados
+            service: Serviço a ser usado
+            max_batch_items: Número máximo de textos por consulta
+            
+        Returns:
+            Lista com a análise de cada texto, na mesma ordem (None se falhar)
+        """
+        return await self._classify_many("sentiment", texts, service, max_batch_items)
+    
+    async def extract_keywords_many(self, texts, service="openai", max_batch_items=50):
+        """
+        Extrai palavras-chave de vários textos, agrupando-os em poucas consultas
+        
+        Args:
+            texts: Lista de textos para extração
+            service: Serviço a ser usado
+            max_batch_items: Número máximo de textos por consulta
+            
+        Returns:
+            Lista com as palavras-chave de cada texto, na mesma ordem
+        """
+        results = await self._classify_many("keywords", texts, service, max_batch_items)
+        return [keywords or [] for keywords in results]
+    
+    async def _classify_many(self, task, texts, service, max_batch_items):
+        """
+        Executa uma tarefa de classificação em lote (ver AIComm._classify_many)
+        
+        Os lotes são consultados em paralelo no loop; o limitador de taxa do
+        serviço controla o ritmo.
+        
+        Args:
+            task: "sentiment" ou "keywords"
+            texts: Lista de textos
+            service: Serviço a ser usado
+            max_batch_items: Número máximo de textos por consulta
+            
+        Returns:
+            Lista com o resultado de cada texto, na mesma ordem
+        """
+        results = [None] * len(texts)
+        if not self.ai_comm._can_query(service):
+            return results
+        
+        pending = []
+        cached_responses = await self._cache_get_many(
+            [self.ai_comm._cache_key(service, PROMPTS[task].format(text=text)) for text in texts]
+        )
+        for index, (text, cached) in enumerate(zip(texts, cached_responses)):
+            if cached is not None:
+                results[index] = AIComm._split_keywords(cached) if task == "keywords" else cached
+            else:
+                pending.append((index, text))
+        
+        batches = self.ai_comm._plan_batches(task, service, pending, max_batch_items)
+        if batches:
+            logger.info(f"Consultando {service} em {len(batches)} lote(s) para {len(pending)} texto(s) ({task})")
+        
+        for batch_results in await asyncio.gather(*(self._query_batch(task, service, batch) for batch in batches)):
+            for index, result in batch_results.items():
+                results[index] = result
+        
+        return results
+    
+    async def _query_batch(self, task, service, batch):
+        """
+        Consulta um lote e distribui a resposta entre os itens (ver AIComm._query_batch)
+        
+        Args:
+            task: "sentiment" ou "keywords"
+            service: Nome do serviço
+            batch: Lista de tuplas (índice, texto)
+            
+        Returns:
+            Dicionário índice -> resultado dos itens obtidos
+        """
+        if len(batch) == 1:
+            index, text = batch[0]
+            if task == "sentiment":
+                return {index: await self.analyze_sentiment(text, service)}
+            return {index: await self.extract_keywords(text, service)}
+        
+        response = await self.query_external_ia(service, AIComm._batch_prompt(task, batch))
+        if response is None:
+            return {}
+        
+        parsed = AIComm._parse_batch_response(task, response, len(batch))
+        if parsed is None:
+            logger.warning(f"Resposta em lote inválida de {service}, dividindo o lote de {len(batch)} itens")
+            middle = len(batch) // 2
+            first, second = await asyncio.gather(
+                self._query_batch(task, service, batch[:middle]),
+                self._query_batch(task, service, batch[middle:])
+            )
+            first.update(second)
+            return first
+        
+        results = {}
+        for (index, text), result in zip(batch, parsed):
+            await self._run_blocking(self.ai_comm._cache_batch_item, task, service, text, result)
+            results[index] = result
+        return results
+    
+    async def answer_question(self, question, context=None, service="ollama_local", top_k=3):
+        """
+        Responde a uma pergunta com base em um contexto opcional
+        
+        Args:
+            question: Pergunta a ser respondida
+            context: Contexto para a pergunta (opcional; sem ele, os itens mais
+                     relevantes do índice de conhecimento do AIComm são usados, se houver)
+            service: Serviço a ser usado
+            top_k: Número de itens de conhecimento usados como contexto (0 desativa)
+            
+        Returns:
+            Resposta à pergunta
+        """
+        scope = ""
+        if context is None and top_k:
+            context = await self._run_blocking(self.ai_comm._knowledge_context, question, top_k)
+        elif context:
+            # A resposta a um contexto fornecido só vale para o mesmo contexto
+            scope = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        
+        if context:
+            prompt = PROMPTS["answer_with_context"].format(context=context, question=question)
+        else:
+            prompt = PROMPTS["answer"].format(question=question)
+        
+        return await self._query_helper("answer", service, prompt, question, scope=scope)
+
+
+async def main():
+    """Função principal para testar o sistema assíncrono de comunicação"""
+    from atualizacao_automatica import Database
+    
+    db = Database("data/nova_test.db")
+    
+    # Cache semântico se houver um modelo de embeddings local (ver cache_respostas)
+    async with AsyncAIComm(db, ai_comm=AIComm(db, semantic_cache=create_semantic_cache())) as ai_comm:
+        # Várias perguntas simultâneas ao Ollama local, no mesmo event loop
+        questions = ["Olá, quem é você?", "O que é Python?", "Qual a capital do Brasil?"]
+        answers = await asyncio.gather(*(ai_comm.answer_question(q) for q in questions))
+        for question, answer in zip(questions, answers):
+            print(f"{question} -> {answer}")
+    
+    db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,606 @@
+"""
+Módulo de Índice Vetorial para IA NOVA
+Este módulo implementa um índice vetorial local sobre o banco de conhecimento da
+NOVA, com vetores TF-IDF por hashing guardados em arquivos NumPy mapeados em
+memória, permitindo recuperar o contexto mais relevante de uma pergunta sem
+depender de serviços externos.
+"""
+
+import array
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+import zlib
+import logging
+from collections import Counter
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:  # numpy só é necessário para o índice vetorial
+    np = None
+
+logger = logging.getLogger("NOVA_VectorIndex")
+
+# Versão do formato dos arquivos; um índice em outro formato é reconstruído
+INDEX_FORMAT = 1
+
+_TOKEN_PATTERN = re.compile(r"\w\w+")
+_WORD_PATTERN = re.compile(r"\w+")
+
+def _normalize(text):
+    """Converte o texto para minúsculas e remove os acentos"""
+    normalized = (text or "").lower()
+    if not normalized.isascii():
+        normalized = unicodedata.normalize("NFKD", normalized)
+        normalized = "".join(char for char in normalized if not unicodedata.combining(char))
+    return normalized
+
+def tokenize(text):
+    """
+    Divide um texto em termos normalizados (minúsculas, sem acentos)
+    
+    Args:
+        text: Texto a ser dividido
+    
+    Returns:
+        Lista de termos com pelo menos dois caracteres
+    """
+    return _TOKEN_PATTERN.findall(_normalize(text))
+
+def words(text):
+    """
+    Divide um texto em palavras normalizadas, inclusive as de um caractere
+    
+    Args:
+        text: Texto a ser dividido
+    
+    Returns:
+        Lista de palavras (minúsculas, sem acentos)
+    """
+    return _WORD_PATTERN.findall(_normalize(text))
+
+@lru_cache(maxsize=262144)
+def _term_bucket(term, bits):
+    """Dimensão do vetor de um termo (CRC32 é estável entre processos, ao contrário de hash())"""
+    return zlib.crc32(term.encode("utf-8")) & ((1 << bits) - 1)
+
+def embed_text(text, dimensions=512):
+    """
+    Calcula um vetor denso de um texto curto, sem modelo externo
+    
+    Termos e trigramas de caracteres (que aproximam flexões e erros de
+    digitação) são distribuídos por hashing com sinal em um vetor
+    normalizado; textos com as mesmas palavras têm cosseno próximo de 1.
+    
+    Args:
+        text: Texto a ser representado
+        dimensions: Número de dimensões do vetor
+    
+    Returns:
+        Vetor float32 de norma 1 (ou nulo para texto sem termos)
+    """
+    weights = Counter()
+    # Inclui termos de um caractere: "Llama 2" e "Llama 3" precisam ser diferentes
+    for term in words(text):
+        # Números (versões, quantidades, datas) mudam o sentido do texto e pesam mais
+        weights[term] += 3.0 if any(char.isdigit() for char in term) else 1.0
+        padded = f"#{term}#"
+        for start in range(len(padded) - 2):
+            weights[f"\x00{padded[start:start + 3]}"] += 0.5
+    
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature, weight in weights.items():
+        hashed = zlib.crc32(feature.encode("utf-8"))
+        vector[hashed % dimensions] += weight if hashed & 0x80000000 else -weight
+    
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class KnowledgeIndex:
+    """Índice vetorial local (TF-IDF com hashing) sobre o tópico e o conteúdo do conhecimento"""
+    
+    def __init__(self, database, index_dir=None, bits=20, segment_size=262144, max_small_segments=4,
+                 batch_size=5000, common_ratio=0.01, purge_ratio=0.1):
+        """
+        Inicializa o índice, abrindo os arquivos existentes
+        
+        Cada item vira um vetor esparso de 2**bits dimensões (frequência
+        sublinear dos termos, normalizada). Os vetores ficam em segmentos
+        ordenados por dimensão, de modo que uma busca lê apenas as dimensões
+        dos termos da pergunta; o IDF é aplicado à pergunta, o que permite
+        acrescentar itens sem recalcular os vetores já gravados.
+        
+        Args:
+            database: Instância do banco de dados
+            index_dir: Diretório dos arquivos do índice (opcional, padrão:
+                       knowledge_index ao lado do banco)
+            bits: Número de bits do hashing dos termos
+            segment_size: Número de itens a partir do qual um segmento não é mais fundido
+            max_small_segments: Número de segmentos menores que segment_size
+                                tolerados antes de fundi-los em um só
+            batch_size: Itens lidos do banco por consulta durante a indexação
+            common_ratio: Fração dos itens a partir da qual um termo é considerado
+                          frequente (ver _score)
+            purge_ratio: Fração dos itens removidos do banco a partir da qual
+                         eles são apagados dos segmentos (ver remove)
+        """
+        if np is None:
+            raise ImportError("KnowledgeIndex requer o pacote numpy (pip install numpy)")
+        
+        self.database = database
+        self.index_dir = index_dir or os.path.join(os.path.dirname(database.db_path), "knowledge_index")
+        self.bits = bits
+        self.segment_size = segment_size
+        self.max_small_segments = max_small_segments
+        self.batch_size = batch_size
+        self.common_ratio = common_ratio
+        self.purge_ratio = purge_ratio
+        os.makedirs(self.index_dir, exist_ok=True)
+        
+        self._lock = threading.RLock()
+        # Há linhas no banco ainda não indexadas (sempre verificado na primeira busca)
+        self._stale = True
+        self._load()
+        database.add_change_listener(self._on_database_change)
+        database.add_delete_listener(self._on_database_delete)
+    
+    def _path(self, name):
+        """Caminho de um arquivo do índice"""
+        return os.path.join(self.index_dir, name)
+    
+    def _load(self):
+        """Abre o índice gravado, ou começa um vazio se não houver um compatível"""
+        meta = None
+        try:
+            with open(self._path("meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Metadados do índice vetorial ilegíveis, reconstruindo: {e}")
+        
+        if not meta or meta.get("format") != INDEX_FORMAT or meta.get("bits") != self.bits:
+            if meta:
+                logger.info("Formato do índice vetorial mudou, reconstruindo")
+            self._reset()
+            return
+        
+        try:
+            self.doc_freq = np.load(self._path("doc_freq.npy"))
+            self.segments = [self._open_segment(name) for name in meta["segments"]]
+            if os.path.exists(self._path("deleted.npy")):
+                self.deleted = np.load(self._path("deleted.npy"))
+            else:
+                self.deleted = np.empty(0, dtype=np.int64)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Arquivos do índice vetorial ausentes ou corrompidos, reconstruindo: {e}")
+            self._reset()
+            return
+        
+        self.last_id = meta["last_id"]
+        self.num_docs = meta["num_docs"]
+        self.next_segment = meta["next_segment"]
+        # Novos itens precisam ficar acima de last_id para serem indexados
+        self.database.reserve_knowledge_ids(self.last_id)
+        logger.info(f"Índice vetorial aberto com {self.num_docs} itens em {len(self.segments)} segmento(s)")
+    
+    def _reset(self):
+        """Apaga os arquivos e começa um índice vazio"""
+        self.segments = []
+        for name in os.listdir(self.index_dir):
+            if name.endswith(".npy") or name == "meta.json":
+                os.remove(self._path(name))
+        
+        self.doc_freq = np.zeros(1 << self.bits, dtype=np.int32)
+        # IDs indexados e já removidos do banco, em ordem crescente
+        self.deleted = np.empty(0, dtype=np.int64)
+        self.last_id = 0
+        self.num_docs = 0
+        self.next_segment = 0
+    
+    def _open_segment(self, name):
+        """
+        Abre os arquivos de um segmento mapeados em memória
+        
+        Args:
+            name: Nome do segmento
+        
+        Returns:
+            Dicionário com dimensões (ordenadas), documento local e peso de
+            cada entrada, e o ID no banco de cada documento
+        """
+        segment = {"name": name}
+        for part in ("buckets", "docs", "weights", "ids"):
+            segment[part] = np.load(self._path(f"{name}.{part}.npy"), mmap_mode="r")
+        return segment
+    
+    def _save_array(self, name, values):
+        """Grava um array de forma atômica"""
+        tmp_path = self._path(f"{name}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, values)
+        os.replace(tmp_path, self._path(name))
+    
+    def _save_meta(self):
+        """Grava as frequências dos termos e os metadados do índice"""
+        self._save_array("doc_freq.npy", self.doc_freq)
+        meta = {
+            "format": INDEX_FORMAT,
+            "bits": self.bits,
+            "last_id": self.last_id,
+            "num_docs": self.num_docs,
+            "next_segment": self.next_segment,
+            "segments": [segment["name"] for segment in self.segments]
+        }
+        tmp_path = self._path("meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path("meta.json"))
+    
+    def _on_database_change(self, table, row_id):
+        """
+        Recebe notificações do banco de dados e marca o índice como desatualizado
+        
+        Args:
+            table: Nome da tabela alterada
+            row_id: ID da linha alterada
+        """
+        if table == "knowledge":
+            self._stale = True
+    
+    def _on_database_delete(self, table, row_ids):
+        """
+        Recebe notificações de remoção do banco de dados
+        
+        Args:
+            table: Nome da tabela alterada
+            row_ids: IDs das linhas removidas
+        """
+        if table == "knowledge":
+            self.remove(row_ids)
+    
+    def remove(self, row_ids):
+        """
+        Retira itens removidos do banco do índice
+        
+        Os IDs são marcados como removidos e deixam de ser retornados pela
+        busca; quando passam de purge_ratio dos itens indexados, os segmentos
+        são regravados sem eles (ver _purge_deleted).
+        
+        Args:
+            row_ids: IDs dos itens removidos
+        
+        Returns:
+            Número de IDs indexados marcados como removidos
+        """
+        with self._lock:
+            row_ids = np.asarray(list(row_ids), dtype=np.int64)
+            # IDs ainda não indexados nunca chegarão ao índice
+            row_ids = np.setdiff1d(row_ids[row_ids <= self.last_id], self.deleted)
+            if not len(row_ids):
+                return 0
+            
+            self.deleted = np.union1d(self.deleted, row_ids)
+            if len(self.deleted) >= self.purge_ratio * self.num_docs:
+                self._purge_deleted()
+            else:
+                self._save_array("deleted.npy", self.deleted)
+            return len(row_ids)
+    
+    def refresh(self):
+        """
+        Indexa os itens acrescentados ao banco desde a última atualização
+        
+        Chamado automaticamente pela busca quando o banco avisa de novos itens;
+        pode ser chamado antes para não pagar a indexação na primeira busca.
+        
+        Returns:
+            Número de itens indexados
+        """
+        with self._lock:
+            self._stale = False
+            total = 0
+            buckets, docs, weights, ids = array.array("i"), array.array("i"), array.array("f"), array.array("q")
+            
+            while True:
+                rows = self.database.get_knowledge_after(self.last_id, self.batch_size)
+                if not rows:
+                    break
+                
+                for row_id, topic, content in rows:
+                    counts = Counter(_term_bucket(term, self.bits) for term in tokenize(f"{topic or ''} {content or ''}"))
+                    if counts:
+                        values = [1.0 + math.log(count) for count in counts.values()]
+                        norm = math.sqrt(sum(value * value for value in values))
+                        buckets.extend(counts.keys())
+                        docs.extend([len(ids)] * len(counts))
+                        weights.extend(value / norm for value in values)
+                    ids.append(row_id)
+                
+                self.last_id = rows[-1][0]
+                if len(ids) >= self.segment_size:
+                    total += self._write_segment(buckets, docs, weights, ids)
+                    buckets, docs, weights, ids = array.array("i"), array.array("i"), array.array("f"), array.array("q")
+            
+            total += self._write_segment(buckets, docs, weights, ids)
+            if total:
+                self._merge_small_segments()
+                logger.info(f"{total} itens adicionados ao índice vetorial ({self.num_docs} no total)")
+            return total
+    
+    def _write_segment(self, buckets, docs, weights, ids):
+        """
+        Grava um novo segmento com os vetores acumulados
+        
+        Args:
+            buckets: Dimensão de cada entrada
+            docs: Documento (posição em ids) de cada entrada
+            weights: Peso de cada entrada
+            ids: ID no banco de cada documento
+        
+        Returns:
+            Número de documentos gravados
+        """
+        if not ids:
+            return 0
+        
+        buckets = np.frombuffer(buckets, dtype=np.int32)
+        order = np.argsort(buckets, kind="stable")
+        name = f"seg{self.next_segment:06d}"
+        self._save_array(f"{name}.buckets.npy", buckets[order])
+        self._save_array(f"{name}.docs.npy", np.frombuffer(docs, dtype=np.int32)[order])
+        self._save_array(f"{name}.weights.npy", np.frombuffer(weights, dtype=np.float32)[order].astype(np.float16))
+        self._save_array(f"{name}.ids.npy", np.frombuffer(ids, dtype=np.int64))
+        
+        # Cada dimensão aparece no máximo uma vez por documento
+        self.doc_freq += np.bincount(buckets, minlength=len(self.doc_freq)).astype(np.int32)
+        self.num_docs += len(ids)
+        self.next_segment += 1
+        self.segments.append(self._open_segment(name))
+        # Os metadados são gravados a cada segmento, preservando o progresso de indexações longas
+        self._save_meta()
+        return len(ids)
+    
+    def _merge_small_segments(self):
+        """Funde os segmentos pequenos quando passam de max_small_segments"""
+        small = [segment for segment in self.segments if len(segment["ids"]) < self.segment_size]
+        if len(small) <= self.max_small_segments:
+            return
+        
+        buckets, docs, weights, ids = [], [], [], []
+        offset = 0
+        for segment in small:
+            buckets.append(segment["buckets"])
+            docs.append(segment["docs"] + offset)
+            weights.append(segment["weights"])
+            ids.append(segment["ids"])
+            offset += len(segment["ids"])
+        
+        buckets = np.concatenate(buckets)
+        order = np.argsort(buckets, kind="stable")
+        name = f"seg{self.next_segment:06d}"
+        self._save_array(f"{name}.buckets.npy", buckets[order])
+        self._save_array(f"{name}.docs.npy", np.concatenate(docs).astype(np.int32)[order])
+        self._save_array(f"{name}.weights.npy", np.concatenate(weights)[order])
+        self._save_array(f"{name}.ids.npy", np.concatenate(ids))
+        self.next_segment += 1
+        
+        merged = {segment["name"] for segment in small}
+        self.segments = [segment for segment in self.segments if segment["name"] not in merged]
+        self.segments.append(self._open_segment(name))
+        self._save_meta()
+        
+        # Solta os mapeamentos antes de apagar os arquivos
+        small = None
+        self._remove_segment_files(merged)
+    
+    def _purge_deleted(self):
+        """Regrava os segmentos que contêm itens removidos, sem eles"""
+        replaced = []
+        segments = []
+        for segment in self.segments:
+            dead = np.isin(segment["ids"], self.deleted)
+            if not dead.any():
+                segments.append(segment)
+                continue
+            
+            live = ~dead[segment["docs"]]
+            # Cada dimensão aparece no máximo uma vez por documento
+            self.doc_freq -= np.bincount(segment["buckets"][~live], minlength=len(self.doc_freq)).astype(np.int32)
+            self.num_docs -= int(dead.sum())
+            replaced.append(segment["name"])
+            if dead.all():
+                continue
+            
+            # Nova posição de cada documento que permanece
+            remap = (np.cumsum(~dead) - 1).astype(np.int32)
+            name = f"seg{self.next_segment:06d}"
+            self._save_array(f"{name}.buckets.npy", segment["buckets"][live])
+            self._save_array(f"{name}.docs.npy", remap[segment["docs"][live]])
+            self._save_array(f"{name}.weights.npy", segment["weights"][live])
+            self._save_array(f"{name}.ids.npy", segment["ids"][~dead])
+            self.next_segment += 1
+            segments.append(self._open_segment(name))
+        
+        self.segments = segments
+        self.deleted = np.empty(0, dtype=np.int64)
+        self._save_meta()
+        try:
+            os.remove(self._path("deleted.npy"))
+        except FileNotFoundError:
+            pass
+        
+        # Solta os mapeamentos antes de apagar os arquivos
+        segment = segments = None
+        self._remove_segment_files(replaced)
+        logger.info(f"{len(replaced)} segmento(s) do índice vetorial regravados sem os itens removidos")
+    
+    def _remove_segment_files(self, names):
+        """
+        Apaga os arquivos de segmentos que não fazem mais parte do índice
+        
+        Args:
+            names: Nomes dos segmentos
+        """
+        for old_name in names:
+            for part in ("buckets", "docs", "weights", "ids"):
+                try:
+                    os.remove(self._path(f"{old_name}.{part}.npy"))
+                except OSError as e:
+                    logger.warning(f"Não foi possível remover {old_name}.{part}.npy: {e}")
+    
+    def rebuild(self):
+        """
+        Reconstrói o índice do zero
+        
+        Returns:
+            Número de itens indexados
+        """
+        with self._lock:
+            self._reset()
+            return self.refresh()
+    
+    def _score(self, query, limit, min_score=0.0):
+        """
+        Calcula a similaridade da consulta com os itens indexados
+        
+        Termos presentes em mais de common_ratio dos itens não geram
+        candidatos: só somam pontos aos itens que têm algum termo mais raro
+        da consulta (se todos forem frequentes, todos geram candidatos). Assim
+        uma busca não percorre as listas enormes de palavras muito comuns.
+        Itens marcados como removidos não são retornados.
+        
+        Args:
+            query: Texto da consulta
+            limit: Número máximo de itens retornados por segmento
+            min_score: Similaridade mínima dos itens retornados
+            
+        Returns:
+            Tupla (pontuações, IDs, truncado) dos itens mais parecidos de cada
+            segmento; truncado indica que algum segmento tinha mais de limit
+            itens com a similaridade mínima
+        """
+        counts = Counter(_term_bucket(term, self.bits) for term in tokenize(query))
+        if not counts or not self.num_docs:
+            return np.empty(0), np.empty(0, dtype=np.int64), False
+        
+        # Mesmo tipo dos arquivos: com outro tipo, searchsorted converteria o segmento inteiro
+        query_buckets = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        doc_freq = self.doc_freq[query_buckets]
+        idf = np.log((self.num_docs + 1) / (doc_freq + 1)) + 1.0
+        query_weights = (1.0 + np.log(tf)) * idf
+        query_weights /= np.linalg.norm(query_weights)
+        
+        rare = (doc_freq > 0) & (doc_freq <= self.common_ratio * self.num_docs)
+        exhaustive = not rare.any()
+        
+        all_scores, all_ids = [], []
+        truncated = False
+        for segment in self.segments:
+            starts = np.searchsorted(segment["buckets"], query_buckets, side="left")
+            ends = np.searchsorted(segment["buckets"], query_buckets, side="right")
+            docs, weights = [], []
+            for term in range(len(query_buckets)):
+                if (exhaustive or rare[term]) and ends[term] > starts[term]:
+                    docs.append(segment["docs"][starts[term]:ends[term]])
+                    weights.append(segment["weights"][starts[term]:ends[term]] * query_weights[term])
+            if not docs:
+                continue
+            
+            if exhaustive:
+                scores = np.bincount(np.concatenate(docs), weights=np.concatenate(weights), minlength=len(segment["ids"]))
+                candidates = np.flatnonzero(scores)
+                scores = scores[candidates]
+            else:
+                candidates, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+                scores = np.bincount(inverse, weights=np.concatenate(weights))
+                # Os documentos de cada dimensão estão em ordem crescente
+                for term in np.flatnonzero(~rare & (ends > starts)):
+                    posting_docs = segment["docs"][starts[term]:ends[term]]
+                    positions = np.minimum(np.searchsorted(posting_docs, candidates), len(posting_docs) - 1)
+                    found = posting_docs[positions] == candidates
+                    scores[found] += segment["weights"][starts[term]:ends[term]][positions[found]] * query_weights[term]
+            
+            ids = segment["ids"][candidates]
+            keep = scores >= min_score
+            if len(self.deleted):
+                keep &= ~np.isin(ids, self.deleted)
+            scores, ids = scores[keep], ids[keep]
+            if limit < len(scores):
+                truncated = True
+                top = np.argpartition(-scores, limit)[:limit]
+                scores, ids = scores[top], ids[top]
+            
+            all_scores.append(scores)
+            all_ids.append(ids)
+        
+        if not all_scores:
+            return np.empty(0), np.empty(0, dtype=np.int64), False
+        return np.concatenate(all_scores), np.concatenate(all_ids), truncated
+    
+    def search(self, query, top_k=5, min_confidence=0.0, min_score=0.05):
+        """
+        Busca os itens de conhecimento mais parecidos com a consulta
+        
+        Args:
+            query: Texto da consulta
+            top_k: Número máximo de itens retornados
+            min_confidence: Confiança mínima (0.0 a 1.0)
+            min_score: Similaridade mínima (0.0 a 1.0)
+            
+        Returns:
+            Lista de tuplas (item, similaridade), da mais parecida para a
+            menos; os itens estão no formato de Database.get_knowledge
+        """
+        # Itens abaixo da confiança mínima (ou removidos do banco sem aviso)
+        # são descartados; se sobrarem menos que top_k, mais candidatos são buscados
+        wanted = top_k * 2
+        while True:
+            with self._lock:
+                if self._stale:
+                    self.refresh()
+                scores, ids, truncated = self._score(query, wanted, min_score)
+            
+            # Com vários segmentos, pode haver mais de wanted candidatos no total
+            exhausted = not truncated and len(scores) <= wanted
+            top = np.argsort(-scores, kind="stable")[:wanted]
+            
+            items = self.database.get_knowledge_by_ids(ids[top].tolist(), min_confidence)
+            results = []
+            for position in top:
+                item = items.get(int(ids[position]))
+                if item is not None:
+                    results.append((item, float(scores[position])))
+                    if len(results) == top_k:
+                        return results
+            
+            if exhausted:
+                return results
+            wanted *= 4
+    
+    def get_stats(self):
+        """
+        Retorna o estado do índice, para monitoramento
+        
+        Returns:
+            Dicionário com itens indexados, itens removidos ainda nos
+            segmentos, último ID, número de segmentos e tamanho dos arquivos
+            em bytes
+        """
+        with self._lock:
+            size = sum(
+                os.path.getsize(self._path(name)) for name in os.listdir(self.index_dir)
+                if name.endswith(".npy") or name == "meta.json"
+            )
+            return {
+                "documents": self.num_docs,
+                "deleted": len(self.deleted),
+                "last_id": self.last_id,
+                "segments": len(self.segments),
+                "disk_bytes": size
+            }
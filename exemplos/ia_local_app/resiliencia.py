@@ -0,0 +1,525 @@
+"""
+Módulo de Resiliência para IA NOVA
+Este módulo implementa as políticas que protegem as consultas às IAs externas
+contra falhas transitórias: classificação de erros, novas tentativas com
+backoff exponencial, jitter, Retry-After e orçamento total de tempo, e
+disjuntores (circuit breakers) e limitadores de taxa por serviço e o orçamento
+de requisições de reserva (hedging).
+"""
+
+import random
+import threading
+import time
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger("NOVA_Resilience")
+
+class APIError(Exception):
+    """Erro retornado por um serviço de IA, com o status HTTP da resposta"""
+    
+    def __init__(self, service, status_code, message, retry_after=None):
+        """
+        Inicializa o erro
+        
+        Args:
+            service: Nome do serviço
+            status_code: Status HTTP da resposta (None para erros no corpo da resposta)
+            message: Mensagem de erro
+            retry_after: Espera sugerida pelo serviço em segundos (opcional)
+        """
+        super().__init__(message)
+        self.service = service
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    """
+    Interpreta o cabeçalho Retry-After
+    
+    Args:
+        value: Valor do cabeçalho, em segundos ou como data HTTP (ou None)
+    
+    Returns:
+        Espera em segundos ou None se ausente ou inválido
+    """
+    if not value:
+        return None
+    
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """Política de novas tentativas com backoff exponencial e jitter"""
+    
+    # Status que indicam falha transitória; os demais 4xx são erros do cliente
+    RETRY_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+    
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=30.0, multiplier=2.0,
+                 budget=60.0, retry_statuses=None):
+        """
+        Inicializa a política
+        
+        Args:
+            max_attempts: Número máximo de tentativas, incluindo a primeira
+            base_delay: Espera máxima antes da segunda tentativa em segundos
+            max_delay: Limite da espera entre tentativas em segundos
+            multiplier: Fator de crescimento da espera a cada tentativa
+            budget: Tempo total máximo gasto na consulta em segundos (None para ilimitado)
+            retry_statuses: Status HTTP que permitem nova tentativa (opcional)
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.budget = budget
+        self.retry_statuses = tuple(retry_statuses) if retry_statuses is not None else self.RETRY_STATUSES
+    
+    def with_overrides(self, max_attempts=None, base_delay=None):
+        """
+        Cria uma cópia da política com alguns parâmetros substituídos
+        
+        Args:
+            max_attempts: Novo número máximo de tentativas (opcional)
+            base_delay: Nova espera base em segundos (opcional)
+        
+        Returns:
+            Nova política, ou a própria se nada mudar
+        """
+        if max_attempts is None and base_delay is None:
+            return self
+        
+        return RetryPolicy(
+            max_attempts=self.max_attempts if max_attempts is None else max_attempts,
+            base_delay=self.base_delay if base_delay is None else base_delay,
+            max_delay=self.max_delay,
+            multiplier=self.multiplier,
+            budget=self.budget,
+            retry_statuses=self.retry_statuses
+        )
+    
+    def is_retryable(self, error):
+        """
+        Classifica um erro como transitório ou definitivo
+        
+        Args:
+            error: Exceção levantada pela tentativa
+        
+        Returns:
+            True se vale a pena tentar de novo
+        """
+        if isinstance(error, APIError):
+            return error.status_code in self.retry_statuses
+        
+        # Falhas de rede e timeouts (requests.RequestException também é OSError);
+        # erros de interpretação da resposta não melhoram com novas tentativas
+        return isinstance(error, (OSError, TimeoutError))
+    
+    def next_delay(self, attempt, error, started):
+        """
+        Decide se haverá nova tentativa e quanto esperar antes dela
+        
+        Args:
+            attempt: Número da tentativa que falhou, começando em 0
+            error: Exceção levantada pela tentativa
+            started: Início da consulta (time.monotonic())
+        
+        Returns:
+            Espera em segundos ou None se não houver nova tentativa
+        """
+        if attempt + 1 >= self.max_attempts or not self.is_retryable(error):
+            return None
+        
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            delay = retry_after
+        else:
+            # "Full jitter": espera aleatória até o teto exponencial
+            ceiling = min(self.max_delay, self.base_delay * self.multiplier ** attempt)
+            delay = random.uniform(0, ceiling)
+        
+        if self.budget is not None and time.monotonic() - started + delay > self.budget:
+            logger.debug(f"Orçamento de {self.budget}s esgotado, sem nova tentativa")
+            return None
+        
+        return delay
+
+
+class HedgeBudget:
+    """Limita as requisições de reserva (hedge) a uma fração das consultas"""
+    
+    def __init__(self, ratio=0.1, burst=5):
+        """
+        Inicializa o orçamento
+        
+        Cada consulta com hedge acumula ratio créditos (até burst) e cada
+        requisição de reserva gasta um, de modo que a longo prazo no máximo
+        ratio das consultas geram uma requisição extra.
+        
+        Args:
+            ratio: Fração máxima das consultas que podem gerar uma requisição de reserva
+            burst: Número máximo de créditos acumulados
+        """
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = float(burst)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "hedges": 0, "denied": 0, "hedge_wins": 0}
+    
+    def record_request(self):
+        """Registra uma consulta com hedge habilitado"""
+        with self._lock:
+            self.stats["requests"] += 1
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+    
+    def try_acquire(self):
+        """
+        Reserva crédito para uma requisição de reserva
+        
+        Returns:
+            True se a requisição de reserva pode ser enviada
+        """
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.stats["hedges"] += 1
+                return True
+            self.stats["denied"] += 1
+            return False
+    
+    def record_win(self):
+        """Registra que a requisição de reserva respondeu primeiro"""
+        with self._lock:
+            self.stats["hedge_wins"] += 1
+    
+    def get_stats(self):
+        """
+        Retorna as estatísticas de hedge
+        
+        Returns:
+            Dicionário com consultas, requisições de reserva enviadas, negadas
+            pelo orçamento e vencedoras
+        """
+        with self._lock:
+            return dict(self.stats)
+
+
+class CircuitOpenError(Exception):
+    """Consulta recusada porque o circuito do serviço está aberto"""
+
+
+class CircuitBreaker:
+    """Disjuntor por serviço (fechado / aberto / meio-aberto) com janela móvel de erros e latência"""
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, name, failure_rate_threshold=0.5, min_calls=5, window=60.0, open_timeout=30.0,
+                 half_open_max_calls=1, slow_call_threshold=None):
+        """
+        Inicializa o disjuntor
+        
+        Args:
+            name: Nome do serviço protegido
+            failure_rate_threshold: Fração de falhas na janela que abre o circuito
+            min_calls: Número mínimo de chamadas na janela antes de avaliar a taxa
+            window: Duração da janela móvel em segundos
+            open_timeout: Tempo com o circuito aberto antes de testar o serviço, em segundos
+            half_open_max_calls: Chamadas de teste simultâneas no estado meio-aberto
+            slow_call_threshold: Latência em segundos a partir da qual uma chamada
+                                 bem-sucedida conta como falha (opcional)
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.window = window
+        self.open_timeout = open_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.slow_call_threshold = slow_call_threshold
+        
+        self.state = self.CLOSED
+        self.opened_at = None
+        # (horário, falhou, latência) das chamadas dentro da janela
+        self._calls = deque()
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+    
+    def allow_request(self):
+        """
+        Verifica se uma chamada pode ser feita agora
+        
+        Toda chamada permitida deve ter o resultado registrado com
+        record_success ou record_failure.
+        
+        Returns:
+            True se a chamada pode prosseguir
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.open_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._half_open_calls = 0
+                logger.info(f"Circuito de {self.name} meio-aberto, testando o serviço")
+            
+            if self.state == self.HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    return False
+                self._half_open_calls += 1
+            
+            return True
+    
+    def is_available(self):
+        """
+        Verifica, sem reservar uma chamada de teste, se o circuito aceitaria uma chamada
+        
+        Returns:
+            False enquanto o circuito estiver aberto
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.open_timeout
+            return True
+    
+    def release(self):
+        """Libera uma chamada permitida que foi cancelada, sem registrar resultado"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._half_open_calls = max(0, self._half_open_calls - 1)
+    
+    def record_success(self, latency):
+        """
+        Registra uma chamada bem-sucedida
+        
+        Args:
+            latency: Duração da chamada em segundos
+        """
+        slow = self.slow_call_threshold is not None and latency >= self.slow_call_threshold
+        self._record(slow, latency)
+    
+    def record_failure(self, latency=None):
+        """
+        Registra uma chamada que falhou
+        
+        Args:
+            latency: Duração da chamada em segundos (opcional)
+        """
+        self._record(True, latency)
+    
+    def _record(self, failed, latency):
+        """Atualiza a janela e o estado do circuito com o resultado de uma chamada"""
+        now = time.monotonic()
+        with self._lock:
+            self._calls.append((now, failed, latency))
+            self._prune(now)
+            
+            if self.state == self.HALF_OPEN:
+                self._half_open_calls = max(0, self._half_open_calls - 1)
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = self.CLOSED
+                    self.opened_at = None
+                    # A janela recomeça para que falhas antigas não reabram o circuito
+                    self._calls.clear()
+                    logger.info(f"Circuito de {self.name} fechado")
+                return
+            
+            if self.state == self.CLOSED and len(self._calls) >= self.min_calls:
+                failures = sum(1 for _, call_failed, _ in self._calls if call_failed)
+                if failures / len(self._calls) >= self.failure_rate_threshold:
+                    self._open(now)
+    
+    def _open(self, now):
+        """Abre o circuito (chamado com o lock adquirido)"""
+        self.state = self.OPEN
+        self.opened_at = now
+        logger.warning(f"Circuito de {self.name} aberto por {self.open_timeout}s")
+    
+    def _prune(self, now):
+        """Descarta as chamadas fora da janela (chamado com o lock adquirido)"""
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+    
+    def get_state(self):
+        """
+        Retorna o estado do disjuntor para monitoramento
+        
+        Returns:
+            Dicionário com estado, chamadas e taxa de falhas na janela, latência
+            média, p50 e p95 em segundos e tempo restante com o circuito aberto
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            calls = len(self._calls)
+            failures = sum(1 for _, failed, _ in self._calls if failed)
+            latencies = sorted(latency for _, _, latency in self._calls if latency is not None)
+            state = self.state
+            retry_in = None
+            if state == self.OPEN:
+                retry_in = max(0.0, self.open_timeout - (now - self.opened_at))
+        
+        return {
+            "state": state,
+            "calls": calls,
+            "failure_rate": failures / calls if calls else 0.0,
+            "avg_latency": sum(latencies) / len(latencies) if latencies else None,
+            "p50_latency": latencies[(len(latencies) - 1) // 2] if latencies else None,
+            "p95_latency": latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+            "retry_in": retry_in
+        }
+
+
+class RateLimitExceeded(Exception):
+    """Consulta recusada porque a espera na fila do limitador passaria do máximo"""
+
+
+class RateLimiter:
+    """Limitador por serviço com baldes de requisições e de tokens por minuto"""
+    
+    def __init__(self, name, requests_per_minute=None, tokens_per_minute=None, max_wait=60.0):
+        """
+        Inicializa o limitador
+        
+        Cada chamada reserva sua vez: os baldes podem ficar negativos e quem
+        chega depois espera o reabastecimento correspondente, o que atende as
+        chamadas na ordem de chegada, sejam threads ou corrotinas.
+        
+        Args:
+            name: Nome do serviço
+            requests_per_minute: Limite de requisições por minuto (None para ilimitado)
+            tokens_per_minute: Limite de tokens por minuto (None para ilimitado)
+            max_wait: Espera máxima na fila em segundos (None para ilimitada)
+        """
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait = max_wait
+        
+        now = time.monotonic()
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._updated = now
+        self._paused_until = now
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self.stats = {
+            "acquired": 0,
+            "rejected": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0,
+            "max_queue_depth": 0,
+            "refunded": 0
+        }
+    
+    def reserve(self, tokens=1):
+        """
+        Reserva uma requisição com o número de tokens estimado
+        
+        Quem chama deve esperar o tempo retornado antes de enviar a requisição
+        e depois chamar done_waiting; se desistir antes de enviá-la, deve
+        devolver a reserva com refund.
+        
+        Args:
+            tokens: Tokens estimados da requisição (prompt + resposta)
+            
+        Returns:
+            Espera em segundos ou None se ela passaria de max_wait
+        """
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated
+            self._updated = now
+            
+            wait = max(0.0, self._paused_until - now)
+            if self.requests_per_minute:
+                self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+                wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+            if self.tokens_per_minute:
+                # Uma requisição maior que o balde inteiro espera apenas o balde encher
+                tokens = min(tokens, self.tokens_per_minute)
+                self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+                wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+            
+            if self.max_wait is not None and wait > self.max_wait:
+                self.stats["rejected"] += 1
+                return None
+            
+            if self.requests_per_minute:
+                self._requests -= 1
+            if self.tokens_per_minute:
+                self._tokens -= tokens
+            
+            self.stats["acquired"] += 1
+            self.stats["total_wait"] += wait
+            self.stats["max_wait"] = max(self.stats["max_wait"], wait)
+            if wait > 0:
+                self._waiting += 1
+                self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self._waiting)
+            return wait
+    
+    def done_waiting(self, wait):
+        """
+        Registra o fim da espera de uma reserva
+        
+        Args:
+            wait: Espera retornada por reserve
+        """
+        if wait:
+            with self._lock:
+                self._waiting -= 1
+    
+    def refund(self, tokens=1):
+        """
+        Devolve aos baldes uma reserva que não chegou a ser usada
+        
+        Args:
+            tokens: Tokens informados em reserve
+        """
+        with self._lock:
+            if self.requests_per_minute:
+                self._requests = min(self.requests_per_minute, self._requests + 1)
+            if self.tokens_per_minute:
+                tokens = min(tokens, self.tokens_per_minute)
+                self._tokens = min(self.tokens_per_minute, self._tokens + tokens)
+            self.stats["refunded"] += 1
+    
+    def pause(self, seconds):
+        """
+        Suspende novas requisições, por exemplo após um 429 do serviço
+        
+        Args:
+            seconds: Duração da pausa em segundos
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        logger.info(f"Requisições a {self.name} suspensas por {seconds:.1f}s")
+    
+    def get_stats(self):
+        """
+        Retorna as estatísticas do limitador
+        
+        Returns:
+            Dicionário com requisições liberadas, recusadas e devolvidas,
+            profundidade atual e máxima da fila e espera média e máxima em segundos
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["queue_depth"] = self._waiting
+        stats["avg_wait"] = stats["total_wait"] / stats["acquired"] if stats["acquired"] else 0.0
+        return stats
@@ -0,0 +1,234 @@
+"""
+Módulo de Roteamento entre IAs para IA NOVA
+Este módulo implementa a escolha automática do serviço de IA de cada consulta,
+com base na latência e na taxa de erros observadas, no custo por token de cada
+serviço e na disponibilidade do Ollama local.
+"""
+
+import random
+import threading
+import time
+import logging
+from urllib.parse import urlparse
+
+logger = logging.getLogger("NOVA_Router")
+
+# Custo aproximado em dólares por 1000 tokens (entrada + saída) de cada serviço
+DEFAULT_COSTS = {
+    "ollama_local": 0.0,
+    "huggingface": 0.0,
+    "gemini": 0.0005,
+    "openai": 0.0015,
+    "anthropic": 0.003,
+    "custom_ia": 0.001
+}
+
+# Latência típica em segundos, usada enquanto não há medições do serviço
+DEFAULT_LATENCIES = {
+    "ollama_local": 1.5,
+    "huggingface": 3.0,
+    "gemini": 1.5,
+    "openai": 1.5,
+    "anthropic": 2.0,
+    "custom_ia": 2.0
+}
+
+class ProviderRouter:
+    """Escolhe o serviço de cada consulta pela latência, erros e custo observados"""
+    
+    STRATEGIES = ("fastest", "weighted", "hedged")
+    
+    def __init__(self, ai_comm, costs=None, cost_weight=200.0, tail_weight=0.25,
+                 expected_output_tokens=256, probe_interval=30.0):
+        """
+        Inicializa o roteador
+        
+        Args:
+            ai_comm: Instância de AIComm, fonte das medições (disjuntores) e das chaves
+            costs: Custo em dólares por 1000 tokens de cada serviço (opcional)
+            cost_weight: Quantos segundos de latência equivalem a um dólar
+            tail_weight: Peso da cauda (p95 - p50) na latência esperada
+            expected_output_tokens: Tokens de saída estimados por resposta
+            probe_interval: Intervalo entre verificações do Ollama local em segundos
+        """
+        self.ai_comm = ai_comm
+        self.costs = dict(DEFAULT_COSTS)
+        self.costs.update(costs or {})
+        self.cost_weight = cost_weight
+        self.tail_weight = tail_weight
+        self.expected_output_tokens = expected_output_tokens
+        self.probe_interval = probe_interval
+        
+        self._ollama_checked_at = None
+        self._ollama_available = False
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def estimate_tokens(text):
+        """
+        Estima o número de tokens de um texto (cerca de 4 caracteres por token)
+        
+        Args:
+            text: Texto a ser estimado
+        
+        Returns:
+            Número estimado de tokens
+        """
+        return len(text or "") // 4 + 1
+    
+    def candidates(self, services=None):
+        """
+        Lista os serviços que podem receber a consulta agora
+        
+        Args:
+            services: Serviços considerados (opcional, usa todos os configurados)
+        
+        Returns:
+            Serviços com chave configurada, circuito fechado e, no caso do
+            Ollama local, servidor respondendo
+        """
+        services = services or self.ai_comm._default_services()
+        available = []
+        for service in services:
+            if service == "ollama_local":
+                if not self.ollama_available():
+                    continue
+            elif not self.ai_comm.api_keys.get(service):
+                continue
+            if self.ai_comm.get_circuit_breaker(service).is_available():
+                available.append(service)
+        return available
+    
+    def ollama_available(self):
+        """
+        Verifica se o servidor do Ollama local está no ar
+        
+        O resultado fica guardado por probe_interval segundos.
+        
+        Returns:
+            True se o servidor respondeu
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._ollama_checked_at is not None and now - self._ollama_checked_at < self.probe_interval:
+                return self._ollama_available
+            self._ollama_checked_at = now
+        
+        endpoint = urlparse(self.ai_comm.api_endpoints["ollama_local"])
+        try:
+            response = self.ai_comm.http.get(f"{endpoint.scheme}://{endpoint.netloc}/api/tags", timeout=0.5)
+            available = response.status_code == 200
+        except Exception:
+            available = False
+        
+        with self._lock:
+            if available != self._ollama_available:
+                logger.info(f"Ollama local {'disponível' if available else 'indisponível'}")
+            self._ollama_available = available
+        return available
+    
+    def latency(self, service):
+        """
+        Retorna a latência observada de um serviço
+        
+        Args:
+            service: Nome do serviço
+        
+        Returns:
+            Tupla (p50, p95) em segundos, com valores típicos se não houver medições
+        """
+        state = self.ai_comm.get_circuit_breaker(service).get_state()
+        if state["p50_latency"] is None:
+            default = DEFAULT_LATENCIES.get(service, 2.0)
+            return default, default * 2
+        return state["p50_latency"], state["p95_latency"]
+    
+    def score(self, service, prompt=None):
+        """
+        Calcula o custo esperado de uma consulta bem-sucedida ao serviço
+        
+        Soma a latência esperada (mediana mais parte da cauda) ao custo em
+        dólares convertido em segundos, e divide pela chance de sucesso, que
+        cai com a taxa de erros recente.
+        
+        Args:
+            service: Nome do serviço
+            prompt: Prompt da consulta, para estimar os tokens (opcional)
+        
+        Returns:
+            Pontuação em segundos equivalentes (menor é melhor)
+        """
+        p50, p95 = self.latency(service)
+        expected_latency = p50 + self.tail_weight * max(0.0, p95 - p50)
+        
+        tokens = self.estimate_tokens(prompt) + self.expected_output_tokens
+        cost = self.costs.get(service, 0.0) * tokens / 1000
+        
+        failure_rate = self.ai_comm.get_circuit_breaker(service).get_state()["failure_rate"]
+        return (expected_latency + cost * self.cost_weight) / max(0.05, 1.0 - failure_rate)
+    
+    def rank(self, services=None, prompt=None, strategy="fastest"):
+        """
+        Ordena os serviços candidatos para uma consulta
+        
+        Args:
+            services: Serviços considerados (opcional)
+            prompt: Prompt da consulta (opcional)
+            strategy: "fastest" ou "hedged" ordenam pela pontuação; "weighted"
+                      sorteia a ordem com probabilidade inversa à pontuação,
+                      espalhando a carga entre serviços parecidos
+        
+        Returns:
+            Lista de serviços, do preferido ao último recurso
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Estratégia de roteamento desconhecida: {strategy}")
+        
+        scores = {service: self.score(service, prompt) for service in self.candidates(services)}
+        if strategy != "weighted":
+            return sorted(scores, key=scores.get)
+        
+        ranked = []
+        remaining = dict(scores)
+        while remaining:
+            services_left = list(remaining)
+            weights = [1.0 / max(remaining[s], 1e-6) for s in services_left]
+            choice = random.choices(services_left, weights=weights)[0]
+            ranked.append(choice)
+            del remaining[choice]
+        return ranked
+    
+    def hedge_delay(self, service):
+        """
+        Retorna quanto esperar pela resposta de um serviço antes de acionar outro
+        
+        Args:
+            service: Nome do serviço
+        
+        Returns:
+            p95 observado do serviço em segundos
+        """
+        return self.latency(service)[1]
+    
+    def get_report(self, services=None, prompt=None):
+        """
+        Retorna as métricas usadas no roteamento, para monitoramento
+        
+        Args:
+            services: Serviços considerados (opcional)
+            prompt: Prompt de referência (opcional)
+        
+        Returns:
+            Dicionário com latências, taxa de erros, custo e pontuação de cada serviço candidato
+        """
+        report = {}
+        for service in self.candidates(services):
+            p50, p95 = self.latency(service)
+            report[service] = {
+                "p50_latency": p50,
+                "p95_latency": p95,
+                "failure_rate": self.ai_comm.get_circuit_breaker(service).get_state()["failure_rate"],
+                "cost_per_1k_tokens": self.costs.get(service, 0.0),
+                "score": self.score(service, prompt)
+            }
+        return report
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# Os módulos do exemplo são importados pelo nome, como nos scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Banco de dados temporário, fechado ao final do teste"""
+    from atualizacao_automatica import Database
+    
+    db = Database(str(tmp_path / "nova.db"))
+    yield db
+    db.close()
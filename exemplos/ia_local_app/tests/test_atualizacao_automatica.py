@@ -0,0 +1,413 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from atualizacao_automatica import Database, ResumableDownloader, Updater, iter_json_items
+
+
+class FakeResponse:
+    """Resposta HTTP mínima usada pelos testes"""
+    
+    def __init__(self, status_code=200, body=b"", headers=None, chunk_size=7, before_body=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+        self.chunk_size = chunk_size
+        self.before_body = before_body
+        self.closed = False
+        self.read_by = None
+    
+    def json(self):
+        return json.loads(self.body)
+    
+    def iter_content(self, chunk_size=None):
+        self.read_by = threading.current_thread().name
+        if self.before_body:
+            self.before_body()
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+    
+    def close(self):
+        self.closed = True
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FakeTransport:
+    """Transporte que devolve respostas fixas e registra as requisições"""
+    
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+    
+    def get(self, url, headers=None, timeout=None, stream=False):
+        self.requests.append({"url": url, "headers": headers or {}})
+        return self.responses[url]
+
+
+def make_updater(database, responses, **kwargs):
+    kwargs.setdefault("retention_interval", None)
+    return Updater(database, transport=FakeTransport(responses), **kwargs)
+
+
+def test_fetch_source_survives_new_data_source_columns(database):
+    database.add_data_source("extra_source", "https://example.com/extra")
+    database.cursor.execute("ALTER TABLE data_sources ADD COLUMN priority INTEGER DEFAULT 0")
+    database.conn.commit()
+    
+    source = next(s for s in database.get_data_sources() if s[1] == "extra_source")
+    database.update_data_source_validators(source[0], '"v1"', None)
+    source = database.get_data_source(source[0])
+    
+    updater = make_updater(database, {"https://example.com/extra": FakeResponse(304)})
+    result = updater._fetch_source(source, lambda result: None)
+    
+    assert result["status"] == "not_modified"
+    assert updater.http.requests[0]["headers"]["If-None-Match"] == '"v1"'
+
+
+def test_content_hash_ignores_case_and_whitespace(database):
+    assert database._content_hash("Python", "Uma  linguagem\n") == database._content_hash("python", "uma linguagem")
+    assert database._content_hash("python", "uma linguagem") != database._content_hash("python", "outra linguagem")
+    # O separador impede que tópico e conteúdo se misturem
+    assert database._content_hash("ab", "c") != database._content_hash("a", "bc")
+
+
+def test_upsert_keeps_one_row_with_highest_confidence(database):
+    database.add_knowledge("python", "Uma linguagem", "a", confidence=0.6)
+    database.add_knowledge("Python", "uma  linguagem", "b", confidence=0.9)
+    total = database.add_knowledge_many([
+        {"topic": "python", "content": "uma linguagem", "confidence": 0.7},
+        {"topic": "rust", "content": "outra linguagem"}
+    ], source="c")
+    
+    assert total == 2
+    rows = database.cursor.execute("SELECT topic, confidence FROM knowledge ORDER BY id").fetchall()
+    assert rows == [("python", 0.9), ("rust", 1.0)]
+
+
+def test_upsert_notifies_existing_row_id(database):
+    notified = []
+    database.add_change_listener(lambda table, row_id: notified.append(row_id))
+    database.add_knowledge("python", "uma linguagem", "a")
+    database.add_knowledge("rust", "outra linguagem", "a")
+    database.add_knowledge("Python", "Uma linguagem", "b")
+    
+    assert notified == [1, 2, 1]
+
+
+def test_compact_knowledge_merges_rows_without_hash(database):
+    for confidence in (0.5, 0.8, 0.3):
+        database.cursor.execute(
+            "INSERT INTO knowledge (topic, content, source, timestamp, confidence) VALUES (?, ?, ?, datetime('now'), ?)",
+            ("python", "Uma linguagem", "antigo", confidence)
+        )
+    database.conn.commit()
+    
+    assert database.compact_knowledge(batch_size=2) == 2
+    rows = database.cursor.execute("SELECT confidence, content_hash FROM knowledge").fetchall()
+    assert rows == [(0.8, database._content_hash("python", "Uma linguagem"))]
+
+
+def split_bytes(text, size):
+    data = text.encode("utf-8")
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 64])
+def test_iter_json_items_streams_arrays_and_ndjson(size):
+    array = '[{"a": 1}, {"b": "ação"}, 12345, [1, 2]]'
+    ndjson = '{"a": 1}\n{"b": "ação"}\n12345\n'
+    
+    assert list(iter_json_items(split_bytes(array, size))) == [{"a": 1}, {"b": "ação"}, 12345, [1, 2]]
+    assert list(iter_json_items(split_bytes(ndjson, size))) == [{"a": 1}, {"b": "ação"}, 12345]
+    assert list(iter_json_items(split_bytes(" [ ] ", size))) == []
+
+
+def test_iter_json_items_ignores_top_level_object():
+    assert list(iter_json_items(split_bytes('{"items": [{"topic": "a", "content": "b"}]}', 5))) == []
+    assert list(iter_json_items([b"42"])) == []
+
+
+def test_iter_json_items_rejects_truncated_array():
+    with pytest.raises(ValueError):
+        list(iter_json_items([b'[{"a": 1}, {"b"']))
+
+
+def knowledge_payload(count, prefix):
+    return json.dumps([{"topic": f"{prefix}_{i}", "content": f"conteúdo {i}"} for i in range(count)]).encode("utf-8")
+
+
+def sources_by_name(database):
+    return {source[1]: source for source in database.get_data_sources()}
+
+
+def test_refresh_sources_reads_bodies_in_parallel_workers(database):
+    # Os dois corpos só avançam se forem lidos ao mesmo tempo
+    barrier = threading.Barrier(2, timeout=5)
+    news = json.dumps([{"title": "t", "content": "c", "category": "ia"}]).encode("utf-8")
+    responses = {
+        "https://api.example.com/knowledge": FakeResponse(body=knowledge_payload(50, "k"), before_body=barrier.wait),
+        "https://api.example.com/news": FakeResponse(body=news, before_body=barrier.wait)
+    }
+    updater = make_updater(database, responses)
+    sources = sources_by_name(database)
+    
+    updater._refresh_sources([sources["knowledge_base"], sources["news_feed"]])
+    
+    assert updater.stats["errors"] == 0
+    assert updater.stats["refreshes"] == 2
+    assert database.cursor.execute("SELECT COUNT(*) FROM knowledge").fetchone()[0] == 51
+    for response in responses.values():
+        assert response.read_by.startswith("nova_fetch")
+        assert response.closed
+
+
+def test_stream_is_bounded_and_released_when_abandoned(database):
+    database.add_data_source("unknown_source", "https://other.example.com/data")
+    response = FakeResponse(body=knowledge_payload(500, "x"))
+    updater = make_updater(database, {"https://other.example.com/data": response}, max_per_host=1)
+    updater.STREAM_QUEUE_SIZE = 10
+    
+    # Fonte sem processamento: os itens nunca são consumidos
+    updater._refresh_sources([sources_by_name(database)["unknown_source"]])
+    
+    host_limit = updater._get_host_limit("https://other.example.com/data")
+    assert host_limit.acquire(timeout=5)
+    host_limit.release()
+    assert response.closed
+
+
+def test_top_level_object_payload_is_not_ingested(database):
+    body = json.dumps({"topic": "a", "content": "b"}).encode("utf-8")
+    for stream_payloads in (True, False):
+        updater = make_updater(
+            database,
+            {"https://api.example.com/knowledge": FakeResponse(body=body)},
+            stream_payloads=stream_payloads
+        )
+        updater._refresh_sources([sources_by_name(database)["knowledge_base"]])
+        assert updater.stats["errors"] == 0
+    
+    assert database.cursor.execute("SELECT COUNT(*) FROM knowledge").fetchone()[0] == 0
+
+
+def test_truncated_stream_counts_as_error(database):
+    updater = make_updater(database, {"https://api.example.com/knowledge": FakeResponse(body=b'[{"topic": "a",')})
+    updater._refresh_sources([sources_by_name(database)["knowledge_base"]])
+    
+    assert updater.stats["errors"] == 1
+    assert updater.stats["refreshes"] == 0
+
+
+def test_streamed_knowledge_commits_each_chunk(database):
+    other = sqlite3.connect(database.db_path, timeout=0)
+    
+    def items():
+        for i in range(5):
+            if i == 3:
+                # Entre os blocos, outro escritor não encontra o banco bloqueado
+                other.execute("INSERT INTO settings (key, value) VALUES ('outro', 'escritor')")
+                other.commit()
+                raise ConnectionError("conexão perdida")
+            yield {"topic": f"t{i}", "content": f"c{i}"}
+    
+    with pytest.raises(ConnectionError):
+        database.add_knowledge_many(items(), source="teste", chunk_size=1, transactional=False)
+    other.close()
+    
+    # Os blocos gravados antes da falha são preservados
+    assert database.cursor.execute("SELECT COUNT(*) FROM knowledge").fetchone()[0] == 3
+
+
+def test_truncated_stream_keeps_committed_chunks(database):
+    body = knowledge_payload(2500, "x")[:-20]
+    updater = make_updater(database, {"https://api.example.com/knowledge": FakeResponse(body=body, chunk_size=4096)})
+    updater._refresh_sources([sources_by_name(database)["knowledge_base"]])
+    
+    assert updater.stats["errors"] == 1
+    assert database.cursor.execute("SELECT COUNT(*) FROM knowledge").fetchone()[0] == 2000
+
+
+class FileServer:
+    """Transporte que serve um arquivo com suporte a HEAD e Range"""
+    
+    def __init__(self, content, ranges=True):
+        self.content = content
+        self.ranges = ranges
+        self.requests = []
+    
+    def head(self, url, headers=None, timeout=None, allow_redirects=True):
+        headers = {"Content-Length": str(len(self.content))}
+        if self.ranges:
+            headers["Accept-Ranges"] = "bytes"
+        return FakeResponse(headers=headers)
+    
+    def get(self, url, headers=None, stream=False, timeout=None):
+        byte_range = (headers or {}).get("Range")
+        self.requests.append(byte_range)
+        if not byte_range:
+            return FakeResponse(body=self.content, chunk_size=1000)
+        start, end = byte_range[len("bytes="):].split("-")
+        return FakeResponse(206, self.content[int(start):int(end) + 1], chunk_size=1000)
+
+
+@pytest.mark.parametrize("ranges", [True, False])
+def test_download_in_segments_verifies_checksum(tmp_path, ranges):
+    content = os.urandom(10000)
+    server = FileServer(content, ranges=ranges)
+    downloader = ResumableDownloader(segments=4, min_segment_size=1000, transport=server)
+    dest = str(tmp_path / "weights.bin")
+    
+    result = downloader.download("https://example.com/w", dest, sha256=hashlib.sha256(content).hexdigest())
+    
+    assert result["size"] == len(content)
+    assert open(dest, "rb").read() == content
+    assert len(server.requests) == (4 if ranges else 1)
+    assert not os.path.exists(dest + ".part.json")
+
+
+def test_download_zero_byte_file(tmp_path):
+    downloader = ResumableDownloader(transport=FileServer(b""))
+    dest = str(tmp_path / "empty.bin")
+    
+    result = downloader.download("https://example.com/empty", dest, sha256=hashlib.sha256(b"").hexdigest())
+    
+    assert result["size"] == 0
+    assert open(dest, "rb").read() == b""
+
+
+def test_download_rejects_incomplete_segments(tmp_path, monkeypatch):
+    downloader = ResumableDownloader(segments=2, min_segment_size=100, transport=FileServer(os.urandom(1000)))
+    # Um segmento que "termina" sem gravar nada não pode passar despercebido,
+    # mesmo com o arquivo temporário já pré-alocado no tamanho final
+    monkeypatch.setattr(downloader, "_download_segment", lambda *args: None)
+    
+    with pytest.raises(IOError, match="incompleto"):
+        downloader.download("https://example.com/w", str(tmp_path / "w.bin"))
+
+
+def test_update_loop_retries_failed_schedule_load(database, monkeypatch):
+    monkeypatch.setattr(Updater, "SCHEDULE_RETRY_DELAY", 0.05)
+    updater = make_updater(database, {})
+    loaded = threading.Event()
+    calls = []
+    
+    def load_schedule():
+        calls.append(1)
+        if len(calls) < 3:
+            raise sqlite3.OperationalError("database is locked")
+        updater.running = False
+        loaded.set()
+    
+    monkeypatch.setattr(updater, "_load_schedule", load_schedule)
+    updater.running = True
+    thread = threading.Thread(target=updater._update_loop, daemon=True)
+    thread.start()
+    
+    assert loaded.wait(2)
+    thread.join(2)
+    assert len(calls) == 3
+
+
+def test_failed_update_backs_off_and_is_abandoned(database, tmp_path, monkeypatch):
+    content = b"pesos corrompidos"
+    updater = make_updater(database, {})
+    updater.http = FileServer(content)
+    database.add_update("model_weights", json.dumps({
+        "weights_url": "https://example.com/w",
+        "local_path": str(tmp_path / "models" / "w.bin"),
+        "sha256": hashlib.sha256(b"outros pesos").hexdigest()
+    }))
+    
+    clock = [1000.0]
+    monkeypatch.setattr("atualizacao_automatica.time.time", lambda: clock[0])
+    
+    delays = []
+    for _ in range(updater.MAX_UPDATE_ATTEMPTS):
+        updater.apply_pending_updates()
+        # Enquanto o prazo não vence, a atualização não é baixada de novo
+        requests_before = len(updater.http.requests)
+        updater.apply_pending_updates()
+        assert len(updater.http.requests) == requests_before
+        
+        attempts, next_attempt, last_error = database.cursor.execute(
+            "SELECT attempts, next_attempt, last_error FROM updates"
+        ).fetchone()
+        delays.append(next_attempt - clock[0])
+        clock[0] = next_attempt
+    
+    assert attempts == updater.MAX_UPDATE_ATTEMPTS
+    assert "Checksum" in last_error
+    assert delays[:3] == [300, 600, 1200]
+    assert max(delays) == updater.UPDATE_RETRY_MAX_DELAY
+    assert database.get_pending_updates(max_attempts=updater.MAX_UPDATE_ATTEMPTS) == []
+
+
+def add_old_knowledge(database, topic, days, confidence=1.0):
+    database.cursor.execute(
+        "INSERT INTO knowledge (topic, content, source, timestamp, confidence) VALUES (?, ?, ?, ?, ?)",
+        (topic, f"conteúdo de {topic}", "teste", datetime.now() - timedelta(days=days), confidence)
+    )
+    database.conn.commit()
+    return database.cursor.lastrowid
+
+
+def test_retention_filter_builds_conditions():
+    where, params = Database._retention_filter(
+        {"table": "knowledge", "topic_prefix": "news_", "max_age_days": 30, "max_confidence": 0.8}
+    )
+    
+    assert where == "substr(topic, 1, ?) = ? AND timestamp < ? AND confidence <= ?"
+    assert params[:2] == [5, "news_"]
+    assert abs((datetime.now() - timedelta(days=30) - params[2]).total_seconds()) < 5
+    assert params[3] == 0.8
+
+
+@pytest.mark.parametrize("policy", [
+    {"table": "settings", "max_age_days": 1},
+    {"table": "knowledge", "max_age_days": 1, "action": "compress"},
+    {"table": "interactions", "max_age_days": 1, "topic_prefix": "news_"},
+    {"table": "knowledge"},
+])
+def test_retention_filter_rejects_invalid_policies(policy):
+    with pytest.raises(ValueError):
+        Database._retention_filter(policy)
+
+
+def test_retention_archives_deletes_and_notifies(database, tmp_path):
+    old = [add_old_knowledge(database, f"news_{i}", 60) for i in range(5)]
+    # "_" não é curinga, e itens recentes ficam
+    kept = [add_old_knowledge(database, "newsXa", 60), add_old_knowledge(database, "news_recente", 1)]
+    removed = []
+    database.add_delete_listener(lambda table, row_ids: removed.append((table, list(row_ids))))
+    
+    results = database.apply_retention(
+        [{"name": "noticias", "table": "knowledge", "topic_prefix": "news_", "max_age_days": 30}],
+        str(tmp_path / "archive"), batch_size=2, pause=0
+    )
+    
+    assert results == {"noticias": 5}
+    assert [row[0] for row in database.cursor.execute("SELECT id FROM knowledge ORDER BY id")] == kept
+    assert removed == [("knowledge", old[0:2]), ("knowledge", old[2:4]), ("knowledge", old[4:])]
+    
+    (archive_name,) = os.listdir(tmp_path / "archive")
+    with gzip.open(tmp_path / "archive" / archive_name, "rt", encoding="utf-8") as archive:
+        records = [json.loads(line) for line in archive]
+    assert [record["row"]["id"] for record in records] == old
+    assert {record["policy"] for record in records} == {"noticias"}
+
+
+def test_new_database_uses_incremental_auto_vacuum(database):
+    assert "auto_vacuum" not in database.connections.pragmas
+    assert database.cursor.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
@@ -0,0 +1,226 @@
+import sqlite3
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+from atualizacao_automatica import Database
+from cache_respostas import (ResponseCache, SemanticCache, SingleFlight, SEMANTIC_CACHE_HELPERS,
+                             create_semantic_cache)
+from indice_vetorial import np
+
+needs_numpy = pytest.mark.skipif(np is None, reason="numpy não instalado")
+
+
+NEAR_MISSES = [
+    ("Como faço para instalar o Python no Windows?", "Como faço para desinstalar o Python no Windows?"),
+    ("O produto é bom", "O produto não é bom"),
+    ("Quais as novidades do Llama 2?", "Quais as novidades do Llama 3?"),
+]
+
+PARAPHRASES = [
+    ("Como faço para instalar o Python no Windows?", "Como instalo Python no Windows?"),
+    ("O produto é bom", "Esse produto é muito bom"),
+]
+
+
+def topic_embed(text):
+    """Modelo de embeddings de teste: textos sobre o mesmo assunto têm o mesmo vetor"""
+    vector = np.zeros(8, dtype=np.float32)
+    vector[0 if "python" in text.lower() else 1] = 1.0
+    return vector
+
+
+def test_make_key_is_stable_and_ignores_key_order_and_query_string():
+    key = ResponseCache.make_key("openai", "https://api.example.com/v1/chat", {"model": "m", "prompt": "olá"})
+    
+    assert len(key) == 64
+    assert key == ResponseCache.make_key("openai", "https://api.example.com/v1/chat?key=segredo",
+                                         {"prompt": "olá", "model": "m"})
+
+
+@pytest.mark.parametrize("service, url, payload", [
+    ("huggingface", "https://api.example.com/v1/chat", {"model": "m", "prompt": "olá"}),
+    ("openai", "https://api.example.com/v1/outro", {"model": "m", "prompt": "olá"}),
+    ("openai", "https://api.example.com/v1/chat", {"model": "m2", "prompt": "olá"}),
+    ("openai", "https://api.example.com/v1/chat", {"model": "m", "prompt": "ola"}),
+    ("openai", "https://api.example.com/v1/chat", {"model": "m", "prompt": "olá", "temperature": 0}),
+])
+def test_make_key_changes_with_request(service, url, payload):
+    base = ResponseCache.make_key("openai", "https://api.example.com/v1/chat", {"model": "m", "prompt": "olá"})
+    assert ResponseCache.make_key(service, url, payload) != base
+
+
+def test_response_cache_evicts_least_recently_used_and_expired(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("cache_respostas.time.time", lambda: clock[0])
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", "resposta a", 60)
+    cache.set("b", "resposta b", 10)
+    cache.get("a")
+    cache.set("c", "resposta c", 60)
+    
+    assert cache.get("b") is None
+    assert cache.get("a") == "resposta a"
+    clock[0] += 61
+    assert cache.get("a") is None
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_response_cache_reads_persistent_layer(database):
+    ResponseCache(database).set("chave", "resposta", 60, service="openai", model="m")
+    cache = ResponseCache(database)
+    
+    assert cache.get("chave") == "resposta"
+    assert cache.get("chave") == "resposta"
+    stats = cache.get_stats()
+    assert (stats["persistent_hits"], stats["memory_hits"]) == (1, 1)
+
+
+def test_persistent_hit_does_not_write_and_accesses_are_flushed_in_batches(database):
+    ResponseCache(database).set("chave", "resposta", 60)
+    database.cursor.execute("UPDATE ai_response_cache SET last_access = 0")
+    database.conn.commit()
+    cache = ResponseCache(database, access_flush_size=1)
+    
+    assert cache.get("chave") == "resposta"
+    assert database.cursor.execute("SELECT last_access FROM ai_response_cache").fetchone()[0] == 0
+    
+    cache.set("outra", "resposta", 60)
+    assert database.cursor.execute(
+        "SELECT last_access FROM ai_response_cache WHERE key = 'chave'"
+    ).fetchone()[0] > 0
+
+
+def test_locked_database_degrades_to_memory(tmp_path):
+    database = Database(str(tmp_path / "nova.db"), pragmas={"busy_timeout": 0})
+    ResponseCache(database).set("chave", "resposta", 60)
+    locker = sqlite3.connect(str(tmp_path / "nova.db"))
+    locker.execute("BEGIN EXCLUSIVE")
+    try:
+        cache = ResponseCache(database, access_flush_size=1)
+        started = time.monotonic()
+        # Com WAL, a leitura não espera pelo escritor e não grava nada
+        assert cache.get("chave") == "resposta"
+        # A gravação falha, mas a resposta fica em memória
+        cache.set("nova", "resposta nova", 60)
+        assert cache.get("nova") == "resposta nova"
+        assert time.monotonic() - started < 1
+        assert cache.get_stats()["persistent_errors"] == 1
+    finally:
+        locker.rollback()
+        locker.close()
+    
+    # Sem transação pendurada: o banco volta a ser usado normalmente
+    cache.set("depois", "resposta", 60)
+    assert ResponseCache(database).get("depois") == "resposta"
+    assert cache.get_stats()["persistent_errors"] == 1
+    database.close()
+
+
+@needs_numpy
+def test_default_embedding_accepts_only_surface_variants():
+    cache = SemanticCache()
+    cache.set("answer", "Como instalar o Python no Windows?", "resposta", 60)
+    
+    assert cache.get("answer", "como instalar python no windows", 0.9) == "resposta"
+    assert cache.get("answer", "Como instalar o Python no Linux?", 0.5) is None
+
+
+@needs_numpy
+@pytest.mark.parametrize("cached, query", NEAR_MISSES + [(query, cached) for cached, query in NEAR_MISSES])
+def test_default_embedding_rejects_near_misses(cached, query):
+    cache = SemanticCache()
+    cache.set("answer", cached, "resposta", 60)
+    
+    assert cache.get("answer", query, 0.5) is None
+
+
+@needs_numpy
+@pytest.mark.parametrize("cached, query", PARAPHRASES)
+def test_model_embedding_accepts_paraphrases(cached, query):
+    cache = SemanticCache(embed=topic_embed)
+    cache.set("answer", cached, "resposta", 60)
+    
+    assert cache.get("answer", query, 0.9) == "resposta"
+
+
+@needs_numpy
+@pytest.mark.parametrize("cached, query", NEAR_MISSES[:2] + [(query, cached) for cached, query in NEAR_MISSES[:2]])
+def test_model_embedding_rejects_negations(cached, query):
+    # O modelo de teste dá similaridade 1 aos dois textos
+    cache = SemanticCache(embed=topic_embed)
+    cache.set("answer", cached, "resposta", 60)
+    
+    assert cache.get("answer", query, 0.9) is None
+    assert cache.get_stats()["rejected"] == 1
+
+
+@needs_numpy
+def test_rejected_candidate_does_not_hide_compatible_one():
+    cache = SemanticCache(embed=topic_embed)
+    cache.set("answer", "Como desinstalar o Python?", "remoção", 60)
+    cache.set("answer", "Como instalar o Python?", "instalação", 60)
+    
+    assert cache.get("answer", "Como instalo o Python?", 0.9) == "instalação"
+
+
+@needs_numpy
+def test_answer_requires_embedding_model(database):
+    from comunicacao_ia import AIComm
+    
+    assert SEMANTIC_CACHE_HELPERS["answer"]["requires_model"]
+    assert "answer" not in AIComm(database, semantic_cache=SemanticCache()).semantic_helpers
+    assert "answer" in AIComm(database, semantic_cache=SemanticCache(embed=topic_embed)).semantic_helpers
+
+
+@needs_numpy
+def test_semantic_cache_disabled_without_sentence_transformers(monkeypatch):
+    monkeypatch.setitem(sys.modules, "sentence_transformers", None)
+    assert create_semantic_cache() is None
+
+
+@needs_numpy
+def test_semantic_cache_uses_local_sentence_transformers_model(monkeypatch, database):
+    from comunicacao_ia import AIComm
+    
+    class FakeSentenceTransformer:
+        def __init__(self, name):
+            self.name = name
+        
+        def encode(self, text, normalize_embeddings=False):
+            assert normalize_embeddings
+            return topic_embed(text)
+    
+    module = types.ModuleType("sentence_transformers")
+    module.SentenceTransformer = FakeSentenceTransformer
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+    
+    cache = create_semantic_cache()
+    assert cache.uses_model
+    cache.set("answer", "Como faço para instalar o Python no Windows?", "resposta", 60)
+    assert cache.get("answer", "Como instalo Python no Windows?", 0.9) == "resposta"
+    assert "answer" in AIComm(database, semantic_cache=cache).semantic_helpers
+
+
+def test_cancelled_single_flight_follower_stops_waiting():
+    flight = SingleFlight()
+    release = threading.Event()
+    leader = threading.Thread(target=flight.do, args=("chave", lambda: release.wait(5) and "resposta"))
+    leader.start()
+    while not flight.get_stats()["in_flight"]:
+        time.sleep(0.01)
+    cancel_event = threading.Event()
+    threading.Timer(0.1, cancel_event.set).start()
+    
+    started = time.monotonic()
+    try:
+        assert flight.do("chave", lambda: "outra", cancel_event) is None
+        assert time.monotonic() - started < 1
+        stats = flight.get_stats()
+        assert (stats["saved"], stats["cancelled"], stats["in_flight"]) == (0, 1, 1)
+    finally:
+        release.set()
+        leader.join()
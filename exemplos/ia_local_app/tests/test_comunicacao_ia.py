@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+
+import pytest
+
+from comunicacao_ia import AIComm
+from resiliencia import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+class FakeStreamResponse:
+    """Resposta HTTP mínima, com linhas para streaming"""
+    
+    def __init__(self, status_code=200, lines=(), payload=None, headers=None):
+        self.status_code = status_code
+        self.lines = list(lines)
+        self.payload = payload
+        self.headers = headers or {}
+        self.encoding = None
+        self.closed = False
+    
+    @property
+    def text(self):
+        return json.dumps(self.payload)
+    
+    def json(self):
+        return self.payload
+    
+    def iter_lines(self, decode_unicode=False):
+        yield from self.lines
+    
+    def close(self):
+        self.closed = True
+
+
+class FakeTransport:
+    """Transporte que devolve as respostas de uma função e registra as requisições"""
+    
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+    
+    def post(self, url, headers=None, json=None, timeout=None, stream=False):
+        self.requests.append({"url": url, "payload": json, "stream": stream})
+        return self.respond(url, json)
+
+
+def ollama_lines(*chunks):
+    return [json.dumps({"message": {"content": chunk}, "done": False}) for chunk in chunks]
+
+
+@pytest.fixture
+def make_comm(database):
+    def make(respond, **kwargs):
+        return AIComm(database, transport=FakeTransport(respond), **kwargs)
+    return make
+
+
+def test_stream_rejects_unknown_service_on_call(make_comm):
+    comm = make_comm(lambda url, payload: FakeStreamResponse())
+    
+    with pytest.raises(ValueError):
+        comm.stream_external_ia("desconhecido", "Olá")
+    # Serviço conhecido, mas sem chave de API
+    with pytest.raises(ValueError):
+        comm.stream_external_ia("openai", "Olá")
+
+
+def test_stream_sends_request_before_iteration(make_comm):
+    response = FakeStreamResponse(lines=ollama_lines("Era ", "uma ", "vez"))
+    comm = make_comm(lambda url, payload: response)
+    
+    chunks = comm.stream_external_ia("ollama_local", "Conte uma história")
+    
+    assert len(comm.http.requests) == 1
+    assert comm.http.requests[0]["stream"]
+    assert "".join(chunks) == "Era uma vez"
+    assert response.closed
+
+
+def test_stream_refuses_open_circuit_on_call(make_comm):
+    comm = make_comm(lambda url, payload: FakeStreamResponse(), breaker_options={"min_calls": 1})
+    comm.get_circuit_breaker("ollama_local").record_failure()
+    
+    with pytest.raises(CircuitOpenError):
+        comm.stream_external_ia("ollama_local", "Olá")
+    assert comm.http.requests == []
+
+
+@pytest.mark.parametrize("status, headers", [(429, {}), (429, {"Retry-After": "2"}), (503, {"Retry-After": "5"})])
+def test_throttling_does_not_trip_the_breaker(make_comm, status, headers):
+    comm = make_comm(
+        lambda url, payload: FakeStreamResponse(status, payload={"error": "limite"}, headers=headers),
+        breaker_options={"min_calls": 1},
+        retry_policy=RetryPolicy(max_attempts=1)
+    )
+    
+    # Com min_calls=1, uma única falha já abriria o circuito
+    assert comm.query_external_ia("ollama_local", "Olá") is None
+    
+    assert comm.get_circuit_breaker("ollama_local").state == CircuitBreaker.CLOSED
+    assert comm.get_rate_limiter("ollama_local")._paused_until > time.monotonic()
+
+
+def test_server_errors_still_trip_the_breaker(make_comm):
+    comm = make_comm(
+        lambda url, payload: FakeStreamResponse(500, payload={"error": "falha"}),
+        breaker_options={"min_calls": 1},
+        retry_policy=RetryPolicy(max_attempts=1)
+    )
+    
+    assert comm.query_external_ia("ollama_local", "Olá") is None
+    assert comm.get_circuit_breaker("ollama_local").state == CircuitBreaker.OPEN
+
+
+def test_open_circuit_does_not_consume_rate_limit(make_comm):
+    comm = make_comm(
+        lambda url, payload: FakeStreamResponse(500, payload={"error": "falha"}),
+        breaker_options={"min_calls": 1},
+        retry_policy=RetryPolicy(max_attempts=1)
+    )
+    comm.query_external_ia("ollama_local", "Olá")
+    acquired = comm.get_rate_limit_stats()["ollama_local"]["acquired"]
+    
+    for _ in range(3):
+        assert comm.query_external_ia("ollama_local", "Olá") is None
+    with pytest.raises(CircuitOpenError):
+        comm.stream_external_ia("ollama_local", "Olá")
+    
+    assert comm.get_rate_limit_stats()["ollama_local"]["acquired"] == acquired
+    assert len(comm.http.requests) == 1
+
+
+def test_cancelled_wait_refunds_rate_limit(make_comm):
+    comm = make_comm(
+        lambda url, payload: FakeStreamResponse(payload={"message": {"content": "oi"}}),
+        rate_limits={"ollama_local": {"requests_per_minute": 1, "max_wait": None}}
+    )
+    limiter = comm.get_rate_limiter("ollama_local")
+    limiter._requests = 0.0
+    
+    cancel = threading.Event()
+    threading.Timer(0.05, cancel.set).start()
+    assert comm.query_external_ia("ollama_local", "Olá", cancel_event=cancel) is None
+    
+    stats = limiter.get_stats()
+    assert stats["refunded"] == 1
+    assert stats["queue_depth"] == 0
+    assert comm.get_circuit_breaker("ollama_local").allow_request()
+    assert comm.http.requests == []
+
+
+@pytest.mark.parametrize("hedge_allowed", [True, False])
+def test_cancel_event_stops_hedged_query(make_comm, monkeypatch, hedge_allowed):
+    release = threading.Event()
+    
+    def respond(url, payload):
+        release.wait(5)
+        return FakeStreamResponse(payload={"message": {"content": "tarde demais"}})
+    
+    comm = make_comm(respond)
+    monkeypatch.setattr(comm.router, "hedge_delay", lambda service: 0.05)
+    monkeypatch.setattr(comm.hedge_budget, "try_acquire", lambda: hedge_allowed)
+    
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    started = time.monotonic()
+    try:
+        assert comm._query_hedged("Olá", "ollama_local", "ollama_local", cancel_event=cancel) is None
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
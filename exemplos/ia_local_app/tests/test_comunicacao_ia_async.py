@@ -0,0 +1,36 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from cache_respostas import ResponseCache
+from comunicacao_ia import AIComm
+from comunicacao_ia_async import AsyncAIComm
+
+
+def test_persistent_cache_lookups_run_off_the_event_loop(database, monkeypatch):
+    ResponseCache(database).set("persistida", "resposta do banco", 60)
+    comm = AsyncAIComm(database, ai_comm=AIComm(database))
+    comm.ai_comm.cache.set("memoria", "resposta em memória", 60)
+    
+    lookups = []
+    get_cached_response = database.get_cached_response
+    
+    def record(key, now=None):
+        lookups.append((key, threading.current_thread()))
+        return get_cached_response(key, now)
+    
+    monkeypatch.setattr(database, "get_cached_response", record)
+    
+    async def lookup():
+        return await comm._cache_get_many(["memoria", "persistida", "ausente"]), threading.current_thread()
+    
+    responses, loop_thread = asyncio.run(lookup())
+    
+    assert responses == ["resposta em memória", "resposta do banco", None]
+    # A chave em memória nem chega ao banco; as demais são lidas fora do loop
+    assert [key for key, thread in lookups] == ["persistida", "ausente"]
+    assert all(thread is not loop_thread for key, thread in lookups)
+    assert comm.ai_comm.cache.get_stats()["misses"] == 1
@@ -0,0 +1,109 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from indice_vetorial import KnowledgeIndex
+
+
+def add_items(database, items):
+    for topic, content, confidence in items:
+        database.add_knowledge(topic, content, "teste", confidence)
+
+
+def test_search_widens_single_segment_past_filtered_candidates(database, tmp_path):
+    # Os itens mais parecidos têm confiança baixa e são descartados pela busca
+    add_items(database, [("python", f"python {i}", 0.1) for i in range(20)])
+    add_items(database, [("guia", f"python instalação completa passo {i}", 0.9) for i in range(5)])
+    index = KnowledgeIndex(database, str(tmp_path / "index"))
+    
+    results = index.search("python", top_k=3, min_confidence=0.5, min_score=0.0)
+    
+    assert len(index.segments) == 1
+    assert len(results) == 3
+    assert all(item[2].startswith("python instalação") for item, score in results)
+
+
+def test_search_stops_when_candidates_are_exhausted(database, tmp_path):
+    add_items(database, [("python", f"python {i}", 0.1) for i in range(10)])
+    index = KnowledgeIndex(database, str(tmp_path / "index"))
+    
+    assert index.search("python", top_k=3, min_confidence=0.5) == []
+
+
+def test_removed_ids_are_evicted_and_purged(database, tmp_path):
+    add_items(database, [("linguagem", f"python versão v{i}", 1.0) for i in range(10)])
+    index = KnowledgeIndex(database, str(tmp_path / "index"), purge_ratio=0.5)
+    index.refresh()
+    doc_freq = index.doc_freq.copy()
+    
+    # Marcados como removidos, mas ainda nos segmentos
+    assert index.remove([1, 2, 3, 999]) == 3
+    assert index.get_stats()["deleted"] == 3
+    _, ids, _ = index._score("python", 100)
+    assert sorted(ids.tolist()) == list(range(4, 11))
+    
+    # As marcas sobrevivem à reabertura do índice
+    index = KnowledgeIndex(database, str(tmp_path / "index"), purge_ratio=0.5)
+    assert index.get_stats()["deleted"] == 3
+    
+    # Passando de purge_ratio, os segmentos são regravados sem os itens
+    index.remove([4, 5])
+    stats = index.get_stats()
+    assert stats["deleted"] == 0
+    assert stats["documents"] == 5
+    assert index.doc_freq[index.doc_freq > 0].max() == 5
+    assert (doc_freq - index.doc_freq).sum() > 0
+    _, ids, _ = index._score("python versão", 100)
+    assert sorted(ids.tolist()) == list(range(6, 11))
+    scores, ids, _ = index._score("versão v7", 100)
+    assert ids[np.argmax(scores)] == 8
+
+
+def test_compaction_notifies_index(database, tmp_path):
+    index = KnowledgeIndex(database, str(tmp_path / "index"), purge_ratio=1.0)
+    removed = []
+    database.add_delete_listener(lambda table, row_ids: removed.extend(row_ids))
+    add_items(database, [("tópico", "conteúdo", 1.0)])
+    index.refresh()
+    
+    # Duplicata gravada como em um banco anterior ao hash de conteúdo
+    database.cursor.execute(
+        "INSERT INTO knowledge (topic, content, source, timestamp, confidence) VALUES (?, ?, ?, ?, ?)",
+        ("tópico", "conteúdo", "teste", "2020-01-01", 0.5)
+    )
+    database.conn.commit()
+    duplicate = database.cursor.lastrowid
+    index.refresh()
+    database.compact_knowledge()
+    
+    assert removed == [duplicate]
+    assert index.deleted.tolist() == [duplicate]
+
+
+def test_deleted_ids_are_not_reused_for_new_items(database, tmp_path):
+    add_items(database, [("linguagem", f"python versão v{i}", 1.0) for i in range(5)])
+    index = KnowledgeIndex(database, str(tmp_path / "index"), purge_ratio=1.0)
+    index.refresh()
+    database.cursor.execute("DELETE FROM knowledge WHERE id IN (4, 5)")
+    database.conn.commit()
+    index.remove([4, 5])
+    
+    add_items(database, [("linguagem", "rust novidades", 1.0)])
+    
+    ((item, score),) = index.search("rust", top_k=3)
+    assert item[0] == 6
+
+
+def test_reopened_index_reserves_ids_above_last_indexed(database, tmp_path):
+    add_items(database, [("linguagem", f"python versão v{i}", 1.0) for i in range(5)])
+    KnowledgeIndex(database, str(tmp_path / "index")).refresh()
+    # Como em um banco em que os últimos IDs foram apagados antes do AUTOINCREMENT
+    database.cursor.execute("DELETE FROM knowledge WHERE id IN (4, 5)")
+    database.cursor.execute("UPDATE sqlite_sequence SET seq = 3 WHERE name = 'knowledge'")
+    database.conn.commit()
+    
+    index = KnowledgeIndex(database, str(tmp_path / "index"))
+    add_items(database, [("linguagem", "rust novidades", 1.0)])
+    
+    ((item, score),) = index.search("rust", top_k=3)
+    assert item[0] == 6
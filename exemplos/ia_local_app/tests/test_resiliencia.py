@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from resiliencia import APIError, CircuitBreaker, RateLimiter, RetryPolicy, parse_retry_after
+
+
+def test_breaker_opens_on_failure_rate_and_recovers(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("resiliencia.time.monotonic", lambda: clock[0])
+    breaker = CircuitBreaker("svc", failure_rate_threshold=0.5, min_calls=4, open_timeout=30.0)
+    
+    for failed in (False, True, False):
+        breaker.record_failure() if failed else breaker.record_success(0.1)
+    assert breaker.state == CircuitBreaker.CLOSED
+    
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+    
+    # Depois do open_timeout, uma única chamada de teste
+    clock[0] += 30.0
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()
+    
+    breaker.record_success(0.1)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.get_state()["calls"] == 0
+
+
+def test_breaker_release_frees_half_open_probe(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("resiliencia.time.monotonic", lambda: clock[0])
+    breaker = CircuitBreaker("svc", min_calls=1, open_timeout=10.0)
+    breaker.record_failure()
+    clock[0] += 10.0
+    
+    assert breaker.allow_request()
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_slow_calls_count_as_failures():
+    breaker = CircuitBreaker("svc", min_calls=2, slow_call_threshold=1.0)
+    breaker.record_success(2.0)
+    breaker.record_success(3.0)
+    
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.get_state()["p95_latency"] == 2.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("resiliencia.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_rate_limiter_queues_in_arrival_order(clock):
+    limiter = RateLimiter("svc", requests_per_minute=60, max_wait=None)
+    limiter._requests = 1.0
+    
+    assert limiter.reserve() == 0.0
+    assert limiter.reserve() == pytest.approx(1.0)
+    assert limiter.reserve() == pytest.approx(2.0)
+    
+    clock[0] += 2.0
+    assert limiter.reserve() == pytest.approx(1.0)
+
+
+def test_rate_limiter_rejects_beyond_max_wait_and_counts_tokens(clock):
+    limiter = RateLimiter("svc", tokens_per_minute=600, max_wait=5.0)
+    
+    assert limiter.reserve(600) == 0.0
+    # 50 tokens a 10 tokens/s
+    assert limiter.reserve(50) == pytest.approx(5.0)
+    assert limiter.reserve(50) is None
+    assert limiter.get_stats()["rejected"] == 1
+
+
+def test_rate_limiter_refund_returns_the_reservation(clock):
+    limiter = RateLimiter("svc", requests_per_minute=60, tokens_per_minute=600, max_wait=None)
+    limiter._requests, limiter._tokens = 1.0, 100.0
+    
+    limiter.reserve(100)
+    limiter.refund(100)
+    
+    assert limiter.reserve(100) == 0.0
+    assert limiter.get_stats()["refunded"] == 1
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("120", 120.0),
+    (" 5 ", 5.0),
+    (None, None),
+    ("", None),
+    ("-1", None),
+    ("amanhã", None),
+    (format_datetime(datetime(2000, 1, 1, tzinfo=timezone.utc), usegmt=True), 0.0),
+])
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    when = datetime.now(timezone.utc) + timedelta(seconds=90)
+    assert 85 <= parse_retry_after(format_datetime(when, usegmt=True)) <= 90
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (APIError("svc", 503, "indisponível"), True),
+    (APIError("svc", 429, "limite"), True),
+    (APIError("svc", 400, "requisição inválida"), False),
+    (APIError("svc", None, "erro no corpo"), False),
+    (ConnectionError("rede"), True),
+    (TimeoutError(), True),
+    (ValueError("JSON inválido"), False),
+])
+def test_retry_policy_classifies_errors(error, retryable):
+    assert RetryPolicy().is_retryable(error) is retryable
+
+
+def test_retry_policy_delay_grows_and_stops(monkeypatch):
+    monkeypatch.setattr("resiliencia.random.uniform", lambda low, high: high)
+    policy = RetryPolicy(max_attempts=4, base_delay=0.5, max_delay=1.5, budget=None)
+    error = APIError("svc", 503, "indisponível")
+    started = 0.0
+    
+    assert [policy.next_delay(attempt, error, started) for attempt in range(4)] == [0.5, 1.0, 1.5, None]
+    assert policy.next_delay(0, APIError("svc", 404, "não encontrado"), started) is None
+
+
+def test_retry_policy_honors_retry_after_and_budget(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("resiliencia.time.monotonic", lambda: clock[0])
+    policy = RetryPolicy(max_attempts=5, budget=10.0)
+    
+    assert policy.next_delay(0, APIError("svc", 429, "limite", retry_after=7.0), 100.0) == 7.0
+    # A espera passaria do orçamento da consulta
+    assert policy.next_delay(0, APIError("svc", 429, "limite", retry_after=11.0), 100.0) is None
+    clock[0] = 108.0
+    assert policy.next_delay(1, APIError("svc", 429, "limite", retry_after=3.0), 100.0) is None
@@ -0,0 +1,54 @@
+import pytest
+import requests
+
+from transporte_http import HTTPTransport
+
+httpx = pytest.importorskip("httpx")
+
+
+def http2_transport(handler):
+    transport = HTTPTransport()
+    transport.http2_client = httpx.Client(transport=httpx.MockTransport(handler))
+    return transport
+
+
+def raising(error_type):
+    def handler(request):
+        raise error_type("falha simulada", request=request)
+    return handler
+
+
+@pytest.mark.parametrize("httpx_error, requests_error", [
+    ("ConnectTimeout", requests.ConnectTimeout),
+    ("ReadTimeout", requests.ReadTimeout),
+    ("PoolTimeout", requests.Timeout),
+    ("ConnectError", requests.ConnectionError),
+    ("RemoteProtocolError", requests.ConnectionError),
+    ("TooManyRedirects", requests.TooManyRedirects),
+    ("UnsupportedProtocol", requests.exceptions.InvalidSchema)
+])
+def test_http2_errors_keep_their_requests_category(httpx_error, requests_error):
+    transport = http2_transport(raising(getattr(httpx, httpx_error)))
+    
+    with pytest.raises(requests_error) as info:
+        transport.get("https://example.com/", timeout=(1, 2))
+    
+    assert isinstance(info.value.__cause__, getattr(httpx, httpx_error))
+
+
+def test_http2_connection_errors_are_not_timeouts():
+    transport = http2_transport(raising(httpx.ConnectError))
+    
+    with pytest.raises(requests.RequestException) as info:
+        transport.get("https://example.com/")
+    
+    assert not isinstance(info.value, requests.Timeout)
+
+
+def test_http2_error_statuses_are_returned_as_responses():
+    transport = http2_transport(lambda request: httpx.Response(503, json={"erro": "ocupado"}))
+    
+    response = transport.get("https://example.com/")
+    
+    assert response.status_code == 503
+    assert response.json() == {"erro": "ocupado"}
@@ -0,0 +1,202 @@
+"""
+Módulo de Transporte HTTP para IA NOVA
+Este módulo implementa uma camada de transporte HTTP compartilhada, com pools
+de conexões por host e keep-alive, usada pelos módulos de comunicação com
+outras IAs e de atualização automática.
+"""
+
+import threading
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # HTTP/2 é opcional
+    httpx = None
+
+logger = logging.getLogger("NOVA_HTTP")
+
+class HTTPTransport:
+    """Transporte HTTP com pools de conexões reutilizáveis"""
+    
+    def __init__(self, pool_connections=20, pool_maxsize=20, timeout=30, http2=False):
+        """
+        Inicializa o transporte
+        
+        Args:
+            pool_connections: Número de hosts com pool de conexões mantido
+            pool_maxsize: Número máximo de conexões mantidas por host
+            timeout: Timeout padrão em segundos (número ou tupla conexão/leitura)
+            http2: Se True, usa HTTP/2 (via httpx) nas requisições sem streaming
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        
+        # requests.Session mantém um pool de conexões keep-alive por host
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        self.http2_client = None
+        if http2:
+            self._init_http2()
+    
+    def _init_http2(self):
+        """Cria o cliente HTTP/2, se as dependências estiverem instaladas"""
+        if httpx is None:
+            logger.warning("httpx não instalado, HTTP/2 desativado")
+            return
+        
+        try:
+            self.http2_client = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=self.pool_connections * self.pool_maxsize,
+                    max_keepalive_connections=self.pool_maxsize
+                )
+            )
+        except ImportError as e:
+            # httpx precisa do pacote h2 para HTTP/2
+            logger.warning(f"HTTP/2 indisponível: {e}")
+    
+    def request(self, method, url, **kwargs):
+        """
+        Envia uma requisição reutilizando conexões abertas
+        
+        Aceita os mesmos argumentos de requests.request. Erros de rede são
+        sempre levantados como requests.RequestException, inclusive no HTTP/2
+        (um timeout do httpx vira requests.Timeout, e assim por diante).
+        
+        Args:
+            method: Método HTTP
+            url: URL da requisição
+        
+        Returns:
+            Resposta da requisição
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        
+        if self.http2_client is not None and not kwargs.get("stream"):
+            return self._request_http2(method, url, **kwargs)
+        
+        return self.session.request(method, url, **kwargs)
+    
+    def _request_http2(self, method, url, **kwargs):
+        """
+        Envia uma requisição pelo cliente HTTP/2
+        
+        Args:
+            method: Método HTTP
+            url: URL da requisição
+        
+        Returns:
+            Resposta do httpx, que expõe status_code, headers, text e json()
+        """
+        timeout = kwargs.pop("timeout")
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            timeout = httpx.Timeout(read, connect=connect)
+        kwargs.pop("stream", None)
+        follow_redirects = kwargs.pop("allow_redirects", method.upper() != "HEAD")
+        
+        try:
+            return self.http2_client.request(
+                method,
+                url,
+                timeout=timeout,
+                follow_redirects=follow_redirects,
+                **kwargs
+            )
+        except httpx.HTTPError as e:
+            raise self._requests_error(e) from e
+    
+    @staticmethod
+    def _requests_error(error):
+        """
+        Converte um erro do httpx na exceção equivalente do requests
+        
+        Mantém as categorias (timeout, conexão, redirecionamentos...) para que
+        quem trata requests.Timeout ou classifica erros funcione igual com HTTP/2.
+        
+        Args:
+            error: Exceção do httpx
+        
+        Returns:
+            Instância de requests.RequestException
+        """
+        # Das mais específicas para as mais gerais
+        equivalents = [
+            (httpx.ConnectTimeout, requests.ConnectTimeout),
+            (httpx.ReadTimeout, requests.ReadTimeout),
+            (httpx.TimeoutException, requests.Timeout),
+            (httpx.ProxyError, requests.exceptions.ProxyError),
+            (httpx.UnsupportedProtocol, requests.exceptions.InvalidSchema),
+            (httpx.TooManyRedirects, requests.TooManyRedirects),
+            (httpx.DecodingError, requests.exceptions.ContentDecodingError),
+            (httpx.HTTPStatusError, requests.HTTPError),
+            (httpx.TransportError, requests.ConnectionError)
+        ]
+        for httpx_error, requests_error in equivalents:
+            if isinstance(error, httpx_error):
+                return requests_error(str(error))
+        return requests.RequestException(str(error))
+    
+    def get(self, url, **kwargs):
+        """Envia uma requisição GET"""
+        return self.request("GET", url, **kwargs)
+    
+    def post(self, url, **kwargs):
+        """Envia uma requisição POST"""
+        return self.request("POST", url, **kwargs)
+    
+    def head(self, url, **kwargs):
+        """Envia uma requisição HEAD"""
+        return self.request("HEAD", url, **kwargs)
+    
+    def close(self):
+        """Fecha todas as conexões abertas"""
+        self.session.close()
+        if self.http2_client is not None:
+            self.http2_client.close()
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """
+    Retorna o transporte compartilhado, criando-o na primeira chamada
+    
+    Returns:
+        Instância de HTTPTransport
+    """
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = HTTPTransport()
+        return _default_transport
+
+
+def configure_transport(**options):
+    """
+    Substitui o transporte compartilhado por um com outras opções
+    
+    Deve ser chamado antes de criar AIComm, Updater e DeveloperCommunication.
+    
+    Args:
+        options: Argumentos de HTTPTransport
+    
+    Returns:
+        Novo transporte compartilhado
+    """
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is not None:
+            _default_transport.close()
+        _default_transport = HTTPTransport(**options)
+        return _default_transport